@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+import warnings
+
+from synthetic import generate_dataset
+
+BENCHMARK_STAGES = [
+    "load_all_participants", "checkpoint_save", "checkpoint_load", "merge_data",
+    "compute_sample_rate_for_sensor", "visualise_ppg_ch0_minutes_stacked",
+    "plot_data_coverage_per_participant", "plot_individual_participant_heatmap",
+    "plot_individual_participant_heatmap_raster",
+]
+
+# Participant multipliers; 100x is the size of a full study
+BENCHMARK_SCALES = [1, 10, 100]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _timed(func, repeat: int = 1):
+    """Best wall time of repeat runs and the result of the last one."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _render(plot_func, all_data):
+    """Run a visualiser with the Agg backend and close whatever it opened."""
+    import matplotlib.pyplot as plt
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*non-interactive.*")
+        plot_func(all_data)
+    plt.close("all")
+
+
+def benchmark_scale(data_dir: str, work_dir: str, stages: list = None, repeat: int = 1, scale: int = 1) -> list:
+    """
+    Time every stage on the dataset in data_dir.
+
+    Args:
+        data_dir (str): Generated dataset
+        work_dir (str): Directory for the checkpoint written by the checkpoint stages
+        stages (list): Stages to time, default BENCHMARK_STAGES
+        repeat (int): Runs per stage, the best time is reported
+        scale (int): Scale factor the dataset was generated at, recorded with every timing
+
+    Returns:
+        list of {"scale", "stage", "seconds", "rows", "bytes", "rows_per_second"} dicts
+        in BENCHMARK_STAGES order
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+    from checkpoint_manager import CheckpointManager
+    from loader import load_all_participants, memory_footprint
+    from preprocessor import merge_data, compute_sample_rate_for_sensor
+    import visualiser
+
+    stages = stages or BENCHMARK_STAGES
+    results = []
+
+    seconds, all_data = _timed(lambda: load_all_participants(data_dir=data_dir), repeat)
+    footprint = memory_footprint(all_data)
+    rows, n_bytes = int(footprint["rows"].sum()), int(footprint["bytes"].sum())
+    if "load_all_participants" in stages:
+        results.append({"stage": "load_all_participants", "seconds": seconds})
+
+    checkpoint = CheckpointManager(os.path.join(work_dir, "benchmark_checkpoint.pkl"))
+    timed_stages = {
+        "checkpoint_save": lambda: checkpoint.save(all_data),
+        "checkpoint_load": checkpoint.load,
+        "merge_data": lambda: {p: {cat: merge_data(all_data[p], cat) for cat in all_data[p]} for p in all_data},
+        "compute_sample_rate_for_sensor": lambda: compute_sample_rate_for_sensor(all_data),
+    }
+    for name in BENCHMARK_STAGES[5:]:
+        timed_stages[name] = lambda plot_func=getattr(visualiser, name): _render(plot_func, all_data)
+
+    for name, func in timed_stages.items():
+        if name in stages:
+            seconds, _ = _timed(func, repeat)
+            results.append({"stage": name, "seconds": seconds})
+
+    for result in results:
+        result.update({"rows": rows, "bytes": n_bytes, "rows_per_second": rows / result["seconds"] if result["seconds"] else None})
+    return [{"scale": scale, **result} for result in results]
+
+
+def run_benchmarks(output: str,
+                   scales: list = None,
+                   work_dir: str = "data/benchmark",
+                   participants: int = 1,
+                   hours_per_condition: float = 0.25,
+                   stages: list = None,
+                   repeat: int = 1,
+                   seed: int = 0) -> dict:
+    """
+    Generate a synthetic dataset per scale factor (scale x participants) and time every
+    stage on it. Datasets are reused between runs if already generated with the same
+    settings, so timings of different commits are measured on identical files.
+
+    The report lists the scales run in settings["scales"], the dataset measured at each
+    scale in "datasets" and the scale of every timing in its "scale" field.
+
+    Args:
+        output (str): JSON file for the report
+        scales (list): Scale factors, multiplying the number of participants, default
+                       BENCHMARK_SCALES
+        work_dir (str): Directory for the generated data and checkpoints
+        participants (int): Participants at scale 1
+        hours_per_condition (float): Recorded hours per participant and condition
+        stages (list): Stages to time, default BENCHMARK_STAGES
+        repeat (int): Runs per stage, the best time is reported
+        seed (int): Random seed of the generator
+
+    Returns:
+        dict report, as written to output
+    """
+    scales = list(scales or BENCHMARK_SCALES)
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"participants": participants, "hours_per_condition": hours_per_condition,
+                     "repeat": repeat, "seed": seed, "scales": scales},
+        "datasets": [],
+        "results": [],
+    }
+
+    for scale in scales:
+        settings = {"participants": participants * scale, "hours_per_condition": hours_per_condition, "seed": seed}
+        data_dir = os.path.join(work_dir, f"scale_{scale}", "data")
+        settings_file = os.path.join(work_dir, f"scale_{scale}", "settings.json")
+        previous = None
+        if os.path.exists(settings_file):
+            with open(settings_file) as f:
+                previous = json.load(f)
+        if previous != settings:
+            print(f"Generating synthetic data for scale {scale}x")
+            if os.path.exists(data_dir):
+                shutil.rmtree(data_dir)
+            generate_dataset(data_dir, settings["participants"], hours_per_condition, seed=seed)
+            with open(settings_file, "w") as f:
+                json.dump(settings, f)
+
+        results = benchmark_scale(data_dir, os.path.join(work_dir, f"scale_{scale}"), stages, repeat, scale)
+        report["datasets"].append({"scale": scale, "participants": settings["participants"],
+                                   "hours_per_condition": hours_per_condition,
+                                   "rows": results[0]["rows"] if results else None,
+                                   "bytes": results[0]["bytes"] if results else None})
+        for result in results:
+            report["results"].append({"participants": settings["participants"], **result})
+            print(f"{scale:>4}x  {result['stage']:<44} {result['seconds']:8.2f} s")
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report written: {output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time loading, checkpointing, merging, rates and plots at several scales")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--scales", "--scale", nargs="+", type=int, default=BENCHMARK_SCALES,
+                        help="Participant multipliers to run, each timing records its scale")
+    parser.add_argument("--work-dir", default="data/benchmark")
+    parser.add_argument("--participants", type=int, default=1, help="Participants at scale 1")
+    parser.add_argument("--hours", type=float, default=0.25, help="Hours per participant and condition")
+    parser.add_argument("--stages", nargs="+", choices=BENCHMARK_STAGES)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    run_benchmarks(args.output, args.scales, args.work_dir, args.participants, args.hours, args.stages, args.repeat)
@@ -1,5 +1,20 @@
+import json
+import logging
 import pickle
 import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from config import CONDITIONS, SENSOR_TYPES, LOAD_WORKERS, LOAD_EXECUTOR, PARSE_ENGINE
+from instrumentation import stage
+from loader import (
+    SEGMENT_COLUMNS, get_source_files, set_source_files, get_segments, set_segments, concat_source_parts,
+    load_all_participants, parse_files, scan_source_files,
+)
+
+logger = logging.getLogger(__name__)
 
 class CheckpointManager:
     """
@@ -29,9 +44,11 @@ class CheckpointManager:
             os.makedirs(directory, exist_ok=True)
 
         # Save data
-        with open(self.filename, "wb") as f:
-            pickle.dump(data, f)
-        print(f"Checkpoint saved: {self.filename}")
+        with stage("checkpoint_save") as timer:
+            with open(self.filename, "wb") as f:
+                pickle.dump(data, f)
+            timer.add(n_bytes=os.path.getsize(self.filename))
+        logger.info("Checkpoint saved: %s", self.filename)
 
     def load(self):
         """
@@ -42,9 +59,10 @@ class CheckpointManager:
         """
         if not os.path.exists(self.filename):
             raise FileNotFoundError(f"Checkpoint file {self.filename} not found.")
-        with open(self.filename,"rb") as f:
-            data = pickle.load(f)
-        print(f"Checkpoint loaded: {self.filename}")
+        with stage("checkpoint_load", n_bytes=os.path.getsize(self.filename)):
+            with open(self.filename,"rb") as f:
+                data = pickle.load(f)
+        logger.info("Checkpoint loaded: %s", self.filename)
 
         return data
 
@@ -57,3 +75,417 @@ class CheckpointManager:
         """
         return os.path.exists(self.filename)
 
+
+class PartitionedCheckpointManager:
+    """
+    Columnar checkpoint storing one Parquet partition per participant/condition/sensor.
+
+    Layout:
+        directory/_index.json
+        directory/<participant>/<condition>/<sensor>.parquet
+
+    The index records rows, columns and source file ranges of every partition, so
+    selective loads only open the partitions (and columns) that were asked for.
+    """
+
+    INDEX_FILE = "_index.json"
+
+    def __init__(self, directory: str):
+        """
+        Initialise with given checkpoint directory
+
+        Args:
+            directory (str): Directory to use for saving/loading partitions
+        """
+
+        self.directory = directory
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _partition_path(self, participant: str, condition: str, sensor: str):
+        return os.path.join(self.directory, participant, condition, f"{sensor}.parquet")
+
+    def save(self, data: dict, manifest: dict = None):
+        """
+        Save nested all_data[participant][condition][sensor] frames as Parquet partitions
+
+        Args:
+            data (dict): Nested dict of pd.DataFrame
+            manifest (dict): Raw source file manifest from loader.scan_source_files,
+                             used by refresh() to detect changed files
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        index = {"version": 1, "partitions": {}, "manifest": _strip_manifest(manifest or {})}
+        with stage("checkpoint_save") as timer:
+            for participant, conditions in data.items():
+                index["partitions"][participant] = {}
+                for condition, sensors in conditions.items():
+                    index["partitions"][participant][condition] = {}
+                    for sensor, df in sensors.items():
+                        index["partitions"][participant][condition][sensor] = self._save_partition(
+                            participant, condition, sensor, df
+                        )
+                        timer.add_data(df)
+
+            self._write_index(index)
+        logger.info("Checkpoint saved: %s", self.directory)
+
+    def merge(self, data: dict, manifest: dict = None):
+        """
+        Save a subset of all_data, replacing only the partitions it contains. Other
+        partitions and their manifest entries are kept, so a later refresh still only
+        re-parses what changed.
+
+        Args:
+            data (dict): Nested dict of pd.DataFrame, e.g. a few participants
+            manifest (dict): Current raw source file manifest (loader.scan_source_files),
+                             only the entries of the partitions in data are taken from it
+        """
+        rebuilt = {(participant, condition, sensor)
+                   for participant, conditions in data.items()
+                   for condition, sensors in conditions.items()
+                   for sensor in sensors}
+        manifest = {key: info for key, info in _strip_manifest(manifest or {}).items()
+                    if (info["participant"], info["condition"], info["sensor"]) in rebuilt}
+        if not self.exists():
+            self.save(data, manifest)
+            return
+
+        index = self.read_index()
+        with stage("checkpoint_save") as timer:
+            for participant, condition, sensor in sorted(rebuilt):
+                df = data[participant][condition][sensor]
+                index["partitions"].setdefault(participant, {}).setdefault(condition, {})[sensor] = \
+                    self._save_partition(participant, condition, sensor, df)
+                timer.add_data(df)
+
+            kept = {key: info for key, info in index.get("manifest", {}).items()
+                    if (info["participant"], info["condition"], info["sensor"]) not in rebuilt}
+            index["manifest"] = {**kept, **manifest}
+            self._write_index(index)
+        logger.info("Checkpoint updated: %s (%d partitions)", self.directory, len(rebuilt))
+
+    def _save_partition(self, participant: str, condition: str, sensor: str, df: pd.DataFrame) -> dict:
+        """Write one partition and return its index entry."""
+        path = self._partition_path(participant, condition, sensor)
+        entry = {
+            "file": None,
+            "rows": int(len(df)),
+            "columns": [str(col) for col in df.columns],
+            "source_files": get_source_files(df),
+            "segments": get_segments(df),
+        }
+        if df.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            return entry
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Source files and segments live in the index entry, not in the parquet metadata
+        columns_only = df.copy(deep=False)
+        columns_only.attrs = {}
+        columns_only.to_parquet(path, index=False)
+        entry["file"] = os.path.relpath(path, self.directory)
+        return entry
+
+    def _write_index(self, index: dict):
+        # Written last and atomically so a partial save is never seen as a valid checkpoint
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def read_index(self) -> dict:
+        """
+        Read the partition index
+
+        Returns:
+            (dict) {"version": int, "partitions": {participant: {condition: {sensor: entry}}}}
+        """
+        if not self.exists():
+            raise FileNotFoundError(f"Checkpoint index {self.index_path} not found.")
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def load(self, participants=None, conditions=None, sensors=None, columns=None):
+        """
+        Load the checkpoint, optionally only a subset of partitions and columns
+
+        Args:
+            participants (list): Participants to load, None for all
+            conditions (list): Conditions to load, None for all
+            sensors (list): Sensor types to load, None for all
+            columns (list): Columns to read from each partition, None for all.
+                            Columns missing from a partition are ignored.
+
+        Returns:
+            dict( participant{ condition{ sensor{ pd.DataFrame}}})
+        """
+        with stage("checkpoint_load") as timer:
+            data = self._select(participants, conditions, sensors,
+                                lambda entry: self._load_partition(entry, columns))
+            timer.add_data(data)
+
+        logger.info("Checkpoint loaded: %s", self.directory)
+        return data
+
+    def _select(self, participants, conditions, sensors, read_partition) -> dict:
+        """Apply read_partition to every index entry matching the selection, keeping the nested layout."""
+        index = self.read_index()
+
+        data = {}
+        for participant, participant_parts in index["partitions"].items():
+            if participants is not None and participant not in participants:
+                continue
+            data[participant] = {}
+            for condition, condition_parts in participant_parts.items():
+                if conditions is not None and condition not in conditions:
+                    continue
+                data[participant][condition] = {}
+                for sensor, entry in condition_parts.items():
+                    if sensors is not None and sensor not in sensors:
+                        continue
+                    data[participant][condition][sensor] = read_partition(entry)
+
+        return data
+
+    def read_segments(self, participants=None, conditions=None, sensors=None) -> pd.DataFrame:
+        """
+        Read the segment index of the selected partitions from the checkpoint index only,
+        without opening any partition.
+
+        Returns:
+            pd.DataFrame with participant, condition, sensor and loader.SEGMENT_COLUMNS columns
+        """
+        selected = self._select(participants, conditions, sensors, lambda entry: entry.get("segments", []))
+
+        rows = []
+        for participant, conditions_ in selected.items():
+            for condition, sensors_ in conditions_.items():
+                for sensor, segments in sensors_.items():
+                    rows.extend({"participant": participant, "condition": condition, "sensor": sensor, **seg}
+                                for seg in segments)
+
+        return pd.DataFrame(rows, columns=["participant", "condition", "sensor"] + SEGMENT_COLUMNS)
+
+    def _load_partition(self, entry: dict, columns=None) -> pd.DataFrame:
+        """Read one partition described by an index entry."""
+        if entry["file"] is None:
+            return pd.DataFrame()
+
+        read_cols = None
+        if columns is not None:
+            read_cols = [col for col in columns if col in entry["columns"]]
+
+        df = pd.read_parquet(os.path.join(self.directory, entry["file"]), columns=read_cols)
+        set_source_files(df, entry["source_files"])
+        set_segments(df, entry.get("segments", []))
+        return df
+
+    def refresh(self, data_dir: str = None, use_hash: bool = False,
+                workers: int = LOAD_WORKERS, executor: str = LOAD_EXECUTOR,
+                engine: str = PARSE_ENGINE) -> dict:
+        """
+        Bring the checkpoint up to date with the raw data directory.
+
+        Source files are compared against the stored manifest by size and mtime (and
+        content hash if use_hash). Only partitions touched by a new, changed or
+        deleted file are rebuilt: unchanged files are sliced out of the cached
+        partition, new and changed files are parsed, and rows of deleted files are
+        dropped. Without an existing checkpoint this is a full load and save.
+
+        Args:
+            data_dir (str): Root data directory, defaults to config.DATA_DIR
+            use_hash (bool): Also compare content hashes
+            workers (int): Number of parse workers
+            executor (str): "process" or "thread" pool
+            engine (str): Parse engine, see loader.PARSE_ENGINES
+
+        Returns:
+            (dict) {"added": [...], "changed": [...], "removed": [...]} manifest keys
+        """
+        current = scan_source_files(data_dir, use_hash=use_hash)
+
+        if not self.exists():
+            data = load_all_participants(workers=workers, executor=executor, data_dir=data_dir, engine=engine)
+            self.save(data, manifest=current)
+            return {"added": sorted(current), "changed": [], "removed": []}
+
+        index = self.read_index()
+        previous = index.get("manifest", {})
+
+        added = sorted(key for key in current if key not in previous)
+        removed = sorted(key for key in previous if key not in current)
+        changed = sorted(
+            key for key in current
+            if key in previous and _file_changed(previous[key], current[key], use_hash)
+        )
+        changes = {"added": added, "changed": changed, "removed": removed}
+        if not (added or changed or removed):
+            logger.info("Checkpoint up to date: %s", self.directory)
+            return changes
+
+        stale = set(added) | set(changed)
+        affected = set()
+        for key in added + changed:
+            affected.add((current[key]["participant"], current[key]["condition"], current[key]["sensor"]))
+        for key in removed:
+            affected.add((previous[key]["participant"], previous[key]["condition"], previous[key]["sensor"]))
+
+        # Parse every stale file in one pool, in manifest order
+        stale_keys = [key for key in current if key in stale]
+        parsed = dict(zip(stale_keys, parse_files([current[key]["path"] for key in stale_keys], workers, executor, engine)))
+
+        partitions = index["partitions"]
+        for participant, condition, sensor in sorted(affected):
+            entry = partitions.get(participant, {}).get(condition, {}).get(sensor)
+            cached = self._load_partition(entry) if entry else pd.DataFrame()
+            cached_ranges = {src["file"]: src for src in (entry or {}).get("source_files", [])}
+
+            parts = []
+            for key, info in current.items():
+                if (info["participant"], info["condition"], info["sensor"]) != (participant, condition, sensor):
+                    continue
+                if key in stale:
+                    df = parsed[key]
+                elif info["file"] in cached_ranges:
+                    src = cached_ranges[info["file"]]
+                    df = cached.iloc[src["start"]:src["stop"]]
+                else:
+                    df = None  # unchanged file that failed to parse previously
+                if df is not None:
+                    parts.append((info["file"], df))
+
+            if participant not in partitions:
+                partitions[participant] = {
+                    category: {key: self._save_partition(participant, category, key, pd.DataFrame())
+                               for key in SENSOR_TYPES.keys()}
+                    for category in CONDITIONS
+                }
+            partitions[participant].setdefault(condition, {})[sensor] = self._save_partition(
+                participant, condition, sensor, concat_source_parts(parts)
+            )
+
+        # Drop participants that no longer have any source files
+        remaining = {info["participant"] for info in current.values()}
+        for participant in list(partitions):
+            if participant not in remaining:
+                del partitions[participant]
+
+        index["manifest"] = _strip_manifest(current)
+        self._write_index(index)
+        logger.info("Checkpoint refreshed: %s (%d added, %d changed, %d removed)",
+                    self.directory, len(added), len(changed), len(removed))
+        return changes
+
+    def exists(self):
+        """
+        Check if the checkpoint index exists
+
+        Returns:
+            (bool) True if checkpoint exists, else False.
+        """
+        return os.path.exists(self.index_path)
+
+
+class MemmapCheckpointManager(PartitionedCheckpointManager):
+    """
+    Checkpoint storing every column of a partition as a contiguous .npy array.
+
+    Layout:
+        directory/_index.json
+        directory/<participant>/<condition>/<sensor>/<column>.npy
+
+    Arrays are opened with numpy memory mapping on load, so frames are read-only
+    zero-copy views and only the pages actually touched are read into RAM.
+    String timestamp columns (phone_datetime) are stored as datetime64[ns].
+    """
+
+    def _partition_path(self, participant: str, condition: str, sensor: str):
+        return os.path.join(self.directory, participant, condition, sensor)
+
+    def _save_partition(self, participant: str, condition: str, sensor: str, df: pd.DataFrame) -> dict:
+        """Write one column per .npy file and return the partition's index entry."""
+        path = self._partition_path(participant, condition, sensor)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        entry = {
+            "file": None,
+            "rows": int(len(df)),
+            "columns": [],
+            "arrays": {},
+            "source_files": get_source_files(df),
+            "segments": get_segments(df),
+        }
+        if df.empty:
+            return entry
+
+        os.makedirs(path, exist_ok=True)
+        for i, col in enumerate(df.columns):
+            values = _column_to_array(df[col])
+            if values is None:
+                logger.warning("Column '%s' of %s/%s/%s is not numeric, skipping.", col, participant, condition, sensor)
+                continue
+            array_file = f"{i:03d}.npy"
+            np.save(os.path.join(path, array_file), np.ascontiguousarray(values))
+            entry["columns"].append(str(col))
+            entry["arrays"][str(col)] = array_file
+
+        entry["file"] = os.path.relpath(path, self.directory)
+        return entry
+
+    def _load_partition(self, entry: dict, columns=None) -> pd.DataFrame:
+        """Wrap the memory mapped column arrays of one partition in a DataFrame without copying."""
+        arrays = self._open_arrays(entry, columns)
+        if arrays is None:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(arrays, copy=False)
+        set_source_files(df, entry["source_files"])
+        set_segments(df, entry.get("segments", []))
+        return df
+
+    def _open_arrays(self, entry: dict, columns=None):
+        if entry["file"] is None:
+            return None
+        path = os.path.join(self.directory, entry["file"])
+        names = entry["columns"] if columns is None else [col for col in columns if col in entry["columns"]]
+        return {col: np.load(os.path.join(path, entry["arrays"][col]), mmap_mode="r") for col in names}
+
+    def load_arrays(self, participants=None, conditions=None, sensors=None, columns=None):
+        """
+        Like load(), but return each partition as a dict of column name -> read-only np.memmap
+
+        Returns:
+            dict( participant{ condition{ sensor{ column{ np.memmap}}}})
+        """
+        return self._select(participants, conditions, sensors,
+                            lambda entry: self._open_arrays(entry, columns) or {})
+
+
+def _strip_manifest(manifest: dict) -> dict:
+    """Drop machine specific absolute paths from a manifest before storing it."""
+    return {key: {k: v for k, v in info.items() if k != "path"} for key, info in manifest.items()}
+
+
+def _file_changed(previous: dict, current: dict, use_hash: bool) -> bool:
+    """Compare two manifest entries of the same file."""
+    if previous["size"] != current["size"]:
+        return True
+    if use_hash and previous.get("hash") is not None:
+        # Content decides, so re-copied but identical files are not re-parsed
+        return previous["hash"] != current["hash"]
+    return previous["mtime_ns"] != current["mtime_ns"]
+
+
+def _column_to_array(series: pd.Series):
+    """Convert a column to a fixed width numpy array, or None if it can't be memory mapped."""
+    if pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy()
+    if series.name == "phone_datetime":
+        return pd.to_datetime(series, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    return None
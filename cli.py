@@ -0,0 +1,302 @@
+"""
+Command-line entry point:
+
+    python cli.py ingest   [--format parquet] [--participants P01 P02]
+    python cli.py rates    [--sensors ppg acc] [--output rates.csv] [--out-of-core]
+    python cli.py coverage [--conditions intra_heat_exposure]
+    python cli.py hrv      [--window 60] [--out-of-core] [--output hrv.csv]
+    python cli.py features [--window 30] [--step 15] [--feature-dir data/features] [--out-of-core]
+    python cli.py plot     [--figure-dir figures/] [--figure-format pdf] [--plot-workers 4]
+    python cli.py inspect  [--segments]
+
+Only argparse and config are imported at startup. pandas, the checkpoint managers and the
+preprocessor are imported by the subcommands that use them, matplotlib/seaborn only by plot.
+"""
+import argparse
+import logging
+import sys
+
+from config import (
+    DATA_DIR, CONDITIONS, SENSOR_TYPES, CHECKPOINT_FORMAT, CHECKPOINT_FILE, CHECKPOINT_DIR,
+    CHECKPOINT_HASH_FILES, LOAD_WORKERS, LOAD_EXECUTOR, PARSE_ENGINE, FIGURE_DIR, FIGURE_FORMAT,
+    EXPORT_WORKERS, LOG_LEVEL, RUN_REPORT_FILE, HRV_WINDOW_S, WINDOW_S, WINDOW_STEP_S, FEATURE_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FORMATS = ("pickle", "parquet", "memmap")
+
+
+def _checkpoint_manager(fmt: str, path: str = None):
+    """Checkpoint manager for a format, at path or the config default."""
+    if fmt == "pickle":
+        from checkpoint_manager import CheckpointManager
+        return CheckpointManager(path or CHECKPOINT_FILE)
+    if fmt == "parquet":
+        from checkpoint_manager import PartitionedCheckpointManager
+        return PartitionedCheckpointManager(path or CHECKPOINT_DIR)
+    if fmt == "memmap":
+        from checkpoint_manager import MemmapCheckpointManager
+        return MemmapCheckpointManager(path or CHECKPOINT_DIR)
+    raise ValueError(f"Unknown checkpoint format '{fmt}'. Use one of {CHECKPOINT_FORMATS}.")
+
+
+def _select(all_data: dict, participants=None, conditions=None, sensors=None) -> dict:
+    """Subset of all_data[participant][condition][sensor], frames are shared not copied."""
+    return {
+        participant: {
+            condition: {sensor: df for sensor, df in streams.items() if sensors is None or sensor in sensors}
+            for condition, streams in by_condition.items()
+            if conditions is None or condition in conditions
+        }
+        for participant, by_condition in all_data.items()
+        if participants is None or participant in participants
+    }
+
+
+def _load_raw(args) -> dict:
+    """Parse the raw files of the selected participants only."""
+    from loader import list_participants, load_data_for_participant
+
+    participants = [p for p in list_participants(args.data_dir)
+                    if args.participants is None or p in args.participants]
+    all_data = {}
+    for participant in participants:
+        logger.info("Loading data for: %s", participant)
+        all_data[participant] = load_data_for_participant(
+            participant, args.workers, args.executor, data_dir=args.data_dir, engine=args.engine)
+    return _select(all_data, None, args.conditions, args.sensors)
+
+
+def _load(args) -> dict:
+    """
+    Selected data from the checkpoint if there is one, otherwise from the raw files.
+    Partitioned checkpoints read only the selected partitions.
+    """
+    checkpoint_mgr = _checkpoint_manager(args.format, args.checkpoint)
+    if args.raw or not checkpoint_mgr.exists():
+        return _load_raw(args)
+    if args.format == "pickle":
+        return _select(checkpoint_mgr.load(), args.participants, args.conditions, args.sensors)
+    return checkpoint_mgr.load(args.participants, args.conditions, args.sensors)
+
+
+def _write_table(df, output: str = None):
+    if output:
+        df.to_csv(output, index=False)
+        print(f"Written {len(df)} rows to {output}")
+    else:
+        print(df.to_string(index=False))
+
+
+def cmd_ingest(args) -> int:
+    """
+    Parse raw files into a checkpoint, incrementally for parquet/memmap unless --full.
+    A partial selection (--participants/--conditions/--sensors) replaces only the
+    selected partitions of an existing checkpoint.
+    """
+    checkpoint_mgr = _checkpoint_manager(args.format, args.checkpoint)
+    partial = args.participants is not None or args.conditions is not None or args.sensors is not None
+    if args.format != "pickle" and not args.full and not partial:
+        changes = checkpoint_mgr.refresh(args.data_dir, use_hash=args.hash, workers=args.workers,
+                                         executor=args.executor, engine=args.engine)
+        print({kind: len(keys) for kind, keys in changes.items()})
+        return 0
+
+    all_data = _load_raw(args)
+    if args.format == "pickle":
+        if partial and checkpoint_mgr.exists():
+            stored = checkpoint_mgr.load()
+            for participant, conditions in all_data.items():
+                for condition, sensors in conditions.items():
+                    stored.setdefault(participant, {}).setdefault(condition, {}).update(sensors)
+            all_data = stored
+        checkpoint_mgr.save(all_data)
+        return 0
+
+    from loader import scan_source_files
+    # Record the manifest so later refreshes can be incremental
+    manifest = scan_source_files(args.data_dir, use_hash=args.hash)
+    if partial:
+        checkpoint_mgr.merge(all_data, manifest)
+    else:
+        checkpoint_mgr.save(all_data, manifest)
+    return 0
+
+
+def _pieces(args):
+    """Participant-at-a-time pieces of the selection, from the checkpoint if there is one."""
+    from loader import iter_participant_data
+
+    checkpoint = None
+    if args.format != "pickle" and not args.raw:
+        checkpoint_mgr = _checkpoint_manager(args.format, args.checkpoint)
+        checkpoint = checkpoint_mgr if checkpoint_mgr.exists() else None
+    return iter_participant_data(args.participants, args.conditions, args.sensors,
+                                 by_condition=args.by_condition, checkpoint=checkpoint,
+                                 workers=args.workers, executor=args.executor,
+                                 data_dir=args.data_dir, engine=args.engine)
+
+
+def cmd_rates(args) -> int:
+    """Timing quality (sample rate, jitter, drift, drops) of every selected stream."""
+    from preprocessor import compute_timing_table, consume_stream, TimingTable
+    if args.out_of_core:
+        table, = consume_stream(_pieces(args), TimingTable())
+    else:
+        table = compute_timing_table(_load(args))
+    _write_table(table, args.output)
+    return 0
+
+
+def cmd_coverage(args) -> int:
+    """Minutes and days with data of every selected stream."""
+    from coverage import compute_coverage, coverage_table, CoverageAccumulator
+    if args.out_of_core:
+        from preprocessor import consume_stream
+        coverage, = consume_stream(_pieces(args), CoverageAccumulator())
+    else:
+        coverage = compute_coverage(_load(args))
+    _write_table(coverage_table(coverage), args.output)
+    return 0
+
+
+def cmd_hrv(args) -> int:
+    """Windowed heart rate and HRV from the PPG beats, compared with the device HR."""
+    from hrv import compute_hrv_table, HRVTable
+    if args.out_of_core:
+        from preprocessor import consume_stream
+        table, = consume_stream(_pieces(args), HRVTable(args.window))
+    else:
+        table = compute_hrv_table(_load(args), args.window)
+    _write_table(table, args.output)
+    return 0
+
+
+def cmd_features(args) -> int:
+    """Append windowed features of the aligned PPG/ACC streams to the feature table."""
+    from features import extract_features, FeatureTable, FeatureWriter
+    table = FeatureTable(args.feature_dir)
+    if args.out_of_core:
+        from preprocessor import consume_stream
+        windows, = consume_stream(_pieces(args), FeatureWriter(table, window_s=args.window, step_s=args.step))
+    else:
+        windows = len(extract_features(_load(args), args.window, args.step, table=table))
+    print(f"{windows} windows, {len(table.load(args.participants, args.conditions, columns=[]))} stored in {args.feature_dir}")
+    return 0
+
+
+def cmd_plot(args) -> int:
+    """Headless export of the visualiser figures, see export.export_figures."""
+    from export import export_figures
+    export_figures(_load(args), args.figure_dir, args.figure_format, plots=args.plots,
+                   workers=args.plot_workers)
+    return 0
+
+
+def cmd_inspect(args) -> int:
+    """Partitions of the checkpoint (rows, columns, source files) or its segment index."""
+    checkpoint_mgr = _checkpoint_manager(args.format, args.checkpoint)
+    if not checkpoint_mgr.exists():
+        print(f"No {args.format} checkpoint found.")
+        return 1
+
+    import pandas as pd
+    if args.format == "pickle":
+        from loader import memory_footprint, segment_table
+        data = _select(checkpoint_mgr.load(), args.participants, args.conditions, args.sensors)
+        table = segment_table(data) if args.segments else memory_footprint(data)
+    elif args.segments:
+        table = checkpoint_mgr.read_segments(args.participants, args.conditions, args.sensors)
+    else:
+        # Index only, no partition is read
+        entries = checkpoint_mgr._select(args.participants, args.conditions, args.sensors, lambda entry: entry)
+        table = pd.DataFrame([
+            {"participant": participant, "condition": condition, "sensor": sensor, "rows": entry["rows"],
+             "files": len(entry.get("source_files") or []), "columns": len(entry["columns"])}
+            for participant, conditions in entries.items()
+            for condition, streams in conditions.items()
+            for sensor, entry in streams.items()
+        ], columns=["participant", "condition", "sensor", "rows", "files", "columns"])
+    _write_table(table, args.output)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument("--participants", nargs="+", help="Participants to use, default all")
+    selection.add_argument("--conditions", nargs="+", choices=CONDITIONS, help="Conditions to use, default all")
+    selection.add_argument("--sensors", nargs="+", choices=list(SENSOR_TYPES), help="Sensors to use, default all")
+    selection.add_argument("--data-dir", default=DATA_DIR, help="Raw data directory")
+    selection.add_argument("--format", default=CHECKPOINT_FORMAT, choices=CHECKPOINT_FORMATS, help="Checkpoint format")
+    selection.add_argument("--checkpoint", help="Checkpoint file (pickle) or directory, default from config")
+    selection.add_argument("--raw", action="store_true", help="Parse raw files even if a checkpoint exists")
+    selection.add_argument("--workers", type=int, default=LOAD_WORKERS, help="Parse workers")
+    selection.add_argument("--executor", default=LOAD_EXECUTOR, choices=["process", "thread"])
+    selection.add_argument("--engine", default=PARSE_ENGINE, choices=["pandas", "pyarrow", "numeric"])
+    selection.add_argument("--output", help="Write the table to this CSV instead of printing it")
+
+    parser = argparse.ArgumentParser(prog="cli.py", description="Heat exposure sensor data tools")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--report", default=RUN_REPORT_FILE, help="Write a JSON run report of every timed stage")
+    parser.add_argument("--profile", action="append", metavar="STAGE:MODE", default=[],
+                        help="Profile a stage, MODE is cprofile or tracemalloc, e.g. parse:cprofile (repeatable)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", parents=[selection], help="Parse raw files into a checkpoint")
+    ingest.add_argument("--full", action="store_true", help="Rebuild instead of refreshing changed files")
+    ingest.add_argument("--hash", action="store_true", default=CHECKPOINT_HASH_FILES,
+                        help="Compare file content hashes when refreshing")
+    ingest.set_defaults(func=cmd_ingest)
+
+    reduction = argparse.ArgumentParser(add_help=False)
+    reduction.add_argument("--out-of-core", action="store_true",
+                           help="Load one participant at a time, peak memory stays at one participant")
+    reduction.add_argument("--by-condition", action="store_true",
+                           help="With --out-of-core, load one participant/condition at a time")
+
+    commands.add_parser("rates", parents=[selection, reduction],
+                        help="Sample rate and timing quality table").set_defaults(func=cmd_rates)
+    commands.add_parser("coverage", parents=[selection, reduction],
+                        help="Minutes of data per stream").set_defaults(func=cmd_coverage)
+    hrv = commands.add_parser("hrv", parents=[selection, reduction], help="Beats, heart rate and HRV per window")
+    hrv.add_argument("--window", type=float, default=HRV_WINDOW_S, help="HRV window in seconds")
+    hrv.set_defaults(func=cmd_hrv)
+    features = commands.add_parser("features", parents=[selection, reduction],
+                                   help="Windowed features into the partitioned feature table")
+    features.add_argument("--window", type=float, default=WINDOW_S, help="Window length in seconds")
+    features.add_argument("--step", type=float, default=WINDOW_STEP_S, help="Seconds between window starts")
+    features.add_argument("--feature-dir", default=FEATURE_DIR)
+    features.set_defaults(func=cmd_features)
+
+    plot = commands.add_parser("plot", parents=[selection], help="Export figures without a display")
+    plot.add_argument("--figure-dir", default=FIGURE_DIR)
+    plot.add_argument("--figure-format", default=FIGURE_FORMAT, choices=["png", "svg", "pdf"])
+    plot.add_argument("--plots", nargs="+", help="Plots to export, default all")
+    plot.add_argument("--plot-workers", type=int, default=EXPORT_WORKERS, help="Rendering processes")
+    plot.set_defaults(func=cmd_plot)
+
+    inspect = commands.add_parser("inspect", parents=[selection], help="Show checkpoint contents")
+    inspect.add_argument("--segments", action="store_true", help="Show the segment index instead")
+    inspect.set_defaults(func=cmd_inspect)
+
+    return parser
+
+
+def main(argv: list = None) -> int:
+    import instrumentation
+
+    args = build_parser().parse_args(argv)
+    instrumentation.configure_logging(args.log_level)
+    for spec in args.profile:
+        name, _, mode = spec.partition(":")
+        instrumentation.PROFILE_STAGES[name] = mode or "cprofile"
+
+    status = args.func(args)
+    if args.report:
+        instrumentation.REPORT.write(args.report)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
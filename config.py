@@ -13,12 +13,100 @@ SENSOR_TYPES= {
 # Exposure categories
 CONDITIONS = ["pre_heat_exposure", "intra_heat_exposure", "post_heat_exposure"]
 
+# Parallel ingestion: number of workers (1 = serial) and pool type ("process" or "thread")
+LOAD_WORKERS = 1
+LOAD_EXECUTOR = "process"
+
+# Parse engine for raw files: "pandas" (generic), "pyarrow" (multithreaded, falls back to
+# pandas if pyarrow is missing) or "numeric" (fixed Polar layout straight into typed arrays)
+PARSE_ENGINE = "pandas"
+
+# Rows per chunk for loader.stream_sensor_data
+STREAM_CHUNK_ROWS = 1_000_000
+
+# Segment index built at load time: a gap longer than this (ns) starts a new segment
+SEGMENT_GAP_NS = 2_000_000_000
+
+# Sensor alignment (preprocessor.align_sensors): reference stream, fallback order when it
+# is missing, and max matching distance per sensor in nanoseconds
+ALIGN_REFERENCE = "ppg"
+ALIGN_PRIORITY = ["ppg", "acc", "gyro", "hr"]
+ALIGN_TOLERANCE_NS = {
+    "ppg": 20_000_000,
+    "acc": 20_000_000,
+    "gyro": 20_000_000,
+    "hr": 1_500_000_000,
+}
+
+# Resampling (preprocessor.resample_stream): grid points further than this many source
+# sample periods from real samples are treated as a recording gap and left as NaN
+RESAMPLE_MAX_GAP_FACTOR = 3.0
+
+# PPG filtering (preprocessor.filter_ppg): zero-phase Butterworth bandpass in Hz and its
+# order, linear detrend of every continuous segment before filtering, and the workers
+# filtering participant/condition partitions at once with their pool type ("thread" or "process")
+PPG_BANDPASS_HZ = (0.5, 8.0)
+PPG_FILTER_ORDER = 4
+PPG_DETREND = True
+FILTER_WORKERS = 1
+FILTER_EXECUTOR = "thread"
+
+# Beats and HRV (hrv.py): plausible inter-beat interval range in ms, min pulse peak
+# prominence in standard deviations of the filtered segment, HRV window length, and the
+# raw PPG carried between streamed chunks so beats near a chunk edge are filtered in context
+BEAT_IBI_RANGE_MS = (333.0, 1500.0)
+BEAT_PROMINENCE = 0.5
+HRV_WINDOW_S = 300
+HRV_CHUNK_OVERLAP_S = 20.0
+
+# Windowed features (features.py): window length and step in seconds, sensors aligned
+# before windowing, features computed per window and channel, and the partitioned
+# on-disk feature table
+WINDOW_S = 30.0
+WINDOW_STEP_S = 15.0
+WINDOW_SENSORS = ["ppg", "acc"]
+WINDOW_FEATURES = ["mean", "std", "min", "max"]
+FEATURE_DIR = "data/features"
+
 # For checkpointing
 LOAD_CHECKPOINT = True
 SAVE_CHECKPOINT = False
 CHECKPOINT_FILE = "data/pickled/ID00_loaded_data_000.pkl"
+# "pickle" uses CHECKPOINT_FILE, "parquet" stores one partition per participant/condition/sensor,
+# "memmap" stores each column as a .npy array opened with numpy memory mapping
+CHECKPOINT_FORMAT = "pickle"
+CHECKPOINT_DIR = "data/partitioned/ID00_loaded_data_000"
+# Parquet/memmap checkpoints only: re-parse new/changed raw files and drop deleted ones on load
+INCREMENTAL_CHECKPOINT = True
+# Compare a content hash of raw files as well as size and mtime (slower scan)
+CHECKPOINT_HASH_FILES = False
 CHECKPOINT_ID = 0
 
+# Logging and instrumentation (instrumentation.py): log level, JSON run report written by
+# main.py (None to skip), and opt-in profiling per stage name, e.g. {"parse": "cprofile"}
+# or {"merge": "tracemalloc"}, with cProfile stats written to PROFILE_DIR
+LOG_LEVEL = "INFO"
+RUN_REPORT_FILE = None
+PROFILE_STAGES = {}
+PROFILE_DIR = "data/profiles"
+
+# dataset.Dataset: max bytes of lazily loaded frames kept in memory (LRU eviction)
+DATASET_CACHE_BYTES = 2 * 1024 ** 3
+
+# Headless figure export (export.export_figures): output directory, format ("png", "svg"
+# or "pdf") and number of rendering processes (1 = serial)
+EXPORT_FIGURES = False
+FIGURE_DIR = "figures/"
+FIGURE_FORMAT = "png"
+EXPORT_WORKERS = 1
+
+# Stage pipeline (pipeline.build_pipeline): run it from main.py instead of the steps below,
+# stages to produce, where stage results are cached and how many stages may run at once
+RUN_PIPELINE = False
+PIPELINE_TARGETS = ["timing", "coverage", "figures"]
+PIPELINE_CACHE_DIR = "data/pipeline_cache"
+PIPELINE_WORKERS = 2
+
 # Function to get participant directories
 def get_participant_dirs():
     return [f for f in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, f))]
@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from checkpoint_manager import CheckpointManager
+
+MINUTES_PER_DAY = 24 * 60
+NS_PER_MINUTE = 60_000_000_000
+
+
+class MinuteCoverage:
+    """
+    Day x minute-of-day presence bitmap of one participant/condition/sensor stream.
+
+    Attributes:
+        days (np.ndarray): Sorted datetime64[D] days with at least one minute of data
+        bitmap (np.ndarray): bool array of shape (len(days), 1440), True where the minute has data
+    """
+
+    def __init__(self, days: np.ndarray, bitmap: np.ndarray):
+        self.days = days
+        self.bitmap = bitmap
+
+    @classmethod
+    def empty(cls):
+        return cls(np.array([], dtype="datetime64[D]"), np.zeros((0, MINUTES_PER_DAY), dtype=bool))
+
+    @classmethod
+    def from_timestamps(cls, phone_ns: np.ndarray):
+        """Build from int64 nanosecond timestamps with integer arithmetic only, NaT is ignored."""
+        phone_ns = np.asarray(phone_ns, dtype=np.int64)
+        phone_ns = phone_ns[phone_ns != np.iinfo(np.int64).min]
+        if phone_ns.size == 0:
+            return cls.empty()
+
+        minutes = np.unique(phone_ns // NS_PER_MINUTE)  # sorted, one entry per covered minute
+        day_numbers, minute_of_day = np.divmod(minutes, MINUTES_PER_DAY)
+        days, day_index = np.unique(day_numbers, return_inverse=True)
+
+        bitmap = np.zeros((len(days), MINUTES_PER_DAY), dtype=bool)
+        bitmap[day_index, minute_of_day] = True
+        return cls(days.astype("datetime64[D]"), bitmap)
+
+    def __len__(self):
+        return int(self.bitmap.sum())
+
+    def total_minutes(self) -> int:
+        """Number of minutes with data."""
+        return len(self)
+
+    def minutes_per_day(self) -> pd.Series:
+        """Minutes with data per day, indexed by datetime.date."""
+        return pd.Series(self.bitmap.sum(axis=1), index=pd.to_datetime(self.days).date, dtype=int)
+
+    def binned(self, bin_minutes: int, days: np.ndarray = None) -> np.ndarray:
+        """
+        bool array (n_days, 1440 // bin_minutes), True where any minute of the bin has data.
+        Rows are self.days, or the given sorted days (see reindex).
+        """
+        if MINUTES_PER_DAY % bin_minutes:
+            raise ValueError("bin_minutes must divide 1440.")
+        bitmap = self.bitmap if days is None else self.reindex(days)
+        return bitmap.reshape(len(bitmap), -1, bin_minutes).any(axis=2)
+
+    def reindex(self, days: np.ndarray) -> np.ndarray:
+        """Bitmap rows for the given days (sorted datetime64[D]), all False for days without data."""
+        out = np.zeros((len(days), MINUTES_PER_DAY), dtype=bool)
+        if len(self.days):
+            pos = np.searchsorted(days, self.days)
+            out[pos] = self.bitmap
+        return out
+
+
+def compute_stream_coverage(df: pd.DataFrame, value_col: str = None,
+                            datetime_col: str = "phone_datetime") -> MinuteCoverage:
+    """
+    Minute coverage of one stream. Only the timestamp (and value_col) columns are read,
+    the frame is never copied or modified.
+
+    Args:
+        df (pd.DataFrame): Sensor stream
+        value_col (str): Only count rows where this column is not NaN, e.g. "ppg_ch0"
+        datetime_col (str): Phone timestamp column
+
+    Returns:
+        MinuteCoverage
+    """
+    if df.empty or datetime_col not in df.columns:
+        return MinuteCoverage.empty()
+    if value_col is not None and value_col not in df.columns:
+        return MinuteCoverage.empty()
+
+    times = df[datetime_col]
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, errors="coerce")
+    phone_ns = times.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    if value_col is not None:
+        phone_ns = phone_ns[df[value_col].notna().to_numpy()]
+
+    return MinuteCoverage.from_timestamps(phone_ns)
+
+
+# Column whose presence defines coverage per sensor; None counts every row
+COVERAGE_VALUE_COLS = {"ppg": "ppg_ch0", "acc": None, "hr": "heart_rate[bpm]", "gyro": None}
+
+
+def compute_coverage(all_data: dict, sensors: list = None) -> dict:
+    """
+    Minute coverage of every participant/condition/sensor stream.
+
+    Args:
+        all_data (dict): Nested all_data[participant][condition][sensor] frames
+        sensors (list): Sensors to compute, default all
+
+    Returns:
+        dict( participant{ condition{ sensor{ MinuteCoverage}}})
+    """
+    return {
+        participant: {
+            condition: {
+                sensor: compute_stream_coverage(streams[sensor], COVERAGE_VALUE_COLS.get(sensor))
+                for sensor in streams
+                if sensors is None or sensor in sensors
+            }
+            for condition, streams in conditions.items()
+        }
+        for participant, conditions in all_data.items()
+    }
+
+
+class CoverageAccumulator:
+    """
+    Out-of-core compute_coverage: fed pieces of all_data (see loader.iter_participant_data),
+    it keeps only the minute bitmaps, never the frames.
+    """
+
+    def __init__(self, sensors: list = None):
+        self.sensors = sensors
+        self.coverage = {}
+
+    def update(self, data: dict):
+        """Add a piece of all_data."""
+        for participant, conditions in compute_coverage(data, self.sensors).items():
+            self.coverage.setdefault(participant, {}).update(conditions)
+
+    def result(self) -> dict:
+        """
+        Returns:
+            dict( participant{ condition{ sensor{ MinuteCoverage}}})
+        """
+        return self.coverage
+
+
+def coverage_table(coverage: dict) -> pd.DataFrame:
+    """
+    One row per stream of a compute_coverage result.
+
+    Returns:
+        pd.DataFrame with participant, condition, sensor, days and minutes columns
+    """
+    rows = []
+    for participant, conditions in coverage.items():
+        for condition, streams in conditions.items():
+            for sensor, cov in streams.items():
+                rows.append({"participant": participant, "condition": condition, "sensor": sensor,
+                             "days": len(cov.days), "minutes": cov.total_minutes()})
+    return pd.DataFrame(rows, columns=["participant", "condition", "sensor", "days", "minutes"])
+
+
+def _fingerprint(all_data: dict, sensors: list = None) -> dict:
+    """Cheap identity of the data: row count and first/last timestamp of every stream."""
+    fingerprint = {}
+    for participant, conditions in all_data.items():
+        for condition, streams in conditions.items():
+            for sensor in streams:
+                if sensors is not None and sensor not in sensors:
+                    continue
+                df = streams[sensor]
+                key = f"{participant}/{condition}/{sensor}"
+                if df.empty or "phone_datetime" not in df.columns:
+                    fingerprint[key] = (len(df),)
+                else:
+                    fingerprint[key] = (len(df), str(df["phone_datetime"].iloc[0]), str(df["phone_datetime"].iloc[-1]))
+    return fingerprint
+
+
+def load_or_compute_coverage(all_data: dict, cache_file: str, sensors: list = None) -> dict:
+    """
+    compute_coverage with an on-disk cache. The cache is reused only if the row counts
+    and first/last timestamps of the streams still match.
+
+    Args:
+        all_data (dict): Nested all_data[participant][condition][sensor] frames
+        cache_file (str): Pickle file for the cached coverage
+        sensors (list): Sensors to compute, default all
+
+    Returns:
+        dict( participant{ condition{ sensor{ MinuteCoverage}}})
+    """
+    cache = CheckpointManager(cache_file)
+    fingerprint = _fingerprint(all_data, sensors)
+    if cache.exists():
+        cached = cache.load()
+        if cached.get("fingerprint") == fingerprint:
+            return cached["coverage"]
+
+    coverage = compute_coverage(all_data, sensors)
+    cache.save({"fingerprint": fingerprint, "coverage": coverage})
+    return coverage
+
+
+def union_days(coverages) -> np.ndarray:
+    """Sorted union of the days of several MinuteCoverage objects."""
+    days = [cov.days for cov in coverages if len(cov.days)]
+    if not days:
+        return np.array([], dtype="datetime64[D]")
+    return np.unique(np.concatenate(days))
@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import pandas as pd
+
+from config import CONDITIONS, SENSOR_TYPES, PARSE_ENGINE, DATASET_CACHE_BYTES
+from loader import _list_participant_files, concat_source_parts, list_participants, parse_files
+
+
+class Dataset(Mapping):
+    """
+    Lazy, read-only stand-in for the nested all_data dict.
+
+    ds[participant][condition][sensor] parses the raw files (or reads the checkpoint
+    partition) of that one stream on first access. Loaded frames are kept in an LRU
+    cache capped at budget_bytes; the least recently used frames are dropped once the
+    budget is exceeded and are loaded again if accessed later. The most recent frame is
+    always kept, even if it alone is larger than the budget.
+
+    Keys are the same as for the loaded dict: every condition and sensor type of every
+    participant for raw data, the partitions of the index for a checkpoint.
+    """
+
+    def __init__(self,
+                 checkpoint=None,
+                 data_dir: str = None,
+                 budget_bytes: int = DATASET_CACHE_BYTES,
+                 engine: str = PARSE_ENGINE,
+                 columns: list = None):
+        """
+        Args:
+            checkpoint: PartitionedCheckpointManager / MemmapCheckpointManager to read from,
+                        None to parse raw files from data_dir
+            data_dir (str): Root raw data directory, defaults to config.DATA_DIR
+            budget_bytes (int): Max bytes of frames kept in memory
+            engine (str): Parse engine for raw files, see loader.PARSE_ENGINES
+            columns (list): Columns to read from checkpoint partitions, None for all
+        """
+        self.checkpoint = checkpoint
+        self.data_dir = data_dir
+        self.budget_bytes = budget_bytes
+        self.engine = engine
+        self.columns = columns
+
+        self._cache = OrderedDict()  # (participant, condition, sensor) -> (df, bytes)
+        self._cache_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if checkpoint is not None:
+            self._entries = checkpoint.read_index()["partitions"]
+            self._participants = list(self._entries)
+        else:
+            self._entries = {}
+            self._participants = list_participants(data_dir)
+
+    # Mapping interface, participant level
+    def __getitem__(self, participant):
+        if participant not in self._participants:
+            raise KeyError(participant)
+        return _ParticipantView(self, participant)
+
+    def __iter__(self):
+        return iter(self._participants)
+
+    def __len__(self):
+        return len(self._participants)
+
+    def conditions(self, participant: str) -> list:
+        if self.checkpoint is not None:
+            return list(self._entries[participant])
+        return list(CONDITIONS)
+
+    def sensors(self, participant: str, condition: str) -> list:
+        if self.checkpoint is not None:
+            return list(self._entries[participant][condition])
+        return list(SENSOR_TYPES)
+
+    def frame(self, participant: str, condition: str, sensor: str) -> pd.DataFrame:
+        """Frame of one stream, from the cache or loaded (and cached) on a miss."""
+        key = (participant, condition, sensor)
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key][0]
+
+            self.misses += 1
+            df = self._load(participant, condition, sensor)
+            n_bytes = int(df.memory_usage(index=True, deep=True).sum())
+            self._cache[key] = (df, n_bytes)
+            self._cache_bytes += n_bytes
+            self._evict()
+            return df
+
+    def _evict(self):
+        while self._cache_bytes > self.budget_bytes and len(self._cache) > 1:
+            _, (_, n_bytes) = self._cache.popitem(last=False)
+            self._cache_bytes -= n_bytes
+            self.evictions += 1
+
+    def _load(self, participant: str, condition: str, sensor: str) -> pd.DataFrame:
+        if self.checkpoint is not None:
+            entry = self._entries[participant][condition][sensor]
+            return self.checkpoint._load_partition(entry, self.columns)
+
+        files = [(filename, path) for category, key, filename, path
+                 in _list_participant_files(participant, self.data_dir)
+                 if category == condition and key == sensor]
+        frames = parse_files([path for _, path in files], engine=self.engine)
+        return concat_source_parts([(filename, df) for (filename, _), df in zip(files, frames) if df is not None])
+
+    def cache_info(self) -> dict:
+        """Hit/miss/eviction counts and the current cache size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "frames": len(self._cache),
+                "bytes": self._cache_bytes,
+                "budget_bytes": self.budget_bytes,
+            }
+
+    def clear_cache(self):
+        """Drop every cached frame, the counters are kept."""
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+
+class _ParticipantView(Mapping):
+    """ds[participant], condition level."""
+
+    def __init__(self, dataset: Dataset, participant: str):
+        self._dataset = dataset
+        self._participant = participant
+        self._conditions = dataset.conditions(participant)
+
+    def __getitem__(self, condition):
+        if condition not in self._conditions:
+            raise KeyError(condition)
+        return _ConditionView(self._dataset, self._participant, condition)
+
+    def __iter__(self):
+        return iter(self._conditions)
+
+    def __len__(self):
+        return len(self._conditions)
+
+
+class _ConditionView(Mapping):
+    """ds[participant][condition], sensor level, frames come from the dataset cache."""
+
+    def __init__(self, dataset: Dataset, participant: str, condition: str):
+        self._dataset = dataset
+        self._participant = participant
+        self._condition = condition
+        self._sensors = dataset.sensors(participant, condition)
+
+    def __getitem__(self, sensor):
+        if sensor not in self._sensors:
+            raise KeyError(sensor)
+        return self._dataset.frame(self._participant, self._condition, sensor)
+
+    def __iter__(self):
+        return iter(self._sensors)
+
+    def __len__(self):
+        return len(self._sensors)
@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+# Headless: no display needed, plt.show() becomes a no-op
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+from config import FIGURE_DIR, FIGURE_FORMAT, EXPORT_WORKERS
+from coverage import compute_coverage
+from instrumentation import stage
+from visualiser import (
+    visualise_ppg_ch0_minutes_stacked,
+    plot_data_coverage_per_participant,
+    plot_individual_participant_heatmap,
+    plot_individual_participant_heatmap_raster,
+)
+
+logger = logging.getLogger(__name__)
+
+# One figure for the whole cohort
+COHORT_PLOTS = {
+    "ppg_minutes_stacked": visualise_ppg_ch0_minutes_stacked,
+    "coverage_per_participant": plot_data_coverage_per_participant,
+}
+
+# One figure per participant
+PARTICIPANT_PLOTS = {
+    "heatmap": plot_individual_participant_heatmap,
+    "heatmap_raster": plot_individual_participant_heatmap_raster,
+}
+
+FIGURE_FORMATS = ("png", "svg", "pdf")
+
+
+def _use_headless_backend():
+    """Pool initializer, workers never open a display."""
+    matplotlib.use("Agg")
+
+
+def _render_task(task: tuple) -> list:
+    """
+    Render one plot in the current process, save every figure it opened and close them.
+    Figures that were already open (e.g. the caller's, when rendering in-process) are
+    left alone.
+
+    Args:
+        task: (plot name, participant or None, coverage subset, output_dir, fmt, dpi)
+
+    Returns:
+        list of written file paths
+    """
+    plot, participant, coverage, output_dir, fmt, dpi = task
+    plot_func = COHORT_PLOTS.get(plot) or PARTICIPANT_PLOTS[plot]
+
+    already_open = set(plt.get_fignums())
+    with stage("render") as timer:
+        with warnings.catch_warnings():
+            # plt.show() on a non-interactive backend warns, it is expected here
+            warnings.filterwarnings("ignore", message=".*non-interactive.*")
+            # With coverage given the plots only need the participant ids from all_data
+            plot_func({p: {} for p in coverage}, coverage=coverage)
+
+        paths = []
+        stem = plot if participant is None else f"{plot}_{participant}"
+        fig_nums = [num for num in plt.get_fignums() if num not in already_open]
+        for i, num in enumerate(fig_nums):
+            fig = plt.figure(num)
+            suffix = "" if len(fig_nums) == 1 else f"_{i}"
+            path = os.path.join(output_dir, f"{stem}{suffix}.{fmt}")
+            fig.savefig(path, format=fmt, dpi=dpi, bbox_inches="tight")
+            plt.close(fig)
+            paths.append(path)
+            timer.add(n_bytes=os.path.getsize(path))
+        timer.add(figures=len(paths))
+
+    return paths
+
+
+def export_figures(all_data: dict,
+                   output_dir: str = FIGURE_DIR,
+                   fmt: str = FIGURE_FORMAT,
+                   plots: list = None,
+                   participants: list = None,
+                   workers: int = EXPORT_WORKERS,
+                   coverage: dict = None,
+                   dpi: int = 150) -> list:
+    """
+    Render visualiser figures without a display and write them to output_dir.
+
+    The minute coverage is computed once here and only each participant's slice of it is
+    sent to the worker processes, never the raw frames. Every figure is closed as soon as
+    it is saved, so memory does not grow with the number of participants.
+
+    Args:
+        all_data (dict): Nested all_data[participant][condition][sensor] frames
+        output_dir (str): Directory for the figure files, created if needed
+        fmt (str): "png", "svg" or "pdf"
+        plots (list): Names from COHORT_PLOTS / PARTICIPANT_PLOTS, default all
+        participants (list): Participants to render, default all
+        workers (int): Number of spawned worker processes, 1 renders in this process
+        coverage (dict): Precomputed coverage.compute_coverage result
+        dpi (int): Resolution of raster formats
+
+    Returns:
+        list of written file paths, cohort plots first then per participant in order
+    """
+    if fmt not in FIGURE_FORMATS:
+        raise ValueError(f"Unknown figure format '{fmt}'. Use one of {FIGURE_FORMATS}.")
+    plots = plots or list(COHORT_PLOTS) + list(PARTICIPANT_PLOTS)
+    unknown = [plot for plot in plots if plot not in COHORT_PLOTS and plot not in PARTICIPANT_PLOTS]
+    if unknown:
+        raise ValueError(f"Unknown plots {unknown}.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    if coverage is None:
+        coverage = compute_coverage(all_data, sensors=["acc", "ppg"])
+    participants = sorted(p for p in coverage if participants is None or p in participants)
+
+    tasks = []
+    for plot in plots:
+        if plot in COHORT_PLOTS:
+            tasks.append((plot, None, {p: coverage[p] for p in participants}, output_dir, fmt, dpi))
+    for participant in participants:
+        for plot in plots:
+            if plot in PARTICIPANT_PLOTS:
+                tasks.append((plot, participant, {participant: coverage[participant]}, output_dir, fmt, dpi))
+
+    if workers is None or workers <= 1:
+        results = [_render_task(task) for task in tasks]
+    else:
+        # Spawned, not forked: export runs from pipeline threads, forking those is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_use_headless_backend) as pool:
+            results = list(pool.map(_render_task, tasks))
+
+    paths = [path for task_paths in results for path in task_paths]
+    logger.info("Exported %d figures to %s", len(paths), output_dir)
+    return paths
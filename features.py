@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import RESAMPLE_MAX_GAP_FACTOR, WINDOW_S, WINDOW_STEP_S, WINDOW_SENSORS, WINDOW_FEATURES, FEATURE_DIR
+from instrumentation import stage, timed
+from preprocessor import align_sensors, stream_time_ns, compute_sample_rate_from_timestamps_median
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ["participant", "condition", "window_start"]
+
+
+class WindowBlock:
+    """
+    Overlapping windows of one continuous segment, as a strided view (no copy).
+
+    Attributes:
+        channels (list): Channel names, in the order of the channel axis
+        values (np.ndarray): View of shape (n_windows, n_channels, window_len)
+        start_ns (np.ndarray): int64 time of the first sample of every window, on the
+                               stream's time base (sensor clock or phone time)
+        phone_start_ns (np.ndarray): int64 phone time of the first sample of every window
+        segment (np.ndarray): The segment's contiguous (samples, channels) array the view is on
+        step (int): Samples between window starts
+    """
+
+    def __init__(self, channels, values, start_ns, phone_start_ns, segment, step):
+        self.channels = channels
+        self.values = values
+        self.start_ns = start_ns
+        self.phone_start_ns = phone_start_ns
+        self.segment = segment
+        self.step = step
+
+    @property
+    def n_windows(self) -> int:
+        return len(self.values)
+
+    @property
+    def window_len(self) -> int:
+        return self.values.shape[-1]
+
+
+def sliding_windows(df: pd.DataFrame,
+                    window_s: float = WINDOW_S,
+                    step_s: float = WINDOW_STEP_S,
+                    channels: list = None,
+                    max_gap_factor: float = RESAMPLE_MAX_GAP_FACTOR,
+                    time_col: str = "sensor_clock[ns]",
+                    datetime_col: str = "phone_datetime") -> list:
+    """
+    Cut a stream into overlapping fixed-length windows without copying them.
+
+    The channels are converted once to a contiguous float32 (samples, channels) array and
+    every window is a sliding_window_view into it. Windows never span a recording gap
+    (more than max_gap_factor median periods) or a row with a missing value: each
+    continuous run of valid rows gets its own WindowBlock, and runs shorter than a
+    window give none. Window and step lengths are converted to samples at the stream's
+    median rate.
+
+    Args:
+        df (pd.DataFrame): One stream or an align_sensors frame of one participant/condition
+        window_s (float): Window length in seconds
+        step_s (float): Seconds between window starts, default window_s (no overlap)
+        channels (list): Columns to window, default every numeric non-time column
+        max_gap_factor (float): Gap threshold in multiples of the median sample period
+        time_col (str): Sensor clock column
+        datetime_col (str): Phone timestamp column, used when time_col is absent
+
+    Returns:
+        list of WindowBlock in time order, empty if the stream has no complete window
+    """
+    if channels is None:
+        channels = [col for col in df.columns
+                    if col not in (time_col, datetime_col) and pd.api.types.is_numeric_dtype(df[col])]
+    if df.empty or not channels:
+        return []
+
+    times, used_col = stream_time_ns(df, time_col, datetime_col)
+    phone = times
+    if used_col == time_col and datetime_col in df.columns:
+        phone = stream_time_ns(df, None, datetime_col)[0]
+    values = df[channels].to_numpy(dtype=np.float32)
+
+    if (np.diff(times) < 0).any():
+        order = np.argsort(times, kind="stable")
+        times, phone, values = times[order], phone[order], values[order]
+    values = np.ascontiguousarray(values)
+
+    rate = compute_sample_rate_from_timestamps_median(times)
+    if rate is None:
+        return []
+    window = int(round(window_s * rate))
+    step = max(1, int(round((step_s or window_s) * rate)))
+
+    # Runs of valid rows without a gap, found for all rows at once
+    valid = np.isfinite(values).all(axis=1) & (phone != np.iinfo(np.int64).min)
+    gap_before = np.concatenate(([True], np.diff(times) > max_gap_factor * 1e9 / rate))
+    starts = np.flatnonzero(valid & (gap_before | ~np.concatenate(([False], valid[:-1]))))
+    stops = np.flatnonzero(valid & (np.concatenate((gap_before[1:], [True])) | ~np.concatenate((valid[1:], [False])))) + 1
+
+    blocks = []
+    for start, stop in zip(starts, stops):
+        if stop - start < window:
+            continue
+        segment = values[start:stop]
+        view = sliding_window_view(segment, window, axis=0)[::step]
+        first = start + np.arange(len(view)) * step
+        blocks.append(WindowBlock(list(channels), view, times[first], phone[first], segment, step))
+    return blocks
+
+
+def _window_sums(segment: np.ndarray, window: int, step: int, power: int) -> np.ndarray:
+    """Sum of segment ** power over every window, from cumulative sums in O(samples)."""
+    cumulative = np.zeros((len(segment) + 1, segment.shape[1]))
+    np.cumsum(segment.astype(np.float64) ** power, axis=0, out=cumulative[1:])
+    ends = np.arange(window, len(segment) + 1, step)
+    return cumulative[ends] - cumulative[ends - window]
+
+
+def window_features(blocks: list, features: list = WINDOW_FEATURES) -> pd.DataFrame:
+    """
+    Features of every window and channel, computed per block in a single vectorised
+    pass. mean and std come from cumulative sums of the segment (each sample read once
+    however much windows overlap); min and max reduce the strided view directly.
+
+    Args:
+        blocks (list): WindowBlocks of one stream, see sliding_windows
+        features (list): Names from "mean", "std", "min", "max"
+
+    Returns:
+        pd.DataFrame with window_start (phone time), clock_start_ns, samples and one
+        <channel>_<feature> column per channel and feature
+    """
+    unknown = set(features) - {"mean", "std", "min", "max"}
+    if unknown:
+        raise ValueError(f"Unknown window features {sorted(unknown)}. Use 'mean', 'std', 'min' or 'max'.")
+
+    frames = []
+    for block in blocks:
+        columns = {
+            "window_start": pd.to_datetime(block.phone_start_ns, unit="ns"),
+            "clock_start_ns": block.start_ns,
+            "samples": np.full(block.n_windows, block.window_len),
+        }
+        computed = {}
+        if "mean" in features or "std" in features:
+            # Centred on the segment mean so the running sums keep their precision on large offsets
+            offset = block.segment.mean(axis=0, dtype=np.float64)
+            centred = block.segment - offset.astype(np.float32)
+            total = _window_sums(centred, block.window_len, block.step, 1)
+            computed["mean"] = total / block.window_len + offset
+            if "std" in features:
+                squares = _window_sums(centred, block.window_len, block.step, 2)
+                variance = squares / block.window_len - (total / block.window_len) ** 2
+                computed["std"] = np.sqrt(np.maximum(variance, 0.0))
+        if "min" in features:
+            computed["min"] = block.values.min(axis=-1)
+        if "max" in features:
+            computed["max"] = block.values.max(axis=-1)
+
+        for i, channel in enumerate(block.channels):
+            for feature in features:
+                columns[f"{channel}_{feature}"] = computed[feature][:, i].astype(np.float32)
+        frames.append(pd.DataFrame(columns))
+
+    if not frames:
+        return pd.DataFrame(columns=["window_start", "clock_start_ns", "samples"])
+    return pd.concat(frames, ignore_index=True)
+
+
+class FeatureTable:
+    """
+    Partitioned on-disk table of window features, appended to incrementally.
+
+    Layout:
+        directory/_index.json
+        directory/<participant>/<condition>/part-<first window start ns>.parquet
+
+    Rows are keyed by participant, condition and window_start. append() skips windows
+    already stored, so re-running an extraction only adds what is new. The index records
+    the key range of every part, so loads and duplicate checks only open the parts
+    they need.
+    """
+
+    INDEX_FILE = "_index.json"
+
+    def __init__(self, directory: str = FEATURE_DIR):
+        self.directory = directory
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    def read_index(self) -> dict:
+        """
+        Returns:
+            dict {"version": int, "partitions": {participant: {condition: [part entries]}}}
+        """
+        if not self.exists():
+            return {"version": 1, "partitions": {}}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _write_index(self, index: dict):
+        # Written last and atomically, a part missing from the index is simply not there yet
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, participant: str, condition: str, features: pd.DataFrame) -> int:
+        """
+        Store the windows of features not stored yet as a new part.
+
+        Args:
+            participant (str): Participant
+            condition (str): Exposure condition
+            features (pd.DataFrame): window_features result
+
+        Returns:
+            int: Rows written
+        """
+        if features.empty:
+            return 0
+        index = self.read_index()
+        parts = index["partitions"].setdefault(participant, {}).setdefault(condition, [])
+
+        starts = features["window_start"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        new = ~pd.Series(starts).duplicated().to_numpy()
+        for part in parts:
+            overlaps = (starts >= part["first_ns"]) & (starts <= part["last_ns"])
+            if overlaps.any():
+                stored = self._read_part(part, ["window_start"])["window_start"]
+                new &= ~np.isin(starts, stored.to_numpy(dtype="datetime64[ns]").view(np.int64))
+        if not new.any():
+            return 0
+
+        rows = features[new].sort_values("window_start", kind="stable")
+        first, last = int(starts[new].min()), int(starts[new].max())
+        relative = os.path.join(participant, condition, f"part-{first}.parquet")
+        if any(part["file"] == relative for part in parts):
+            relative = os.path.join(participant, condition, f"part-{first}-{len(parts)}.parquet")
+        path = os.path.join(self.directory, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows.to_parquet(path, index=False)
+
+        parts.append({"file": relative, "rows": int(len(rows)), "first_ns": first, "last_ns": last,
+                      "columns": [str(col) for col in rows.columns]})
+        self._write_index(index)
+        return int(len(rows))
+
+    def _read_part(self, part: dict, columns: list = None) -> pd.DataFrame:
+        return pd.read_parquet(os.path.join(self.directory, part["file"]), columns=columns)
+
+    def load(self, participants=None, conditions=None, columns=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Read stored features, optionally only some partitions, columns and a window_start range.
+
+        Args:
+            participants (list): Participants to load, None for all
+            conditions (list): Conditions to load, None for all
+            columns (list): Feature columns to read, None for all (keys are always read)
+            start, end: Inclusive window_start range (anything pd.Timestamp accepts), None for open
+
+        Returns:
+            pd.DataFrame with KEY_COLUMNS and the features, sorted by the keys
+        """
+        first = pd.Timestamp(start).value if start is not None else None
+        last = pd.Timestamp(end).value if end is not None else None
+        frames = []
+        for participant, conditions_ in self.read_index()["partitions"].items():
+            if participants is not None and participant not in participants:
+                continue
+            for condition, parts in conditions_.items():
+                if conditions is not None and condition not in conditions:
+                    continue
+                for part in parts:
+                    if (first is not None and part["last_ns"] < first) or (last is not None and part["first_ns"] > last):
+                        continue
+                    read_cols = None
+                    if columns is not None:
+                        read_cols = ["window_start"] + [col for col in columns if col in part["columns"] and col != "window_start"]
+                    df = self._read_part(part, read_cols)
+                    frames.append(df.assign(participant=participant, condition=condition))
+
+        if not frames:
+            return pd.DataFrame(columns=KEY_COLUMNS)
+        table = pd.concat(frames, ignore_index=True)
+        if first is not None:
+            table = table[table["window_start"] >= pd.Timestamp(first)]
+        if last is not None:
+            table = table[table["window_start"] <= pd.Timestamp(last)]
+        ordered = KEY_COLUMNS + [col for col in table.columns if col not in KEY_COLUMNS]
+        return table[ordered].sort_values(KEY_COLUMNS, kind="stable").reset_index(drop=True)
+
+
+@timed("window_features", count_result=True)
+def extract_features(data: dict,
+                     window_s: float = WINDOW_S,
+                     step_s: float = WINDOW_STEP_S,
+                     sensors: list = WINDOW_SENSORS,
+                     features: list = WINDOW_FEATURES,
+                     table: FeatureTable = None,
+                     **kwargs) -> pd.DataFrame:
+    """
+    Window features of every participant and condition: the sensors are aligned per
+    condition (preprocessor.align_sensors), so windows carry exactly one condition label,
+    then windowed and featurised. With a table, each participant/condition is appended
+    to it as soon as it is computed.
+
+    Args:
+        data (dict): data[participant][condition][sensor] -> pd.DataFrame
+        window_s, step_s (float): See sliding_windows
+        sensors (list): Sensors to align and window together
+        features (list): See window_features
+        table (FeatureTable): Feature table to append to, or None
+        **kwargs: Passed to sliding_windows
+
+    Returns:
+        pd.DataFrame with KEY_COLUMNS and the features of every window computed
+    """
+    frames = []
+    for participant, conditions in data.items():
+        for condition in conditions:
+            aligned = align_sensors(conditions, condition, sensors=sensors)
+            with stage("windowing", rows=len(aligned)):
+                computed = window_features(sliding_windows(aligned, window_s, step_s, **kwargs), features)
+            if computed.empty:
+                continue
+            if table is not None:
+                written = table.append(participant, condition, computed)
+                logger.debug("%s %s: %d windows, %d new", participant, condition, len(computed), written)
+            frames.append(computed.assign(participant=participant, condition=condition))
+
+    if not frames:
+        return pd.DataFrame(columns=KEY_COLUMNS)
+    result = pd.concat(frames, ignore_index=True)
+    return result[KEY_COLUMNS + [col for col in result.columns if col not in KEY_COLUMNS]]
+
+
+class FeatureWriter:
+    """
+    Out-of-core extract_features into a FeatureTable: fed pieces of all_data (see
+    loader.iter_participant_data), it appends every piece to the table and keeps only
+    the number of windows written.
+
+    Example:
+        written, = consume_stream(iter_participant_data(by_condition=True), FeatureWriter(FeatureTable()))
+    """
+
+    def __init__(self, table: FeatureTable, **kwargs):
+        self.table = table
+        self.kwargs = kwargs
+        self.windows = 0
+
+    def update(self, data: dict):
+        """Add a piece of all_data."""
+        self.windows += len(extract_features(data, table=self.table, **self.kwargs))
+
+    def result(self) -> int:
+        """
+        Returns:
+            int: Windows computed (stored windows are skipped by the table, not recounted)
+        """
+        return self.windows
@@ -0,0 +1,449 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import (CONDITIONS, STREAM_CHUNK_ROWS, RESAMPLE_MAX_GAP_FACTOR, BEAT_IBI_RANGE_MS, BEAT_PROMINENCE,
+                    HRV_WINDOW_S, HRV_CHUNK_OVERLAP_S, FILTER_WORKERS, FILTER_EXECUTOR)
+from instrumentation import stage, timed
+from loader import stream_sensor_data, list_participants
+from preprocessor import (filter_ppg, find_segments, stream_time_ns, compute_sample_rate_from_timestamps_median,
+                          consume_stream)
+
+logger = logging.getLogger(__name__)
+
+BEAT_COLUMNS = ["time_ns", "phone_ns", "ibi_ms"]
+HRV_COLUMNS = ["window_start", "beats", "mean_ibi_ms", "mean_hr_bpm", "sdnn_ms", "rmssd_ms", "pnn50"]
+HR_COMPARISON_COLUMNS = ["device_hr_bpm", "hr_error_bpm"]
+
+# Per-window running sums, enough to finish every metric after any number of chunks
+_SUMS = ["n_ibi", "sum_ibi", "sumsq_ibi", "sum_hr", "n_diff", "sumsq_diff", "n_nn50"]
+
+
+def _phone_ns(df: pd.DataFrame, datetime_col: str = "phone_datetime") -> np.ndarray:
+    """Int64 nanoseconds of the phone timestamp column, NaT as int64 min."""
+    return stream_time_ns(df, time_col=None, datetime_col=datetime_col)[0]
+
+
+def detect_beats(filtered: pd.DataFrame,
+                 channel: str = "ppg_ch0",
+                 ibi_range_ms: tuple = BEAT_IBI_RANGE_MS,
+                 prominence: float = BEAT_PROMINENCE,
+                 invert: bool = False,
+                 max_gap_factor: float = RESAMPLE_MAX_GAP_FACTOR,
+                 time_col: str = "sensor_clock[ns]",
+                 datetime_col: str = "phone_datetime") -> pd.DataFrame:
+    """
+    Pulse peaks and inter-beat intervals of a bandpass filtered PPG channel.
+
+    Peaks are found by scipy's vectorised find_peaks on every continuous segment (NaN rows
+    of filter_ppg and recording gaps split segments), at least the shortest plausible IBI
+    apart and with a prominence of prominence x the segment's standard deviation. Peak
+    times are refined between samples with a parabola through the peak and its
+    neighbours. IBIs never span a segment boundary, and IBIs outside ibi_range_ms
+    (missed or spurious beats) are NaN.
+
+    Args:
+        filtered (pd.DataFrame): Output of preprocessor.filter_ppg
+        channel (str): Channel to detect beats on
+        ibi_range_ms (tuple): (min, max) plausible inter-beat interval
+        prominence (float): Minimum peak prominence in segment standard deviations
+        invert (bool): Detect troughs instead, for signals where blood volume lowers the value
+        max_gap_factor (float): Gap threshold in multiples of the median sample period
+        time_col (str): Sensor clock column
+        datetime_col (str): Phone timestamp column, used when time_col is absent
+
+    Returns:
+        pd.DataFrame with BEAT_COLUMNS: beat time on the stream's time base, beat time on
+        the phone clock and the interval to the previous beat, in time order
+    """
+    from scipy.signal import find_peaks  # ~1 s to import, only needed for beats
+
+    empty = pd.DataFrame({"time_ns": np.array([], dtype=np.int64), "phone_ns": np.array([], dtype=np.int64),
+                          "ibi_ms": np.array([], dtype=np.float64)})
+    if filtered.empty or channel not in filtered.columns:
+        return empty
+
+    times, used_col = stream_time_ns(filtered, time_col, datetime_col)
+    phone = _phone_ns(filtered, datetime_col) if used_col == time_col and datetime_col in filtered.columns else times
+    values = filtered[channel].to_numpy(dtype=np.float64)
+    if invert:
+        values = -values
+
+    valid = np.isfinite(values) & (phone != np.iinfo(np.int64).min)
+    rows = np.flatnonzero(valid)
+    if (np.diff(times[rows]) < 0).any():
+        rows = rows[np.argsort(times[rows], kind="stable")]
+    times, phone, values = times[rows], phone[rows], values[rows]
+
+    rate = compute_sample_rate_from_timestamps_median(times)
+    if rate is None:
+        return empty
+    min_distance = max(1, int(ibi_range_ms[0] / 1000 * rate))
+
+    beat_times, beat_phone, beat_ibi = [], [], []
+    for start, stop in find_segments(times, max_gap_factor * 1e9 / rate):
+        if stop - start < 3:
+            continue
+        x, t = values[start:stop], times[start:stop]
+        peaks, _ = find_peaks(x, distance=min_distance, prominence=prominence * x.std())
+        peaks = peaks[(peaks > 0) & (peaks < len(x) - 1)]
+        if len(peaks) == 0:
+            continue
+
+        # Parabolic interpolation, delta in [-0.5, 0.5] samples from the peak sample
+        a, b, c = x[peaks - 1], x[peaks], x[peaks + 1]
+        curvature = a - 2 * b + c
+        delta = np.divide(0.5 * (a - c), curvature, out=np.zeros(len(peaks)), where=curvature != 0)
+        peak_t = t[peaks] + np.round(delta * (t[peaks + 1] - t[peaks - 1]) / 2).astype(np.int64)
+
+        ibi = np.empty(len(peaks))
+        ibi[0] = np.nan
+        ibi[1:] = np.diff(peak_t) / 1e6
+        # The phone clock jitters by milliseconds, beats are placed on it with the segment's offset
+        offset = int(np.median(phone[start:stop] - t))
+        beat_times.append(peak_t)
+        beat_phone.append(peak_t + offset)
+        beat_ibi.append(ibi)
+
+    if not beat_times:
+        return empty
+    ibi = np.concatenate(beat_ibi)
+    ibi[(ibi < ibi_range_ms[0]) | (ibi > ibi_range_ms[1])] = np.nan
+    return pd.DataFrame({"time_ns": np.concatenate(beat_times), "phone_ns": np.concatenate(beat_phone), "ibi_ms": ibi})
+
+
+def _window_sums(beats: pd.DataFrame, window_ns: int, counted: np.ndarray = None):
+    """
+    Per phone-time window sums (_SUMS) of the beats where counted is True. A successive
+    IBI difference belongs to the window of its later beat.
+
+    Returns:
+        (np.ndarray window indices, np.ndarray sums of shape (n_windows, len(_SUMS)))
+    """
+    ibi = beats["ibi_ms"].to_numpy(dtype=np.float64)
+    diff = np.full(len(ibi), np.nan)
+    diff[1:] = ibi[1:] - ibi[:-1]
+    counted = np.ones(len(ibi), dtype=bool) if counted is None else counted
+
+    has_ibi = np.isfinite(ibi) & counted
+    has_diff = np.isfinite(diff) & counted
+    keep = has_ibi | has_diff
+    if not keep.any():
+        return np.array([], dtype=np.int64), np.zeros((0, len(_SUMS)))
+
+    windows, local = np.unique(beats["phone_ns"].to_numpy()[keep] // window_ns, return_inverse=True)
+    ibi, diff = np.where(has_ibi, ibi, 0.0)[keep], np.where(has_diff, diff, 0.0)[keep]
+    has_ibi, has_diff = has_ibi[keep], has_diff[keep]
+    hr = np.divide(60_000.0, ibi, out=np.zeros(len(ibi)), where=has_ibi)
+
+    weights = [has_ibi, ibi, ibi ** 2, hr, has_diff, diff ** 2, has_diff & (np.abs(diff) > 50)]
+    sums = np.column_stack([np.bincount(local, weights=w.astype(np.float64), minlength=len(windows))
+                            for w in weights])
+    return windows, sums
+
+
+def _hrv_frame(windows: dict, window_ns: int) -> pd.DataFrame:
+    """Finish the per-window sums into HRV_COLUMNS, one row per window in time order."""
+    if not windows:
+        return pd.DataFrame({col: pd.Series(dtype="datetime64[ns]" if col == "window_start" else "float64")
+                             for col in HRV_COLUMNS})
+    index = np.array(sorted(windows), dtype=np.int64)
+    n, total, total_sq, total_hr, n_diff, diff_sq, nn50 = np.array([windows[i] for i in index]).T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_ibi = np.where(n > 0, total / n, np.nan)
+        variance = np.where(n > 1, np.maximum(total_sq - total ** 2 / n, 0.0) / (n - 1), np.nan)
+        return pd.DataFrame({
+            "window_start": pd.to_datetime(index * window_ns, unit="ns"),
+            "beats": n.astype(np.int64),
+            "mean_ibi_ms": mean_ibi,
+            "mean_hr_bpm": np.where(n > 0, total_hr / n, np.nan),
+            "sdnn_ms": np.sqrt(variance),
+            "rmssd_ms": np.where(n_diff > 0, np.sqrt(diff_sq / n_diff), np.nan),
+            "pnn50": np.where(n_diff > 0, 100 * nn50 / n_diff, np.nan),
+        })
+
+
+class StreamingHRV:
+    """
+    Windowed HRV (HRV_COLUMNS) over a stream of raw PPG chunks in bounded memory.
+
+    Each chunk is filtered (preprocessor.filter_ppg) together with the last overlap_s of
+    raw samples carried over from the previous one, so the zero-phase filter has context
+    on both sides of the chunk boundary. Beats are only counted once they are more than
+    overlap_s / 2 from the end of the filtered data; the rest are counted from the next,
+    better filtered frame, or by result() at the end of the stream. Only the carried
+    samples and per-window sums are kept between chunks, so windows spanning chunks come
+    out the same as with the whole stream at once.
+    """
+
+    def __init__(self,
+                 window_s: float = HRV_WINDOW_S,
+                 overlap_s: float = HRV_CHUNK_OVERLAP_S,
+                 channel: str = "ppg_ch0",
+                 time_col: str = "sensor_clock[ns]",
+                 datetime_col: str = "phone_datetime",
+                 filter_kwargs: dict = None,
+                 **beat_kwargs):
+        """
+        Args:
+            window_s (float): HRV window length, windows start at multiples of it on the phone clock
+            overlap_s (float): Raw samples carried between chunks
+            channel (str): PPG channel to detect beats on
+            time_col, datetime_col (str): See preprocessor.filter_ppg
+            filter_kwargs (dict): Passed to preprocessor.filter_ppg
+            **beat_kwargs: Passed to detect_beats
+        """
+        self.window_ns = int(window_s * 1e9)
+        self.overlap_ns = int(overlap_s * 1e9)
+        self.channel = channel
+        self.time_col = time_col
+        self.datetime_col = datetime_col
+        self.filter_kwargs = filter_kwargs or {}
+        self.beat_kwargs = beat_kwargs
+        self.windows = {}
+        self.n_beats = 0
+        self._tail = None
+        self._pending = None
+        self._counted_until = None
+
+    def _count(self, beats: pd.DataFrame, until: int = None):
+        times = beats["time_ns"].to_numpy()
+        counted = np.ones(len(times), dtype=bool)
+        if self._counted_until is not None:
+            counted &= times > self._counted_until
+        if until is not None:
+            counted &= times <= until
+            self._counted_until = until if self._counted_until is None else max(self._counted_until, until)
+
+        windows, sums = _window_sums(beats, self.window_ns, counted)
+        for window, window_sums in zip(windows.tolist(), sums):
+            self.windows[window] = self.windows[window] + window_sums if window in self.windows else window_sums
+        self.n_beats += int(counted.sum())
+
+    def update(self, chunk: pd.DataFrame):
+        """Add the next chunk of the PPG stream, in clock order."""
+        if chunk.empty:
+            return
+        frame = chunk if self._tail is None else pd.concat([self._tail, chunk], ignore_index=True)
+        filtered = filter_ppg(frame, channels=[self.channel], time_col=self.time_col,
+                              datetime_col=self.datetime_col, **self.filter_kwargs)
+        beats = detect_beats(filtered, self.channel, time_col=self.time_col, datetime_col=self.datetime_col,
+                             **self.beat_kwargs)
+
+        times, _ = stream_time_ns(frame, self.time_col, self.datetime_col)
+        end = times.max()
+        self._count(beats, until=end - self.overlap_ns // 2)
+        self._tail = frame[times >= end - self.overlap_ns]
+        self._pending = beats
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame with HRV_COLUMNS, one row per window with beats
+        """
+        if self._pending is not None:
+            self._count(self._pending)
+            self._pending = None
+        return _hrv_frame(self.windows, self.window_ns)
+
+
+def device_heart_rate(hr_df: pd.DataFrame,
+                      window_s: float = HRV_WINDOW_S,
+                      hr_col: str = "heart_rate[bpm]",
+                      datetime_col: str = "phone_datetime") -> pd.DataFrame:
+    """
+    Mean of the device HR stream per phone-time window, on the windows of StreamingHRV.
+
+    Returns:
+        pd.DataFrame with window_start and device_hr_bpm
+    """
+    window_ns = int(window_s * 1e9)
+    if hr_df is None or hr_df.empty or hr_col not in hr_df.columns:
+        return pd.DataFrame({"window_start": pd.Series(dtype="datetime64[ns]"),
+                             "device_hr_bpm": pd.Series(dtype="float64")})
+    phone = _phone_ns(hr_df, datetime_col)
+    hr = hr_df[hr_col].to_numpy(dtype=np.float64)
+    valid = np.isfinite(hr) & (phone != np.iinfo(np.int64).min) & (hr > 0)
+    windows, local = np.unique(phone[valid] // window_ns, return_inverse=True)
+    mean = np.bincount(local, weights=hr[valid], minlength=len(windows)) / np.bincount(local, minlength=len(windows))
+    return pd.DataFrame({"window_start": pd.to_datetime(windows * window_ns, unit="ns"), "device_hr_bpm": mean})
+
+
+def compare_heart_rate(hrv: pd.DataFrame, hr_df: pd.DataFrame, window_s: float = HRV_WINDOW_S, **kwargs) -> pd.DataFrame:
+    """
+    Add the device HR of every HRV window and the PPG-derived minus device HR.
+
+    Args:
+        hrv (pd.DataFrame): StreamingHRV / compute_hrv result
+        hr_df (pd.DataFrame): Device HR stream (heart_rate[bpm]), None for no comparison
+        window_s (float): Window length hrv was computed with
+        **kwargs: Passed to device_heart_rate
+
+    Returns:
+        pd.DataFrame with HRV_COLUMNS + HR_COMPARISON_COLUMNS
+    """
+    device = device_heart_rate(hr_df, window_s, **kwargs)
+    compared = hrv.merge(device, on="window_start", how="left")
+    compared["hr_error_bpm"] = compared["mean_hr_bpm"] - compared["device_hr_bpm"]
+    return compared
+
+
+def compute_hrv(ppg_df: pd.DataFrame, hr_df: pd.DataFrame = None, window_s: float = HRV_WINDOW_S, **kwargs) -> pd.DataFrame:
+    """
+    Windowed HRV of one in-memory PPG stream, compared with the device HR stream.
+
+    Args:
+        ppg_df (pd.DataFrame): Raw PPG stream, e.g. all_data[participant][condition]["ppg"]
+        hr_df (pd.DataFrame): Device HR stream of the same condition, or None
+        window_s (float): HRV window length
+        **kwargs: Passed to StreamingHRV
+
+    Returns:
+        pd.DataFrame with HRV_COLUMNS + HR_COMPARISON_COLUMNS
+    """
+    accumulator = StreamingHRV(window_s, **kwargs)
+    accumulator.update(ppg_df)
+    return compare_heart_rate(accumulator.result(), hr_df, window_s)
+
+
+def _hrv_partition(task):
+    participant, condition, ppg_df, hr_df, kwargs = task
+    with stage("hrv", rows=len(ppg_df)):
+        return participant, condition, compute_hrv(ppg_df, hr_df, **kwargs)
+
+
+def _table(results) -> pd.DataFrame:
+    frames = [table.assign(participant=participant, condition=condition)
+              for participant, condition, table in results if not table.empty]
+    columns = ["participant", "condition"] + HRV_COLUMNS + HR_COMPARISON_COLUMNS
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def _pool(executor: str):
+    if executor == "process":
+        return ProcessPoolExecutor
+    if executor == "thread":
+        return ThreadPoolExecutor
+    raise ValueError(f"Unknown executor '{executor}'. Use 'process' or 'thread'.")
+
+
+@timed("hrv_table", count_result=True)
+def compute_hrv_table(data: dict,
+                      window_s: float = HRV_WINDOW_S,
+                      workers: int = FILTER_WORKERS,
+                      executor: str = FILTER_EXECUTOR,
+                      **kwargs) -> pd.DataFrame:
+    """
+    compute_hrv for every participant and condition with PPG data, partitions in parallel.
+
+    Args:
+        data (dict): data[participant][condition][sensor] -> pd.DataFrame
+        window_s (float): HRV window length
+        workers (int): Partitions processed at once, 1 processes serially
+        executor (str): "thread" or "process"
+        **kwargs: Passed to StreamingHRV
+
+    Returns:
+        pd.DataFrame with participant, condition, HRV_COLUMNS and HR_COMPARISON_COLUMNS
+    """
+    tasks = [(participant, condition, streams["ppg"], streams.get("hr"), {"window_s": window_s, **kwargs})
+             for participant, conditions in data.items()
+             for condition, streams in conditions.items()
+             if streams.get("ppg") is not None]
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        return _table(_hrv_partition(task) for task in tasks)
+    with _pool(executor)(max_workers=workers) as pool:
+        return _table(list(pool.map(_hrv_partition, tasks)))
+
+
+class HRVTable:
+    """
+    Out-of-core compute_hrv_table: fed pieces of all_data (see loader.iter_participant_data),
+    it keeps only the HRV rows.
+    """
+
+    def __init__(self, window_s: float = HRV_WINDOW_S, **kwargs):
+        self.window_s = window_s
+        self.kwargs = kwargs
+        self.tables = []
+
+    def update(self, data: dict):
+        """Add a piece of all_data."""
+        self.tables.append(compute_hrv_table(data, self.window_s, **self.kwargs))
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame as compute_hrv_table
+        """
+        tables = [table for table in self.tables if not table.empty]
+        if not tables:
+            return pd.DataFrame(columns=["participant", "condition"] + HRV_COLUMNS + HR_COMPARISON_COLUMNS)
+        return pd.concat(tables, ignore_index=True)
+
+
+def stream_hrv(participant: str,
+               condition: str,
+               window_s: float = HRV_WINDOW_S,
+               chunk_rows: int = STREAM_CHUNK_ROWS,
+               data_dir: str = None,
+               **kwargs) -> pd.DataFrame:
+    """
+    compute_hrv of one participant/condition streamed from the raw files in chunks of
+    chunk_rows, so multi-hour sessions never have to fit in memory at once.
+
+    Returns:
+        pd.DataFrame with HRV_COLUMNS + HR_COMPARISON_COLUMNS
+    """
+    hrv, = consume_stream(stream_sensor_data(participant, condition, "ppg", chunk_rows, data_dir=data_dir),
+                          StreamingHRV(window_s, **kwargs))
+    # The HR stream is 1 Hz, small enough to read whole
+    hr_chunks = list(stream_sensor_data(participant, condition, "hr", chunk_rows, data_dir=data_dir))
+    hr_df = pd.concat(hr_chunks, ignore_index=True) if hr_chunks else None
+    return compare_heart_rate(hrv, hr_df, window_s)
+
+
+def _stream_partition(task):
+    participant, condition, kwargs = task
+    with stage("hrv"):
+        return participant, condition, stream_hrv(participant, condition, **kwargs)
+
+
+@timed("hrv_table", count_result=True)
+def stream_hrv_table(participants: list = None,
+                     conditions: list = None,
+                     window_s: float = HRV_WINDOW_S,
+                     chunk_rows: int = STREAM_CHUNK_ROWS,
+                     data_dir: str = None,
+                     workers: int = FILTER_WORKERS,
+                     executor: str = "process",
+                     **kwargs) -> pd.DataFrame:
+    """
+    HRV table of the cohort streamed from the raw files (see stream_hrv), participant/
+    condition partitions in parallel. Peak memory is about workers x chunk_rows rows.
+
+    Args:
+        participants (list): Participants to use, default all in data_dir
+        conditions (list): Conditions to use, default config.CONDITIONS
+        window_s (float): HRV window length
+        chunk_rows (int): PPG rows read at a time
+        data_dir (str): Root data directory, defaults to config.DATA_DIR
+        workers (int): Partitions processed at once, 1 processes serially
+        executor (str): "process" or "thread"
+        **kwargs: Passed to StreamingHRV
+
+    Returns:
+        pd.DataFrame as compute_hrv_table
+    """
+    participants = participants or list_participants(data_dir)
+    kwargs = {"window_s": window_s, "chunk_rows": chunk_rows, "data_dir": data_dir, **kwargs}
+    tasks = [(participant, condition, kwargs) for participant in participants for condition in conditions or CONDITIONS]
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        return _table(_stream_partition(task) for task in tasks)
+    with _pool(executor)(max_workers=workers) as pool:
+        return _table(list(pool.map(_stream_partition, tasks)))
@@ -0,0 +1,250 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from config import LOG_LEVEL, PROFILE_STAGES, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Send the log records of every module to stderr at the given level ("DEBUG", "INFO", ...)."""
+    logging.basicConfig(level=level, format=LOG_FORMAT, force=True)
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of the whole process so far (a high-water mark, not a per
+    stage figure), None where it can't be measured.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def data_size(obj) -> tuple:
+    """
+    (rows, bytes) of a DataFrame, or summed over a nested dict/list of DataFrames.
+    Bytes are the shallow memory_usage, cheap enough to call on every stage.
+    Anything else (including lazy datasets, which would be loaded) counts as 0.
+    """
+    # Duck typed so that this module (imported by the CLI at startup) doesn't need pandas
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+        return len(obj), int(obj.memory_usage(index=True, deep=False).sum())
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if not isinstance(obj, (list, tuple)):
+        return 0, 0
+    rows = n_bytes = 0
+    for value in obj:
+        value_rows, value_bytes = data_size(value)
+        rows += value_rows
+        n_bytes += value_bytes
+    return rows, n_bytes
+
+
+class RunReport:
+    """
+    Records of every instrumented stage of a run, thread safe.
+
+    Each record has the stage name, its parent stage, wall time, rows and bytes processed,
+    throughput, the process peak RSS so far at the end of the stage and how much the stage
+    raised that peak (0 when it stayed below an earlier high-water mark).
+    """
+
+    def __init__(self):
+        self.records = []
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+            self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def totals(self) -> dict:
+        """Per stage name: calls, total seconds, rows, bytes, throughput, process peak RSS and peak growth."""
+        with self._lock:
+            records = list(self.records)
+        totals = {}
+        for record in records:
+            total = totals.setdefault(record["stage"], {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0,
+                                                        "process_peak_rss_bytes": None,
+                                                        "peak_rss_growth_bytes": None})
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            total["rows"] += record["rows"] or 0
+            total["bytes"] += record["bytes"] or 0
+            if record["process_peak_rss_bytes"] is not None:
+                total["process_peak_rss_bytes"] = max(total["process_peak_rss_bytes"] or 0,
+                                                      record["process_peak_rss_bytes"])
+                total["peak_rss_growth_bytes"] = (total["peak_rss_growth_bytes"] or 0) + record["peak_rss_growth_bytes"]
+        for total in totals.values():
+            total["rows_per_second"] = total["rows"] / total["seconds"] if total["seconds"] else None
+            total["bytes_per_second"] = total["bytes"] / total["seconds"] if total["seconds"] else None
+        return totals
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+        return {"started": self.started, "pid": os.getpid(), "stages": records, "totals": self.totals()}
+
+    def write(self, path: str):
+        """Write the report as JSON."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2, default=str)
+        logger.info("Run report written: %s", path)
+
+
+# Report every stage of this process is recorded in unless another one is passed
+REPORT = RunReport()
+
+_active = threading.local()
+
+
+class StageTimer:
+    """Handle yielded by stage(): add the rows/bytes processed as they become known."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.bytes = None
+        self.extra = {}
+
+    def add(self, rows: int = None, n_bytes: int = None, **extra):
+        if rows is not None:
+            self.rows = (self.rows or 0) + int(rows)
+        if n_bytes is not None:
+            self.bytes = (self.bytes or 0) + int(n_bytes)
+        self.extra.update(extra)
+
+    def add_data(self, obj):
+        """Count the rows and bytes of a DataFrame or nested dict of DataFrames."""
+        rows, n_bytes = data_size(obj)
+        self.add(rows, n_bytes)
+
+
+@contextmanager
+def stage(name: str, rows: int = None, n_bytes: int = None, profile: str = None, report: RunReport = None):
+    """
+    Time a block as a named stage and record it in the run report.
+
+    Example:
+        with stage("parse") as timer:
+            frames = parse(...)
+            timer.add_data(frames)
+
+    Args:
+        name (str): Stage name
+        rows, n_bytes (int): Rows/bytes processed, if known up front (see StageTimer.add)
+        profile (str): "cprofile" or "tracemalloc" to profile this call, default from
+                       config.PROFILE_STAGES. cProfile stats are written to
+                       PROFILE_DIR/<stage>.prof, the tracemalloc peak is recorded.
+        report (RunReport): Report to record into, default REPORT
+
+    Yields:
+        StageTimer
+    """
+    report = report or REPORT
+    timer = StageTimer(name)
+    timer.add(rows, n_bytes)
+    profile = profile or PROFILE_STAGES.get(name)
+
+    stack = getattr(_active, "stack", None)
+    if stack is None:
+        stack = _active.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+
+    profiler = None
+    started_tracemalloc = False
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active (nested profiled stage)
+            profiler = None
+    elif profile == "tracemalloc":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        tracemalloc.reset_peak()
+
+    rss_before = peak_rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile_file = os.path.join(PROFILE_DIR, f"{name}.prof")
+            profiler.dump_stats(profile_file)
+            timer.extra["profile_file"] = profile_file
+            logger.info("cProfile stats of stage %s written: %s", name, profile_file)
+        elif profile == "tracemalloc":
+            timer.extra["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        rss_after = peak_rss_bytes()
+        record = {
+            "stage": name,
+            "parent": parent,
+            "seconds": seconds,
+            "rows": timer.rows,
+            "bytes": timer.bytes,
+            "rows_per_second": timer.rows / seconds if timer.rows is not None and seconds else None,
+            "bytes_per_second": timer.bytes / seconds if timer.bytes is not None and seconds else None,
+            "process_peak_rss_bytes": rss_after,
+            "peak_rss_growth_bytes": rss_after - rss_before if rss_after is not None else None,
+            **timer.extra,
+        }
+        report.add(record)
+        logger.debug("Stage %s: %.3f s, %s rows, %s bytes", name, seconds, timer.rows, timer.bytes)
+
+
+def timed(name: str = None, count_result: bool = False):
+    """
+    Decorator version of stage().
+
+    Args:
+        name (str): Stage name, default the function name
+        count_result (bool): Record the rows/bytes of the returned DataFrame(s)
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as timer:
+                result = func(*args, **kwargs)
+                if count_result:
+                    timer.add_data(result)
+                return result
+        return wrapper
+    return decorator
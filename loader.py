@@ -1,7 +1,24 @@
+import hashlib
+import logging
 import os
+import numpy as np
 import pandas as pd
 import re
-from config import DATA_DIR, CONDITIONS, SENSOR_TYPES
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from config import (
+    DATA_DIR, CONDITIONS, SENSOR_TYPES, LOAD_WORKERS, LOAD_EXECUTOR, STREAM_CHUNK_ROWS, PARSE_ENGINE, SEGMENT_GAP_NS
+)
+from instrumentation import stage, timed
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
 
 COLUMN_MAPPING = {
     # ACC
@@ -18,9 +35,41 @@ COLUMN_MAPPING = {
     "ambient": "ppg_amb",
     
     # HR
-    "HR [bpm]": "heart_rate[bpm]"
+    "HR [bpm]": "heart_rate[bpm]",
+
+    # GYRO
+    "X [dps]": "gyro_x[dps]",
+    "Y [dps]": "gyro_y[dps]",
+    "Z [dps]": "gyro_z[dps]",
 }
 
+# Column dtypes applied at parse time, per sensor type. phone_datetime is parsed to
+# datetime64[ns] separately. Integer columns fall back to float32 when they hold NaNs.
+SENSOR_SCHEMAS = {
+    "acc": {"sensor_clock[ns]": "int64", "acc_x[mg]": "float32", "acc_y[mg]": "float32", "acc_z[mg]": "float32"},
+    "ppg": {"sensor_clock[ns]": "int64", "ppg_ch0": "int32", "ppg_ch1": "int32", "ppg_ch2": "int32", "ppg_amb": "int32"},
+    "hr": {"heart_rate[bpm]": "float32"},
+    "gyro": {"sensor_clock[ns]": "int64", "gyro_x[dps]": "float32", "gyro_y[dps]": "float32", "gyro_z[dps]": "float32"},
+}
+
+# pandas deep-copies DataFrame.attrs on every slice and column access, so the source file
+# ranges and the segment index are kept there as shared read-only structured arrays
+# (_RecordTable), never as lists of dicts. Use get_/set_source_files and get_/set_segments.
+
+# Key in DataFrame.attrs holding the row range of every source file
+SOURCE_FILES_ATTR = "source_files"
+SOURCE_FILE_COLUMNS = ["file_id", "file", "start", "stop"]
+
+# Key in DataFrame.attrs holding the segment index, see build_segments
+SEGMENTS_ATTR = "segments"
+SEGMENT_COLUMNS = [
+    "file_id", "file", "start_row", "stop_row", "samples",
+    "start_clock_ns", "end_clock_ns", "start_phone_ns", "end_phone_ns", "gap_before_ns",
+]
+
+# Stands in for None in the integer fields of the packed tables
+_MISSING = np.iinfo(np.int64).min
+
 
 def clean_col_names(df: pd.DataFrame) -> pd.DataFrame:
     """Rename columns using a predefined mapping and strip whitespaces."""
@@ -31,54 +80,738 @@ def clean_col_names(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def load_data_for_participant(participant_dir: str) -> dict:
+def apply_schema(df: pd.DataFrame, sensor: str) -> pd.DataFrame:
     """
-     Loads and categorizes data for a given subject. 
+    Cast columns to the compact dtypes of SENSOR_SCHEMAS[sensor] and parse phone_datetime.
 
     Args:
-        participant_dir: str - directory of files
+        df: pd.DataFrame - frame with cleaned column names
+        sensor: str - sensor type key, unknown sensors only get phone_datetime parsed
 
     Returns:
-        dict([condition][sensor_type][sensor_df])        
+        pd.DataFrame
+    """
+    if "phone_datetime" in df.columns:
+        if not pd.api.types.is_datetime64_any_dtype(df["phone_datetime"]):
+            df["phone_datetime"] = pd.to_datetime(df["phone_datetime"], format="ISO8601", errors="coerce")
+        if df["phone_datetime"].dtype != "datetime64[ns]":
+            df["phone_datetime"] = df["phone_datetime"].astype("datetime64[ns]")
+
+    for col, dtype in SENSOR_SCHEMAS.get(sensor, {}).items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if np.dtype(dtype).kind == "i" and values.isna().any():
+            dtype = "float32" if dtype == "int32" else "float64"
+        df[col] = values.astype(dtype)
+
+    return df
+
+
+def _parse_pandas(file_path: str, sensor: str) -> pd.DataFrame:
+    """Generic pandas parser, keeps every column of the file."""
+    df = pd.read_csv(file_path, delimiter=";", header="infer")
+    return clean_col_names(df)
+
+
+def _parse_pyarrow(file_path: str, sensor: str) -> pd.DataFrame:
+    """pyarrow csv parser with multithreaded block parsing and the sensor schema applied while parsing."""
+    if pa_csv is None:
+        return _parse_pandas(file_path, sensor)
+
+    raw_names = {clean: raw for raw, clean in COLUMN_MAPPING.items()}
+    column_types = {raw_names[col]: pa.from_numpy_dtype(np.dtype(dtype))
+                    for col, dtype in SENSOR_SCHEMAS.get(sensor, {}).items() if col in raw_names}
+    column_types[raw_names["phone_datetime"]] = pa.timestamp("ns")
+
+    table = pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter=";"),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types),
+    )
+    return clean_col_names(table.to_pandas())
+
+
+def _parse_numeric(file_path: str, sensor: str) -> pd.DataFrame:
+    """
+    Specialised parser for the fixed Polar layout. Only phone_datetime and the columns of
+    SENSOR_SCHEMAS[sensor] are read, straight into typed arrays in a single numpy pass;
+    other columns are dropped. Raises on anything unexpected, e.g. empty fields.
     """
-    data = {category: {key: pd.DataFrame() for key in SENSOR_TYPES.keys()} for category in CONDITIONS}
+    with open(file_path, "r") as f:
+        header = f.readline()
+    names = [COLUMN_MAPPING.get(col.strip(), col.strip()) for col in header.rstrip("\r\n").split(";")]
 
+    schema = dict(SENSOR_SCHEMAS.get(sensor, {}), phone_datetime="datetime64[ns]")
+    fields = [(i, name) for i, name in enumerate(names) if name in schema]
+    if not fields:
+        raise ValueError(f"No known columns in header of {file_path}")
+
+    dtype = np.dtype([(name, schema[name]) for _, name in fields])
+    records = np.loadtxt(file_path, delimiter=";", skiprows=1, usecols=[i for i, _ in fields], dtype=dtype, ndmin=1)
+    return pd.DataFrame({name: np.ascontiguousarray(records[name]) for name in dtype.names}, copy=False)
+
+
+# Parse engines selectable with config.PARSE_ENGINE or the engine argument of the loaders
+PARSE_ENGINES = {
+    "pandas": _parse_pandas,
+    "pyarrow": _parse_pyarrow,
+    "numeric": _parse_numeric,
+}
+
+
+def read_sensor_file(file_path: str, sensor: str = None, engine: str = PARSE_ENGINE) -> pd.DataFrame:
+    """
+    Parse a single semicolon delimited Polar export, clean its column names and
+    apply the sensor's typed schema.
+
+    Args:
+        file_path: str - path to the *.txt export
+        sensor: str - sensor type key, classified from the filename if None
+        engine: str - "pandas", "pyarrow" or "numeric", see PARSE_ENGINES. The fast
+                      engines fall back to pandas for files they can't parse.
+
+    Returns:
+        pd.DataFrame
+    """
+    if engine not in PARSE_ENGINES:
+        raise ValueError(f"Unknown parse engine '{engine}'. Use one of {list(PARSE_ENGINES)}.")
+
+    sensor = sensor or classify_file(os.path.basename(file_path))
+    try:
+        df = PARSE_ENGINES[engine](file_path, sensor)
+    except Exception as e:
+        if engine == "pandas":
+            raise
+        logger.warning("%s engine failed on %s (%s), falling back to pandas.", engine, file_path, type(e).__name__)
+        df = _parse_pandas(file_path, sensor)
+
+    return apply_schema(df, sensor)
+
+
+def _safe_read_sensor_file(file_path: str, engine: str = PARSE_ENGINE):
+    """Parse a file, returning (df, None) on success or (None, error message) on failure."""
+    try:
+        return read_sensor_file(file_path, engine=engine), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def classify_file(filename: str):
+    """
+    Match a filename against SENSOR_TYPES.
+
+    Returns:
+        str sensor type key, or None if the file is not a recognised sensor export
+    """
+    for key, pattern in SENSOR_TYPES.items():
+        if re.search(pattern, filename):
+            return key
+    return None
+
+
+def _list_participant_files(participant_dir: str, data_dir: str = None) -> list:
+    """
+    List the sensor files of a participant in a deterministic (sorted) order.
+    Files are classified by name only, anything not matching SENSOR_TYPES is skipped
+    without being read.
+
+    Returns:
+        list of (category, sensor_type, filename, file_path) tuples
+    """
+    data_dir = data_dir or DATA_DIR
+    files = []
     for category in CONDITIONS:
-        category_path = os.path.join(DATA_DIR, participant_dir, category)
+        category_path = os.path.join(data_dir, participant_dir, category)
         if not os.path.exists(category_path):
-            print(f"Missing category: {category} for {participant_dir}")
+            logger.debug("Missing category: %s for %s", category, participant_dir)
             continue
 
-        for filename in os.listdir(category_path):
-            file_path = os.path.join(category_path, filename)
+        for filename in sorted(os.listdir(category_path)):
+            key = classify_file(filename)
+            if key is None:
+                continue
+            files.append((category, key, filename, os.path.join(category_path, filename)))
+
+    return files
+
+
+def _file_size(file_path: str) -> int:
+    """Size of a file for the instrumentation, 0 if it can't be stat'ed (the parse reports the error)."""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def parse_files(file_paths: list, workers: int = 1, executor: str = "process", engine: str = PARSE_ENGINE) -> list:
+    """
+    Parse files serially or with a worker pool, isolating per-file errors.
+
+    Args:
+        file_paths: list - paths to parse
+        workers: int - number of workers, 1 parses serially in this process
+        executor: str - "process" or "thread"
+        engine: str - parse engine, see PARSE_ENGINES
+
+    Returns:
+        list of pd.DataFrame (or None for files that failed), in the order of file_paths
+    """
+    read = partial(_safe_read_sensor_file, engine=engine)
+    # Bytes are the raw file sizes read, rows the parsed rows
+    with stage("parse", n_bytes=sum(_file_size(path) for path in file_paths)) as timer:
+        if workers is None or workers <= 1 or len(file_paths) <= 1:
+            results = [read(path) for path in file_paths]
+        else:
+            if executor == "process":
+                pool_cls = ProcessPoolExecutor
+            elif executor == "thread":
+                pool_cls = ThreadPoolExecutor
+            else:
+                raise ValueError(f"Unknown executor '{executor}'. Use 'process' or 'thread'.")
+
+            with pool_cls(max_workers=workers) as pool:
+                # map preserves input order so the assembled frames are deterministic
+                results = list(pool.map(read, file_paths))
+
+        frames = []
+        for path, (df, error) in zip(file_paths, results):
+            if error is not None:
+                logger.warning("Failed to parse %s (%s), skipping.", path, error)
+            frames.append(df)
+        timer.add(rows=sum(len(df) for df in frames if df is not None), files=len(file_paths))
+
+    return frames
+
+
+class _RecordTable:
+    """
+    Read-only structured array of records kept in DataFrame.attrs: "file" as fixed-width
+    text ("" for None), every other column as int64 (_MISSING for None).
+
+    Deep copies share the table and equality compares values, so pandas can copy and
+    compare attrs (on every slice, column access and concat) at constant cost.
+    """
+
+    __slots__ = ("array",)
+
+    def __init__(self, records: list, columns: list):
+        width = max((len(record["file"] or "") for record in records), default=0) or 1
+        dtype = [(col, f"U{width}" if col == "file" else np.int64) for col in columns]
+        rows = [
+            tuple((record[col] or "") if col == "file" else (_MISSING if record[col] is None else record[col])
+                  for col in columns)
+            for record in records
+        ]
+        self.array = np.array(rows, dtype=dtype)
+        self.array.flags.writeable = False
+
+    def __deepcopy__(self, memo):
+        return self
 
-            # Debugging: Print the detected files
-            print(f"Checking file: {filename} in {category}")
+    def __eq__(self, other):
+        return isinstance(other, _RecordTable) and np.array_equal(self.array, other.array)
 
-            df = pd.read_csv(file_path, delimiter=";", header="infer")
-            df = clean_col_names(df)
+    def __len__(self):
+        return len(self.array)
 
-            for key, pattern in SENSOR_TYPES.items():
-                if re.search(pattern, filename):
-                    print(f"File matched pattern {key}: {filename}")
-                    data[category][key] = pd.concat([data[category][key], df], axis=0)
+    def records(self) -> list:
+        """The records as dicts with None for missing values."""
+        names = self.array.dtype.names
+        return [
+            {col: (value or None) if col == "file" else (None if value == _MISSING else value)
+             for col, value in zip(names, row)}
+            for row in self.array.tolist()
+        ]
+
+
+def _records(table) -> list:
+    """Records of an attrs entry, [] if missing."""
+    if table is None:
+        return []
+    if isinstance(table, list):  # frames pickled before the tables were packed
+        return table
+    return table.records()
+
+
+def set_source_files(df: pd.DataFrame, source_files: list):
+    """Record the row range of every source file of df, see SOURCE_FILE_COLUMNS."""
+    df.attrs[SOURCE_FILES_ATTR] = _RecordTable(source_files, SOURCE_FILE_COLUMNS)
+
+
+def get_source_files(df: pd.DataFrame) -> list:
+    """Row ranges of the source files of df as dicts with SOURCE_FILE_COLUMNS keys, [] if unknown."""
+    return _records(df.attrs.get(SOURCE_FILES_ATTR))
+
+
+def set_segments(df: pd.DataFrame, segments: list):
+    """Record the segment index of df, see build_segments."""
+    df.attrs[SEGMENTS_ATTR] = _RecordTable(segments, SEGMENT_COLUMNS)
+
+
+def get_segments(df: pd.DataFrame) -> list:
+    """Segment index of df as dicts with SEGMENT_COLUMNS keys, [] if none was recorded."""
+    return _records(df.attrs.get(SEGMENTS_ATTR))
+
+
+def segment_array(df: pd.DataFrame) -> np.ndarray:
+    """
+    Segment index of df as a read-only structured array with SEGMENT_COLUMNS fields,
+    missing times as np.iinfo(np.int64).min. Built from the data if none was recorded.
+    """
+    table = df.attrs.get(SEGMENTS_ATTR)
+    if table is None or len(table) == 0:
+        table = build_segments(df)
+    if isinstance(table, list):
+        table = _RecordTable(table, SEGMENT_COLUMNS)
+    return table.array
+
+
+def _assemble_participant(files: list, frames: list) -> dict:
+    """
+    Sort parsed frames into the [condition][sensor_type] structure, building each
+    sensor frame with a single concatenation and recording the row range of every
+    source file, see get_source_files.
+    """
+    grouped = {category: {key: [] for key in SENSOR_TYPES.keys()} for category in CONDITIONS}
+    for (category, key, filename, _), df in zip(files, frames):
+        if df is None:
+            continue
+        logger.debug("File matched pattern %s: %s in %s", key, filename, category)
+        grouped[category][key].append((filename, df))
+
+    with stage("concat") as timer:
+        data = {category: {} for category in CONDITIONS}
+        for category in CONDITIONS:
+            for key, parts in grouped[category].items():
+                data[category][key] = concat_source_parts(parts)
+        timer.add_data(data)
 
     return data
 
 
-def load_all_participants() -> dict:
+def concat_source_parts(parts: list) -> pd.DataFrame:
+    """
+    Concatenate per-file frames with a single pd.concat, recording the row range of
+    each file (get_source_files) and the segment index (get_segments).
+
+    Args:
+        parts: list - (filename, pd.DataFrame) tuples in load order
+
+    Returns:
+        pd.DataFrame with a fresh RangeIndex, empty if parts is empty
+    """
+    if not parts:
+        return pd.DataFrame()
+
+    source_files = []
+    start = 0
+    for file_id, (filename, df) in enumerate(parts):
+        source_files.append({"file_id": file_id, "file": filename, "start": start, "stop": start + len(df)})
+        start += len(df)
+
+    combined = pd.concat([df for _, df in parts], axis=0, ignore_index=True)
+    set_source_files(combined, source_files)
+    set_segments(combined, build_segments(combined, source_files))
+    return combined
+
+
+def _time_ns(df: pd.DataFrame, col: str):
+    """int64 nanoseconds of a clock or datetime column, None if the column is missing."""
+    if col not in df.columns:
+        return None
+    values = df[col]
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    if pd.api.types.is_numeric_dtype(values):
+        return np.asarray(values.to_numpy(), dtype=np.int64)
+    return pd.to_datetime(values, errors="coerce").to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def build_segments(df: pd.DataFrame, source_files: list = None, gap_ns: int = SEGMENT_GAP_NS) -> list:
+    """
+    Index the continuous recording segments of a sensor frame.
+
+    A new segment starts at every source file boundary and wherever consecutive samples
+    are more than gap_ns apart (or step backwards). Times use the sensor clock, or the
+    phone timestamp for streams without one (HR).
+
+    Args:
+        df: pd.DataFrame - loaded sensor frame
+        source_files: list - row ranges as returned by get_source_files, default one file
+        gap_ns: int - minimum gap that splits a segment
+
+    Returns:
+        list of dicts with SEGMENT_COLUMNS keys; times are int nanoseconds (None if missing)
+        and gap_before_ns is the gap to the previous segment of the same file (None for
+        the first segment of a file)
+    """
+    clock = _time_ns(df, "sensor_clock[ns]")
+    phone = _time_ns(df, "phone_datetime")
+    times = clock if clock is not None else phone
+    if times is None or len(df) == 0:
+        return []
+    source_files = source_files or [{"file_id": 0, "file": None, "start": 0, "stop": len(df)}]
+
+    def as_int(values, i):
+        return None if values is None or values[i] == np.iinfo(np.int64).min else int(values[i])
+
+    segments = []
+    for src in source_files:
+        start, stop = src["start"], src["stop"]
+        if stop <= start:
+            continue
+        diffs = np.diff(times[start:stop])
+        breaks = np.flatnonzero((diffs > gap_ns) | (diffs < 0)) + 1 + start
+        bounds = np.concatenate(([start], breaks, [stop]))
+        for i, (seg_start, seg_stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            last = seg_stop - 1
+            segments.append({
+                "file_id": src["file_id"],
+                "file": src["file"],
+                "start_row": int(seg_start),
+                "stop_row": int(seg_stop),
+                "samples": int(seg_stop - seg_start),
+                "start_clock_ns": as_int(clock, seg_start),
+                "end_clock_ns": as_int(clock, last),
+                "start_phone_ns": as_int(phone, seg_start),
+                "end_phone_ns": as_int(phone, last),
+                "gap_before_ns": None if i == 0 else int(times[seg_start] - times[seg_start - 1]),
+            })
+
+    return segments
+
+
+def segment_table(all_data: dict) -> pd.DataFrame:
+    """
+    Flatten the segment index of every loaded frame into one table, without touching
+    the sample data.
+
+    Args:
+        all_data: dict - participant{ condition{ sensor{ pd.DataFrame}}}
+
+    Returns:
+        pd.DataFrame with participant, condition, sensor and SEGMENT_COLUMNS columns
+    """
+    rows = []
+    for participant, conditions in all_data.items():
+        for condition, sensors in conditions.items():
+            for sensor, df in sensors.items():
+                for segment in get_segments(df):
+                    rows.append({"participant": participant, "condition": condition, "sensor": sensor, **segment})
+
+    return pd.DataFrame(rows, columns=["participant", "condition", "sensor"] + SEGMENT_COLUMNS)
+
+
+def split_by_source_file(df: pd.DataFrame) -> list:
+    """
+    Split a loaded sensor frame back into one frame per source file.
+
+    Args:
+        df: pd.DataFrame - frame produced by the loader
+
+    Returns:
+        list of pd.DataFrame, one per source file in load order. Frames without
+        source information are returned as a single element list.
+    """
+    source_files = get_source_files(df)
+    if not source_files:
+        return [df]
+    return [df.iloc[src["start"]:src["stop"]] for src in source_files]
+
+
+@timed("ingest", count_result=True)
+def load_data_for_participant(participant_dir: str,
+                              workers: int = LOAD_WORKERS,
+                              executor: str = LOAD_EXECUTOR,
+                              data_dir: str = None,
+                              engine: str = PARSE_ENGINE) -> dict:
+    """
+     Loads and categorizes data for a given subject. 
+
+    Args:
+        participant_dir: str - directory of files
+        workers: int - number of parse workers, 1 parses serially
+        executor: str - "process" (default) or "thread" pool
+        data_dir: str - root data directory, defaults to config.DATA_DIR
+        engine: str - parse engine, see PARSE_ENGINES
+
+    Returns:
+        dict([condition][sensor_type][sensor_df])        
+    """
+    files = _list_participant_files(participant_dir, data_dir)
+    frames = parse_files([path for _, _, _, path in files], workers, executor, engine)
+
+    return _assemble_participant(files, frames)
+
+
+@timed("ingest", count_result=True)
+def load_all_participants(workers: int = LOAD_WORKERS,
+                          executor: str = LOAD_EXECUTOR,
+                          data_dir: str = None,
+                          engine: str = PARSE_ENGINE) -> dict:
     """
     Loads data for all participants in the dataset.
 
+    Files of every participant are parsed through a single pool when
+    workers > 1, so small participants don't leave workers idle.
+
+    Args:
+        workers: int - number of parse workers, 1 parses serially
+        executor: str - "process" (default) or "thread" pool
+        data_dir: str - root data directory, defaults to config.DATA_DIR
+        engine: str - parse engine, see PARSE_ENGINES
+
     Returns:
         dict( subject_id{ condition{ sensor_type{ sensor_df{ pd.DataFrame}}}}])        
 
     """
+    data_dir = data_dir or DATA_DIR
+    participants = list_participants(data_dir)
+
+    participant_files = {}
+    for participant in participants:
+        logger.info("Loading data for: %s", participant)
+        participant_files[participant] = _list_participant_files(participant, data_dir)
+
+    all_paths = [path for files in participant_files.values() for _, _, _, path in files]
+    all_frames = parse_files(all_paths, workers, executor, engine)
 
-    participants = [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))]
     all_data = {}
+    offset = 0
     for participant in participants:
-        print(f"Loading data for: {participant}")
-        all_data[participant] = load_data_for_participant(participant)
+        files = participant_files[participant]
+        all_data[participant] = _assemble_participant(files, all_frames[offset:offset + len(files)])
+        offset += len(files)
     
     return all_data
+
+
+def stream_sensor_data(participant_dir: str,
+                       condition: str,
+                       sensor: str,
+                       chunk_rows: int = STREAM_CHUNK_ROWS,
+                       window_ns: int = None,
+                       time_col: str = "sensor_clock[ns]",
+                       data_dir: str = None):
+    """
+    Stream one participant/condition/sensor in bounded memory instead of loading it whole.
+
+    Files are read in the same sorted order as load_data_for_participant, in chunks of
+    chunk_rows, with column names cleaned and the typed schema applied. Rows are carried
+    over between reads so that every chunk except the last has exactly chunk_rows rows,
+    regardless of file boundaries. With window_ns set, chunks are instead whole time
+    windows of the sensor clock ([k * window_ns, (k + 1) * window_ns)), or of the phone
+    timestamp for streams without one (HR), with the incomplete trailing window carried
+    into the next read.
+
+    Args:
+        participant_dir: str - participant directory name
+        condition: str - exposure condition
+        sensor: str - sensor type key of SENSOR_TYPES
+        chunk_rows: int - rows per chunk, also the read size of the csv reader
+        window_ns: int - yield time windows of this length instead of fixed-size chunks
+        time_col: str - clock column used for time windows, phone_datetime for streams
+                  without it (HR)
+        data_dir: str - root data directory, defaults to config.DATA_DIR
+
+    Yields:
+        pd.DataFrame chunks with a RangeIndex continuing across chunks
+    """
+    data_dir = data_dir or DATA_DIR
+    category_path = os.path.join(data_dir, participant_dir, condition)
+    if not os.path.exists(category_path):
+        logger.debug("Missing category: %s for %s", condition, participant_dir)
+        return
+
+    file_paths = [
+        os.path.join(category_path, filename)
+        for filename in sorted(os.listdir(category_path))
+        if classify_file(filename) == sensor
+    ]
+
+    pending = []
+    pending_rows = 0
+    offset = 0
+    for df in _read_chunks(file_paths, sensor, chunk_rows):
+        pending.append(df)
+        pending_rows += len(df)
+
+        if window_ns is None:
+            if pending_rows < chunk_rows:
+                continue
+            buffer = pd.concat(pending, ignore_index=True)
+            n_full = (len(buffer) // chunk_rows) * chunk_rows
+            for start in range(0, n_full, chunk_rows):
+                chunk = buffer.iloc[start:start + chunk_rows]
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+            remainder = buffer.iloc[n_full:]
+        else:
+            buffer = pd.concat(pending, ignore_index=True)
+            times = _time_ns(buffer, time_col)
+            if times is None:
+                times = _time_ns(buffer, "phone_datetime")
+            window_ids = times // window_ns
+            # Everything before the last window seen so far is complete
+            boundaries = np.flatnonzero(np.diff(window_ids)) + 1
+            starts = np.concatenate(([0], boundaries))
+            for start, stop in zip(starts[:-1], starts[1:]):
+                chunk = buffer.iloc[start:stop]
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+            remainder = buffer.iloc[starts[-1]:]
+
+        pending = [remainder] if len(remainder) else []
+        pending_rows = len(remainder)
+
+    if pending_rows:
+        chunk = pd.concat(pending, ignore_index=True)
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        yield chunk
+
+
+def _read_chunks(file_paths: list, sensor: str, chunk_rows: int):
+    """Yield typed chunks of each file in turn, skipping files that fail to parse."""
+    for file_path in file_paths:
+        try:
+            with pd.read_csv(file_path, delimiter=";", header="infer", chunksize=chunk_rows) as reader:
+                for df in reader:
+                    yield apply_schema(clean_col_names(df), sensor)
+        except Exception as e:
+            logger.warning("Failed to stream %s (%s: %s), skipping rest of file.", file_path, type(e).__name__, e)
+
+
+def iter_participant_data(participants: list = None,
+                          conditions: list = None,
+                          sensors: list = None,
+                          by_condition: bool = False,
+                          checkpoint=None,
+                          workers: int = LOAD_WORKERS,
+                          executor: str = LOAD_EXECUTOR,
+                          data_dir: str = None,
+                          engine: str = PARSE_ENGINE):
+    """
+    Out-of-core loading: yield the data one participant (or one participant/condition)
+    at a time, in the nested all_data layout, so only that piece is ever in memory.
+    Nothing is kept between pieces; drop each yielded piece before asking for the next.
+
+    Args:
+        participants: list - participants to load, None for all
+        conditions: list - conditions to load, None for all
+        sensors: list - sensor types to load, None for all
+        by_condition: bool - yield one participant/condition per piece instead of a participant
+        checkpoint: PartitionedCheckpointManager (or memmap) to read from instead of raw files
+        workers, executor, engine: see load_all_participants
+        data_dir: str - root data directory, defaults to config.DATA_DIR
+
+    Yields:
+        dict( participant{ condition{ sensor{ pd.DataFrame}}}) with a single participant
+    """
+    if checkpoint is not None:
+        index = checkpoint.read_index()["partitions"]
+        for participant in index:
+            if participants is not None and participant not in participants:
+                continue
+            selected = [c for c in index[participant] if conditions is None or c in conditions]
+            groups = [[c] for c in selected] if by_condition else [selected]
+            for group in groups:
+                piece = checkpoint.load([participant], group, sensors)
+                yield piece
+                del piece
+        return
+
+    for participant in list_participants(data_dir):
+        if participants is not None and participant not in participants:
+            continue
+        files = [f for f in _list_participant_files(participant, data_dir)
+                 if (conditions is None or f[0] in conditions) and (sensors is None or f[1] in sensors)]
+        selected = [c for c in CONDITIONS if conditions is None or c in conditions]
+        groups = [[c] for c in selected] if by_condition else [selected]
+        for group in groups:
+            group_files = [f for f in files if f[0] in group]
+            frames = parse_files([path for _, _, _, path in group_files], workers, executor, engine)
+            assembled = _assemble_participant(group_files, frames)
+            piece = {participant: {
+                condition: {key: df for key, df in assembled[condition].items() if sensors is None or key in sensors}
+                for condition in group
+            }}
+            del frames, assembled
+            yield piece
+            del piece
+
+
+def list_participants(data_dir: str = None) -> list:
+    """Sorted participant directory names under data_dir (defaults to config.DATA_DIR)."""
+    data_dir = data_dir or DATA_DIR
+    return sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """Fast content hash (blake2b, 128 bit) of a file, read in blocks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_source_files(data_dir: str = None, use_hash: bool = False) -> dict:
+    """
+    Build a manifest of every raw sensor file without parsing any of them.
+
+    Args:
+        data_dir: str - root data directory, defaults to config.DATA_DIR
+        use_hash: bool - also compute a content hash of each file
+
+    Returns:
+        dict( "participant/condition/filename"{ participant, condition, sensor, file,
+                                                 path, size, mtime_ns, hash})
+    """
+    data_dir = data_dir or DATA_DIR
+    manifest = {}
+    for participant in list_participants(data_dir):
+        for category, key, filename, file_path in _list_participant_files(participant, data_dir):
+            stat = os.stat(file_path)
+            manifest[f"{participant}/{category}/{filename}"] = {
+                "participant": participant,
+                "condition": category,
+                "sensor": key,
+                "file": filename,
+                "path": file_path,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": hash_file(file_path) if use_hash else None,
+            }
+    return manifest
+
+
+def memory_footprint(all_data: dict) -> pd.DataFrame:
+    """
+    Report the in-memory size of every loaded frame.
+
+    Args:
+        all_data: dict - participant{ condition{ sensor{ pd.DataFrame}}}
+
+    Returns:
+        pd.DataFrame with participant, condition, sensor, rows, bytes and bytes_per_row columns
+    """
+    rows = []
+    for participant, conditions in all_data.items():
+        for condition, sensors in conditions.items():
+            for sensor, df in sensors.items():
+                n_bytes = int(df.memory_usage(index=True, deep=True).sum())
+                rows.append({
+                    "participant": participant,
+                    "condition": condition,
+                    "sensor": sensor,
+                    "rows": len(df),
+                    "bytes": n_bytes,
+                    "bytes_per_row": n_bytes / len(df) if len(df) else np.nan,
+                })
+
+    return pd.DataFrame(rows, columns=["participant", "condition", "sensor", "rows", "bytes", "bytes_per_row"])
+
@@ -1,17 +1,41 @@
 import os
 
-from config import LOAD_CHECKPOINT, SAVE_CHECKPOINT, CHECKPOINT_ID,  CHECKPOINT_FILE
+from config import LOAD_CHECKPOINT, SAVE_CHECKPOINT, CHECKPOINT_ID,  CHECKPOINT_FILE, CHECKPOINT_FORMAT, CHECKPOINT_DIR, INCREMENTAL_CHECKPOINT, CHECKPOINT_HASH_FILES, EXPORT_FIGURES, FIGURE_DIR, FIGURE_FORMAT, EXPORT_WORKERS, RUN_PIPELINE, PIPELINE_TARGETS, RUN_REPORT_FILE
+from instrumentation import REPORT, configure_logging, stage
 from loader import load_all_participants
-from checkpoint_manager import CheckpointManager
+from checkpoint_manager import CheckpointManager, PartitionedCheckpointManager, MemmapCheckpointManager
 from preprocessor import merge_data, compute_sample_rate_for_sensor
 from visualiser import visualise_data_availability, plot_data_coverage_per_participant, plot_individual_participant_heatmap, visualise_ppg_ch0_minutes_stacked
 
 def main():
+    configure_logging()
+    try:
+        return run()
+    finally:
+        if RUN_REPORT_FILE:
+            REPORT.write(RUN_REPORT_FILE)
 
-    checkpoint_mgr = CheckpointManager(CHECKPOINT_FILE)
+
+def run():
+
+    if RUN_PIPELINE:
+        # Cached stage graph: only stages whose inputs changed are recomputed
+        from pipeline import build_pipeline
+        return build_pipeline().run(PIPELINE_TARGETS)
+
+    if CHECKPOINT_FORMAT == "parquet":
+        checkpoint_mgr = PartitionedCheckpointManager(CHECKPOINT_DIR)
+    elif CHECKPOINT_FORMAT == "memmap":
+        checkpoint_mgr = MemmapCheckpointManager(CHECKPOINT_DIR)
+    else:
+        checkpoint_mgr = CheckpointManager(CHECKPOINT_FILE)
 
     # Data loading
-    if CHECKPOINT_ID == 0:
+    if CHECKPOINT_FORMAT in ("parquet", "memmap") and INCREMENTAL_CHECKPOINT:
+        # Only new or changed raw files are parsed, deleted files are dropped
+        checkpoint_mgr.refresh(use_hash=CHECKPOINT_HASH_FILES)
+        all_data = checkpoint_mgr.load()
+    elif CHECKPOINT_ID == 0:
         if LOAD_CHECKPOINT and checkpoint_mgr.exists():
             # Load data from pickle file
             all_data = checkpoint_mgr.load()
@@ -20,15 +44,20 @@ def main():
             all_data = load_all_participants()
             if SAVE_CHECKPOINT:
                 checkpoint_mgr.save(all_data)
-        
-    breakpoint()    
+
+    if EXPORT_FIGURES:
+        # Unattended run: write every figure to FIGURE_DIR instead of showing it
+        from export import export_figures
+        export_figures(all_data, FIGURE_DIR, FIGURE_FORMAT, workers=EXPORT_WORKERS)
+        return
+
     merged_data = {
         participant: {cat: merge_data(all_data[participant], cat) for cat in all_data[participant]}
         for participant in all_data
     }
-    breakpoint()     
     #visualise_data_availability(all_data)
-    visualise_ppg_ch0_minutes_stacked(all_data)
+    with stage("render"):
+        visualise_ppg_ch0_minutes_stacked(all_data)
     #visualise_ppg_minutes_data_availability(all_data)
     #plot_data_coverage_per_participant(all_data)
     #plot_individual_participant_heatmap(merged_data)
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+
+from config import DATA_DIR, PIPELINE_CACHE_DIR, PIPELINE_WORKERS, LOAD_WORKERS, LOAD_EXECUTOR, PARSE_ENGINE, FIGURE_DIR, FIGURE_FORMAT, EXPORT_WORKERS
+from config import PPG_BANDPASS_HZ, PPG_FILTER_ORDER, PPG_DETREND, FILTER_WORKERS
+from checkpoint_manager import CheckpointManager
+import instrumentation
+from loader import load_all_participants, scan_source_files
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    One step of a Pipeline: func(*upstream_results, **params).
+
+    Attributes:
+        name (str): Stage name, also the name of its cache file
+        func (callable): Called with the results of inputs (in order) and params as keywords
+        inputs (tuple): Names of the upstream stages
+        params (dict): Keyword arguments that change the result, part of the cache key
+        fingerprint (callable): Optional func(params) -> JSON-able state of external inputs
+                                (e.g. the raw file manifest), part of the cache key
+        cache (bool): Store the result on disk, False always recomputes when needed
+    """
+
+    def __init__(self, name: str, func, inputs=(), params: dict = None, fingerprint=None, cache: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.fingerprint = fingerprint
+        self.cache = cache
+
+
+class Pipeline:
+    """
+    Runs a graph of Stages. A stage's cache key is a hash of its name, params, external
+    fingerprint and the keys of its upstream stages, so a change anywhere upstream
+    invalidates everything below it. Stages with a valid cache are not run, and are not
+    even read from disk unless a stage that does run needs their result. Stages whose
+    inputs are ready run concurrently in a thread pool.
+    """
+
+    def __init__(self, stages: list, cache_dir: str = PIPELINE_CACHE_DIR, workers: int = PIPELINE_WORKERS):
+        """
+        Args:
+            stages (list): Stage objects, inputs must name other stages of the list
+            cache_dir (str): Directory for the per-stage cache files
+            workers (int): Max stages running at the same time
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' has unknown inputs {missing}.")
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.last_run = {}
+        self._keys = {}
+
+    def _cache(self, name: str) -> CheckpointManager:
+        return CheckpointManager(os.path.join(self.cache_dir, f"{name}.pkl"))
+
+    def _key_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}.key")
+
+    def key(self, name: str, _visiting: tuple = ()) -> str:
+        """Cache key of a stage, see class docstring."""
+        if name in self._keys:
+            return self._keys[name]
+        if name in _visiting:
+            raise ValueError(f"Stage graph has a cycle through '{name}'.")
+
+        stage = self.stages[name]
+        content = {
+            "stage": name,
+            "params": stage.params,
+            "inputs": [self.key(upstream, _visiting + (name,)) for upstream in stage.inputs],
+            "external": stage.fingerprint(stage.params) if stage.fingerprint else None,
+        }
+        digest = hashlib.blake2b(json.dumps(content, sort_keys=True, default=str).encode(), digest_size=16)
+        self._keys[name] = digest.hexdigest()
+        return self._keys[name]
+
+    def is_cached(self, name: str) -> bool:
+        """True if the stage has a stored result for its current key."""
+        if not self.stages[name].cache or not self._cache(name).exists():
+            return False
+        try:
+            with open(self._key_path(name)) as f:
+                return f.read().strip() == self.key(name)
+        except FileNotFoundError:
+            return False
+
+    def plan(self, targets: list = None, force: list = ()) -> dict:
+        """
+        Decide what every stage needed for targets does.
+
+        Args:
+            targets (list): Stages whose results are wanted, default all
+            force (list): Stages to rerun even if cached, their downstream reruns too
+
+        Returns:
+            dict( stage{ "run" | "load"}), stages left out are skipped
+        """
+        targets = list(self.stages) if targets is None else list(targets)
+        forced = set()
+        for name in force:
+            forced |= {name} | self._downstream(name)
+
+        plan = {}
+
+        def resolve(name):
+            if name in plan:
+                return
+            if name not in forced and self.is_cached(name):
+                plan[name] = "load"
+                return
+            plan[name] = "run"
+            for upstream in self.stages[name].inputs:
+                resolve(upstream)
+
+        for name in targets:
+            resolve(name)
+        return plan
+
+    def _downstream(self, name: str) -> set:
+        below = set()
+        for stage in self.stages.values():
+            if name in stage.inputs:
+                below |= {stage.name} | self._downstream(stage.name)
+        return below
+
+    def _execute(self, name: str, action: str, results: dict):
+        stage = self.stages[name]
+        if action == "load":
+            logger.info("Stage %s: cached", name)
+            return self._cache(name).load()
+
+        logger.info("Stage %s: running", name)
+        with instrumentation.stage(f"pipeline:{name}"):
+            result = stage.func(*[results[upstream] for upstream in stage.inputs], **stage.params)
+        if stage.cache:
+            self._cache(name).save(result)
+            # Key written last, an interrupted save never looks valid
+            with open(self._key_path(name), "w") as f:
+                f.write(self.key(name))
+        return result
+
+    def run(self, targets: list = None, force: list = ()) -> dict:
+        """
+        Run the stages needed for targets, skipping the ones whose cache is still valid.
+
+        Args:
+            targets (list): Stages whose results are wanted, default all
+            force (list): Stages to rerun even if cached, see plan
+
+        Returns:
+            dict( target{ result})
+        """
+        self._keys = {}
+        targets = list(self.stages) if targets is None else list(targets)
+        plan = self.plan(targets, force)
+        self.last_run = {name: plan.get(name, "skipped") for name in self.stages}
+
+        results = {}
+        pending = dict(plan)
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            running = {}
+            while pending or running:
+                # Cached stages are ready at once, others once all their inputs are
+                ready = [name for name, action in pending.items()
+                         if action == "load" or all(upstream in results for upstream in self.stages[name].inputs)]
+                for name in ready:
+                    running[pool.submit(self._execute, name, pending.pop(name), results)] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        return {name: results[name] for name in targets}
+
+
+def merge_all(all_data: dict) -> dict:
+    """merge_data for every participant and condition."""
+    from preprocessor import merge_data
+    return {
+        participant: {cat: merge_data(all_data[participant], cat) for cat in all_data[participant]}
+        for participant in all_data
+    }
+
+
+def _timing(all_data: dict, **params):
+    from preprocessor import compute_timing_table
+    return compute_timing_table(all_data, **params)
+
+
+def _filter(all_data: dict, workers: int = 1, **params):
+    from preprocessor import filter_all_ppg
+    return filter_all_ppg(all_data, workers=workers, **params)
+
+
+def _coverage(all_data: dict, **params):
+    from coverage import compute_coverage
+    return compute_coverage(all_data, **params)
+
+
+def _figures(coverage: dict, workers: int = EXPORT_WORKERS, **params):
+    from export import export_figures
+    return export_figures({}, coverage=coverage, workers=workers, **params)
+
+
+def _source_manifest(params: dict) -> dict:
+    """Size and mtime of every raw file, so adding or editing a file invalidates load."""
+    manifest = scan_source_files(params["data_dir"])
+    return {key: (entry["size"], entry["mtime_ns"]) for key, entry in manifest.items()}
+
+
+def build_pipeline(data_dir: str = DATA_DIR,
+                   engine: str = PARSE_ENGINE,
+                   workers: int = LOAD_WORKERS,
+                   executor: str = LOAD_EXECUTOR,
+                   figure_dir: str = FIGURE_DIR,
+                   figure_format: str = FIGURE_FORMAT,
+                   export_workers: int = EXPORT_WORKERS,
+                   filter_workers: int = FILTER_WORKERS,
+                   cache_dir: str = PIPELINE_CACHE_DIR,
+                   pipeline_workers: int = PIPELINE_WORKERS) -> Pipeline:
+    """
+    The standard workflow: load -> merge, timing, filter, coverage -> figures.
+
+    Worker counts only change speed, not results, so they are not part of the cache keys.
+
+    Returns:
+        Pipeline
+    """
+    stages = [
+        Stage("load", partial(load_all_participants, workers=workers, executor=executor),
+              params={"data_dir": data_dir, "engine": engine}, fingerprint=_source_manifest),
+        Stage("merge", merge_all, inputs=["load"]),
+        Stage("timing", _timing, inputs=["load"]),
+        Stage("filter", partial(_filter, workers=filter_workers), inputs=["load"],
+              params={"band_hz": PPG_BANDPASS_HZ, "order": PPG_FILTER_ORDER, "detrend": PPG_DETREND}),
+        Stage("coverage", _coverage, inputs=["load"], params={"sensors": ["acc", "ppg"]}),
+        Stage("figures", partial(_figures, workers=export_workers), inputs=["coverage"],
+              params={"output_dir": figure_dir, "fmt": figure_format}),
+    ]
+    return Pipeline(stages, cache_dir, pipeline_workers)
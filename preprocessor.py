@@ -1,38 +1,124 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
 
-def merge_data(data: dict, category: str) -> dict:
+from config import (ALIGN_REFERENCE, ALIGN_PRIORITY, ALIGN_TOLERANCE_NS, RESAMPLE_MAX_GAP_FACTOR,
+                    PPG_BANDPASS_HZ, PPG_FILTER_ORDER, PPG_DETREND, FILTER_WORKERS, FILTER_EXECUTOR)
+from instrumentation import stage, timed
+from loader import split_by_source_file
+from query import phone_to_clock, clocked_segments
+
+logger = logging.getLogger(__name__)
+
+def _sorted_by(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Return df sorted by key, without copying when it is already monotonic."""
+    if df[key].is_monotonic_increasing:
+        return df
+    return df.sort_values(key, kind="stable")
+
+
+def align_sensors(data: dict,
+                  category: str,
+                  reference: str = ALIGN_REFERENCE,
+                  sensors: list = None,
+                  tolerance_ns: dict = None,
+                  direction: str = "nearest",
+                  time_col: str = "sensor_clock[ns]",
+                  datetime_col: str = "phone_datetime") -> pd.DataFrame:
     """
-    Merge accelerometer, PPG, HR, and gyro data on sensor clock timestamps.
-    
+    Align all sensor streams of one condition onto a reference stream.
+
+    Every row of the reference stream is kept and each other stream contributes the
+    columns of its nearest sample (or last/next one, see direction) within that
+    stream's tolerance, using sorted as-of matching instead of an exact-timestamp
+    outer merge. Streams are matched on the sensor clock when both have it and on
+    the phone timestamp otherwise (the HR export has no sensor clock).
+    Runs in O(n log n) at worst (sorting unsorted streams), O(n) for sorted ones.
+
+    Args:
+        data (dict): data[category][sensor] -> pd.DataFrame, e.g. all_data[participant]
+        category (str): Exposure condition
+        reference (str): Sensor whose timestamps form the output rows. If it has no
+                         data the first present sensor of ALIGN_PRIORITY is used.
+        sensors (list): Sensors to align, default all sensors in data[category]
+        tolerance_ns (dict): Max time distance per sensor, default ALIGN_TOLERANCE_NS
+        direction (str): "nearest", "backward" or "forward" as in pd.merge_asof
+        time_col (str): Sensor clock column
+        datetime_col (str): Phone timestamp column
+
     Returns:
-        dict( subject_id{ condition{ pd.DataFrame}})
+        pd.DataFrame: One row per reference sample sorted by the reference time column,
+                      empty if no sensor has data.
     """
     if category not in data:
-        print(f"Warning: Category '{category}' is missing.")
+        logger.warning("Category '%s' is missing.", category)
         return pd.DataFrame()
 
-    merged_df = None
+    tolerance_ns = {**ALIGN_TOLERANCE_NS, **(tolerance_ns or {})}
+    condition = data[category]
+    streams = {
+        sensor: condition[sensor] for sensor in condition
+        if sensors is None or sensor in sensors
+    }
+    streams = {sensor: df for sensor, df in streams.items() if isinstance(df, pd.DataFrame) and not df.empty}
+    if not streams:
+        return pd.DataFrame()
 
-    # Merge accelerometer
-    if not data[category]["acc"].empty:
-        acc_cols = ["sensor_clock[ns]", "phone_datetime", "acc_x[mg]", "acc_y[mg]", "acc_z[mg]"]
-        if all(col in data[category]["acc"].columns for col in acc_cols):
-            merged_df = data[category]["acc"][acc_cols].copy()
+    if reference not in streams:
+        reference = next(sensor for sensor in ALIGN_PRIORITY + list(streams) if sensor in streams)
 
-    # Debugging: Print column names for PPG
-    if not data[category]["ppg"].empty:
-        print(f"PPG Data Found for {category}: Columns -> {data[category]['ppg'].columns.tolist()}")
+    ref_df = streams[reference]
+    key = time_col if time_col in ref_df.columns else datetime_col
+    aligned = _sorted_by(ref_df, key)
 
-    # Merge PPG only if expected columns exist
-    expected_ppg_cols = ["sensor_clock[ns]", "phone_datetime", "ppg_ch0", "ppg_ch1", "ppg_ch2", "ppg_amb"]
-    if not data[category]["ppg"].empty and all(col in data[category]["ppg"].columns for col in expected_ppg_cols):
-        merged_df = pd.merge(merged_df, data[category]["ppg"][expected_ppg_cols], on="sensor_clock[ns]", how="outer")
-    else:
-        print(f"Warning: PPG data in {category} does not have the expected columns!")
+    for sensor, df in streams.items():
+        if sensor == reference:
+            continue
 
-    return merged_df
+        on = time_col if time_col in df.columns and time_col in aligned.columns else datetime_col
+        if on not in df.columns or on not in aligned.columns:
+            logger.warning("Cannot align '%s' in %s, no shared time column.", sensor, category)
+            continue
 
+        if aligned[on].isna().any():
+            logger.warning("Cannot align '%s' in %s, reference has missing '%s' values.", sensor, category, on)
+            continue
+
+        # Only the key and the stream's own channels are brought across
+        value_cols = [col for col in df.columns if col not in (time_col, datetime_col)]
+        right = df[[on] + value_cols]
+        if right[on].dtype != aligned[on].dtype:
+            # e.g. datetime64[us] vs [ns] timestamps, merge_asof needs identical key dtypes
+            right = right.assign(**{on: right[on].astype(aligned[on].dtype)})
+        if right[on].isna().any():
+            right = right[right[on].notna()]
+        right = _sorted_by(right, on)
+
+        tolerance = tolerance_ns.get(sensor)
+        if tolerance is not None and on == datetime_col:
+            tolerance = pd.Timedelta(tolerance, unit="ns")
+
+        left = _sorted_by(aligned, on)
+        aligned = pd.merge_asof(left, right, on=on, direction=direction, tolerance=tolerance)
+
+    # Phone time merges (HR) leave the rows in phone order, restore the reference order
+    if not aligned[key].is_monotonic_increasing:
+        aligned = aligned.sort_values(key, kind="stable", ignore_index=True)
+    return aligned
+
+
+@timed("merge", count_result=True)
+def merge_data(data: dict, category: str) -> pd.DataFrame:
+    """
+    Merge accelerometer, PPG, HR, and gyro data of one condition onto the
+    ALIGN_REFERENCE stream, see align_sensors.
+    
+    Returns:
+        pd.DataFrame
+    """
+    return align_sensors(data, category)
 
 
 def compute_sample_rate_from_timestamps_median(time_series):
@@ -46,15 +132,17 @@ def compute_sample_rate_from_timestamps_median(time_series):
     Returns:
         float or None: The computed sample rate in Hz, or None if insufficient data.
     """
-    # Ensure time_series is a numpy array for proper sorting and diff.
-    times = np.array(time_series)
+    # np.asarray keeps memory mapped / Series backed arrays as zero-copy views
+    times = np.asarray(time_series)
     
     if times.size < 2:
         return None
 
-    sorted_times = np.sort(times)
-    # Compute differences between successive timestamps
-    diffs = np.diff(sorted_times)
+    # Compute differences between successive timestamps, only sorting (a copy)
+    # when the clock is not already monotonic
+    diffs = np.diff(times)
+    if (diffs < 0).any():
+        diffs = np.diff(np.sort(times))
     median_diff_ns = np.median(diffs)
     if median_diff_ns == 0:
         return None
@@ -62,6 +150,7 @@ def compute_sample_rate_from_timestamps_median(time_series):
     sample_rate = 1 / (median_diff_ns / 1e9)
     return sample_rate
 
+@timed("rate_estimation")
 def compute_sample_rate_for_sensor(data: dict, 
                                    sensor_group: str = "ppg",
                                    sensor_name: str = "ppg_ch0",
@@ -114,13 +203,13 @@ def compute_sample_rate_for_sensor(data: dict,
         rates = []
         for p in participants:
             if cat not in data[p]:
-                print(f"Warning: Category '{cat}' not found for participant '{p}'.")
+                logger.warning("Category '%s' not found for participant '%s'.", cat, p)
                 rates.append(np.nan)
                 continue
             
             # Check if the sensor_group exists in the category.
             if sensor_group not in data[p][cat]:
-                print(f"Warning: Sensor group '{sensor_group}' not found for participant '{p}', category '{cat}'.")
+                logger.warning("Sensor group '%s' not found for participant '%s', category '%s'.", sensor_group, p, cat)
                 rates.append(np.nan)
                 continue
             
@@ -129,18 +218,19 @@ def compute_sample_rate_for_sensor(data: dict,
             # Handle the possibility that time_series is a pandas Series.
             if isinstance(time_series, pd.Series):
                 if time_series.empty:
-                    print(f"Warning: Timestamp Series for '{time_col}' is empty for participant '{p}', category '{cat}'.")
+                    logger.debug("Timestamp Series for '%s' is empty for participant '%s', category '%s'.", time_col, p, cat)
                     rates.append(np.nan)
                     continue
-                # Convert to a list (or numpy array) for further processing.
-                time_series = time_series.tolist()
+                # Underlying array, no copy for numeric or memory mapped columns.
+                time_series = time_series.to_numpy()
             else:
                 if not isinstance(time_series, list) and not hasattr(time_series, '__len__'):
-                    print(f"Warning: Timestamp data for '{time_col}' for participant '{p}', category '{cat}' is not list-like.")
+                    logger.warning("Timestamp data for '%s' for participant '%s', category '%s' is not list-like.",
+                                   time_col, p, cat)
                     rates.append(np.nan)
                     continue
                 if len(time_series) == 0:
-                    print(f"Warning: No timestamp data found in '{time_col}' for participant '{p}', category '{cat}'.")
+                    logger.debug("No timestamp data found in '%s' for participant '%s', category '%s'.", time_col, p, cat)
                     rates.append(np.nan)
                     continue
             
@@ -158,13 +248,16 @@ def compute_sample_rate_for_sensor(data: dict,
 
 
 
+@timed("rate_estimation")
 def compute_file_level_sample_rates(data: dict,
                                     sensor_group: str = "ppg",
                                     time_col: str = "sensor_clock[ns]"
 ):
     """
     Computes the sample rate for each file for a given sensor group.
-    This function assumes that in your loader you stored a list of DataFrames per sensor type per category.
+    The loader records the row range of each source file on the sensor frame, which is
+    used here to split it back into per-file frames. A list of per-file DataFrames is
+    also accepted.
     Returns a nested dictionary structured as:
         { participant: { category: [sample_rate_file1, sample_rate_file2, ...] } }
     """
@@ -172,13 +265,631 @@ def compute_file_level_sample_rates(data: dict,
     for participant in data:
         sample_rates[participant] = {}
         for category in data[participant]:
-            # Suppose data[participant][category][sensor_group] is now a list of DataFrames
+            sensor_data = data[participant][category][sensor_group]
+            if isinstance(sensor_data, pd.DataFrame):
+                sensor_data = split_by_source_file(sensor_data)
+
             file_rates = []
-            for df in data[participant][category][sensor_group]:
+            for df in sensor_data:
                 if df.empty or time_col not in df.columns or len(df[time_col]) < 2:
                     file_rates.append(np.nan)
                 else:
-                    rate = compute_sample_rate_from_timestamps_median(df[time_col].tolist())
+                    rate = compute_sample_rate_from_timestamps_median(df[time_col].to_numpy())
                     file_rates.append(rate)
             sample_rates[participant][category] = file_rates
     return sample_rates
+
+
+class StreamingSampleRate:
+    """
+    Median-difference sample rate over a stream of chunks in bounded memory.
+
+    Consecutive timestamp differences are counted in a histogram of diff_resolution_ns
+    wide bins instead of being kept, and the last timestamp of each chunk is carried
+    over so differences across chunk boundaries are included. Assumes the stream is in
+    clock order (as produced by loader.stream_sensor_data); negative differences are
+    ignored.
+    """
+
+    def __init__(self, time_col: str = "sensor_clock[ns]", diff_resolution_ns: int = 1000):
+        self.time_col = time_col
+        self.diff_resolution_ns = diff_resolution_ns
+        self.counts = {}
+        self.n_samples = 0
+        self._last = None
+
+    def update(self, chunk):
+        """Add a chunk (DataFrame, or array of timestamps in nanoseconds)."""
+        times = np.asarray(chunk[self.time_col] if isinstance(chunk, pd.DataFrame) else chunk, dtype=np.int64)
+        if times.size == 0:
+            return
+        if self._last is not None:
+            times_with_prev = np.concatenate(([self._last], times))
+        else:
+            times_with_prev = times
+        self._last = times[-1]
+        self.n_samples += times.size
+
+        diffs = np.diff(times_with_prev)
+        diffs = diffs[diffs >= 0] // self.diff_resolution_ns
+        values, counts = np.unique(diffs, return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.counts[value] = self.counts.get(value, 0) + count
+
+    def result(self):
+        """
+        Returns:
+            float or None: Sample rate in Hz, or None if insufficient data.
+        """
+        if not self.counts:
+            return None
+        values = np.array(sorted(self.counts))
+        cumulative = np.cumsum([self.counts[v] for v in values])
+        total = cumulative[-1]
+        # Median of the binned differences, averaging the two middle bins for even counts
+        lower = values[np.searchsorted(cumulative, (total + 1) // 2)]
+        upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+        median_diff_ns = (lower + upper) / 2 * self.diff_resolution_ns
+        if median_diff_ns == 0:
+            return None
+        return 1 / (median_diff_ns / 1e9)
+
+
+class StreamingMinuteCoverage:
+    """
+    Unique minutes of data over a stream of chunks, keeping only the set of minutes seen.
+    Rows where value_col is NaN or the timestamp is invalid are not counted.
+    """
+
+    def __init__(self, datetime_col: str = "phone_datetime", value_col: str = None):
+        self.datetime_col = datetime_col
+        self.value_col = value_col
+        self.minutes = set()
+
+    def update(self, chunk: pd.DataFrame):
+        """Add a chunk of the stream."""
+        timestamps = chunk[self.datetime_col]
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            timestamps = pd.to_datetime(timestamps, errors="coerce")
+        valid = timestamps.notna().to_numpy()
+        if self.value_col is not None:
+            valid = valid & chunk[self.value_col].notna().to_numpy()
+
+        ns = timestamps.to_numpy(dtype="datetime64[ns]")[valid].astype(np.int64)
+        self.minutes.update(np.unique(ns // 60_000_000_000).tolist())
+
+    def result(self) -> int:
+        """
+        Returns:
+            int: Number of unique minutes seen.
+        """
+        return len(self.minutes)
+
+
+def consume_stream(stream, *accumulators):
+    """
+    Feed every chunk of a stream to each accumulator and return their results.
+
+    Example:
+        rate, minutes = consume_stream(
+            stream_sensor_data("P01", "intra_heat_exposure", "ppg"),
+            StreamingSampleRate(), StreamingMinuteCoverage(value_col="ppg_ch0"),
+        )
+    """
+    for chunk in stream:
+        for acc in accumulators:
+            acc.update(chunk)
+        # Release the chunk before the next one is read, so only one is alive at a time
+        del chunk
+    return tuple(acc.result() for acc in accumulators)
+
+
+class SampleRateTable:
+    """
+    Out-of-core compute_sample_rate_for_sensor: fed pieces of all_data (one participant
+    or participant/condition at a time, see loader.iter_participant_data), it keeps only
+    one rate per participant and category.
+
+    Example:
+        rates, timing = consume_stream(iter_participant_data(), SampleRateTable(), TimingTable())
+    """
+
+    def __init__(self, sensor_group: str = "ppg", time_col: str = "sensor_clock[ns]"):
+        self.sensor_group = sensor_group
+        self.time_col = time_col
+        self.rates = {}
+
+    def update(self, data: dict):
+        """Add a piece of all_data."""
+        for participant, conditions in data.items():
+            participant_rates = self.rates.setdefault(participant, {})
+            for category, streams in conditions.items():
+                df = streams.get(self.sensor_group)
+                if df is None or self.time_col not in df.columns or df.empty:
+                    participant_rates[category] = np.nan
+                else:
+                    participant_rates[category] = compute_sample_rate_from_timestamps_median(df[self.time_col].to_numpy())
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame indexed by participant with one column per exposure category,
+            as compute_sample_rate_for_sensor
+        """
+        categories = ["pre_heat_exposure", "intra_heat_exposure", "post_heat_exposure"]
+        return pd.DataFrame(
+            {cat: [self.rates[p].get(cat, np.nan) for p in self.rates] for cat in categories},
+            index=list(self.rates),
+        )
+
+
+class TimingTable:
+    """Out-of-core compute_timing_table, keeping only the table rows of each piece."""
+
+    def __init__(self, **kwargs):
+        """kwargs are passed to compute_timing_table."""
+        self.kwargs = kwargs
+        self.tables = []
+
+    def update(self, data: dict):
+        """Add a piece of all_data."""
+        self.tables.append(compute_timing_table(data, **self.kwargs))
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame with TIMING_COLUMNS
+        """
+        tables = [table for table in self.tables if len(table)]
+        if not tables:
+            return pd.DataFrame(columns=TIMING_COLUMNS)
+        return pd.concat(tables, ignore_index=True)
+
+
+def stream_time_ns(df: pd.DataFrame, time_col: str = "sensor_clock[ns]", datetime_col: str = "phone_datetime"):
+    """
+    Int64 nanosecond time base of a stream: the sensor clock, or the phone timestamp for
+    streams without one (HR). Zero-copy for int64 / datetime64[ns] columns.
+
+    Returns:
+        (np.ndarray, str) times and the name of the column they came from
+    """
+    if time_col in df.columns:
+        return np.asarray(df[time_col].to_numpy(), dtype=np.int64), time_col
+    times = df[datetime_col]
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, errors="coerce")
+    return times.to_numpy(dtype="datetime64[ns]").view(np.int64), datetime_col
+
+
+def find_segments(times: np.ndarray, max_gap_ns: float) -> np.ndarray:
+    """
+    Split sorted timestamps into continuous segments at gaps larger than max_gap_ns.
+
+    Returns:
+        np.ndarray of shape (n_segments, 2) with [start, stop) row positions
+    """
+    if len(times) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(times) > max_gap_ns) + 1
+    starts = np.concatenate(([0], breaks))
+    stops = np.concatenate((breaks, [len(times)]))
+    return np.column_stack((starts, stops))
+
+
+def resample_stream(df: pd.DataFrame,
+                    rate_hz: float = None,
+                    method: str = "linear",
+                    channels: list = None,
+                    max_gap_factor: float = RESAMPLE_MAX_GAP_FACTOR,
+                    time_col: str = "sensor_clock[ns]",
+                    datetime_col: str = "phone_datetime") -> dict:
+    """
+    Resample all channels of a stream onto a uniform time grid in one vectorised pass.
+
+    Grid points are the multiples of the target period (k * 1e9 / rate_hz ns) inside the
+    stream's time range, so streams resampled to the same rate share the same grid.
+    Grid points falling inside a recording gap (more than max_gap_factor source periods
+    between samples) are NaN rather than interpolated across the gap.
+
+    Args:
+        df (pd.DataFrame): Sensor stream
+        rate_hz (float): Target rate, default the stream's own median rate
+        method (str): "linear", "nearest", or "decimate" (anti-alias low-pass per continuous
+                      segment, then linear; only filters when rate_hz is below the source rate)
+        channels (list): Columns to resample, default every numeric non-time column
+        max_gap_factor (float): Gap threshold in multiples of the source median period
+        time_col (str): Sensor clock column
+        datetime_col (str): Phone timestamp column, used when time_col is absent
+
+    Returns:
+        dict: {"time_ns": int64 grid, "values": float32 array (n_grid, n_channels),
+               "channels": list, "rate_hz": float, "source_rate_hz": float, "time_col": str}
+               or None if the stream has fewer than two samples.
+    """
+    if method not in ("linear", "nearest", "decimate"):
+        raise ValueError("Method not implemented. Please use 'linear', 'nearest' or 'decimate'.")
+
+    if channels is None:
+        channels = [col for col in df.columns
+                    if col not in (time_col, datetime_col) and pd.api.types.is_numeric_dtype(df[col])]
+    if df.empty or not channels:
+        return None
+
+    times, used_col = stream_time_ns(df, time_col, datetime_col)
+    values = df[channels].to_numpy(dtype=np.float32)
+
+    # Drop samples with missing time or channel values, and sort if needed
+    valid = np.isfinite(values).all(axis=1)
+    if used_col == datetime_col:
+        valid &= times != np.iinfo(np.int64).min
+    if not valid.all():
+        times, values = times[valid], values[valid]
+    if (np.diff(times) < 0).any():
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+
+    source_rate = compute_sample_rate_from_timestamps_median(times)
+    if source_rate is None:
+        return None
+    rate_hz = rate_hz or source_rate
+    period_ns = 1e9 / rate_hz
+    max_gap_ns = max_gap_factor * 1e9 / source_rate
+
+    grid = np.round(np.arange(np.ceil(times[0] / period_ns), np.floor(times[-1] / period_ns) + 1) * period_ns)
+    grid = grid.astype(np.int64)
+
+    if method == "decimate" and rate_hz < source_rate:
+        values = _lowpass_segments(times, values, source_rate, 0.45 * rate_hz, max_gap_ns)
+
+    # Neighbouring source samples of every grid point
+    right = np.clip(np.searchsorted(times, grid, side="left"), 1, len(times) - 1)
+    left = right - 1
+    t_left, t_right = times[left], times[right]
+    span = t_right - t_left
+
+    if method == "nearest":
+        nearest = np.where(grid - t_left <= t_right - grid, left, right)
+        out = values[nearest]
+    else:
+        weight = np.divide(grid - t_left, span, out=np.zeros(len(grid)), where=span > 0).astype(np.float32)
+        out = values[left] + (values[right] - values[left]) * weight[:, None]
+
+    out[span > max_gap_ns] = np.nan
+
+    return {
+        "time_ns": grid,
+        "values": out,
+        "channels": list(channels),
+        "rate_hz": rate_hz,
+        "source_rate_hz": source_rate,
+        "time_col": used_col,
+    }
+
+
+def _lowpass_segments(times, values, fs, cutoff_hz, max_gap_ns, order: int = 4):
+    """Zero-phase Butterworth low-pass of every continuous segment, all channels at once."""
+    from scipy import signal  # ~1 s to import, only needed when decimating
+
+    sos = signal.butter(order, cutoff_hz, btype="low", fs=fs, output="sos")
+    # sosfiltfilt needs a minimum segment length for its edge padding
+    min_len = 3 * (2 * len(sos) + 1)
+    filtered = values.copy()
+    for start, stop in find_segments(times, max_gap_ns):
+        if stop - start > min_len:
+            filtered[start:stop] = signal.sosfiltfilt(sos, values[start:stop], axis=0)
+    return filtered
+
+
+PPG_CHANNELS = ["ppg_ch0", "ppg_ch1", "ppg_ch2"]
+
+
+def filter_ppg(df: pd.DataFrame,
+               band_hz: tuple = PPG_BANDPASS_HZ,
+               order: int = PPG_FILTER_ORDER,
+               detrend: bool = PPG_DETREND,
+               channels: list = None,
+               ambient_col: str = "ppg_amb",
+               max_gap_factor: float = RESAMPLE_MAX_GAP_FACTOR,
+               time_col: str = "sensor_clock[ns]",
+               datetime_col: str = "phone_datetime") -> pd.DataFrame:
+    """
+    Ambient subtraction, baseline removal and zero-phase bandpass of the PPG channels.
+
+    All channels are filtered together as one (samples, channels) float array, one
+    continuous segment at a time, so the filter never runs across a recording gap (more
+    than max_gap_factor median periods between samples). Segments too short for the
+    filter's edge padding, and rows with a missing value, are NaN in the result.
+
+    Args:
+        df (pd.DataFrame): PPG stream, e.g. all_data[participant][condition]["ppg"]
+        band_hz (tuple): (low, high) passband edges in Hz
+        order (int): Butterworth order
+        detrend (bool): Remove a linear baseline from every segment before filtering
+        channels (list): Channels to filter, default PPG_CHANNELS present in df
+        ambient_col (str): Ambient light channel subtracted from every channel, None to skip
+        max_gap_factor (float): Gap threshold in multiples of the median sample period
+        time_col (str): Sensor clock column
+        datetime_col (str): Phone timestamp column, used when time_col is absent
+
+    Returns:
+        pd.DataFrame with the time columns and the filtered channels (float32), same index
+        and row order as df
+    """
+    from scipy import signal  # ~1 s to import, only needed when filtering
+
+    if channels is None:
+        channels = [col for col in PPG_CHANNELS if col in df.columns]
+    keep = [col for col in (time_col, datetime_col) if col in df.columns]
+    result = df[keep].copy()
+    result.attrs = dict(df.attrs)
+    if df.empty or not channels:
+        for col in channels:
+            result[col] = np.array([], dtype=np.float32)
+        return result
+
+    times, used_col = stream_time_ns(df, time_col, datetime_col)
+    values = df[channels].to_numpy(dtype=np.float64)
+    if ambient_col is not None and ambient_col in df.columns:
+        values = values - df[ambient_col].to_numpy(dtype=np.float64)[:, None]
+
+    valid = np.isfinite(values).all(axis=1)
+    if used_col == datetime_col:
+        valid &= times != np.iinfo(np.int64).min
+    # Positions of the valid rows in time order, filtered results are scattered back to them.
+    # A clean, sorted stream (the usual case) skips these copies.
+    rows = None
+    if not valid.all() or (np.diff(times) < 0).any():
+        rows = np.flatnonzero(valid)
+        rows = rows[np.argsort(times[rows], kind="stable")]
+        times, values = times[rows], values[rows]
+
+    out = np.full((len(df), len(channels)), np.nan, dtype=np.float32)
+    rate = compute_sample_rate_from_timestamps_median(times)
+    if rate is not None:
+        high = min(band_hz[1], 0.45 * rate)
+        sos = signal.butter(order, (band_hz[0], high), btype="bandpass", fs=rate, output="sos")
+        # sosfiltfilt needs a minimum segment length for its edge padding
+        min_len = 3 * (2 * len(sos) + 1)
+        with stage("filter", rows=len(values), n_bytes=values.nbytes):
+            for start, stop in find_segments(times, max_gap_factor * 1e9 / rate):
+                if stop - start <= min_len:
+                    continue
+                block = values[start:stop]
+                if detrend:
+                    block = _remove_linear_baseline(block)
+                target = slice(start, stop) if rows is None else rows[start:stop]
+                out[target] = signal.sosfiltfilt(sos, block, axis=0)
+
+    for i, col in enumerate(channels):
+        result[col] = out[:, i]
+    return result
+
+
+def _remove_linear_baseline(block: np.ndarray) -> np.ndarray:
+    """Subtract the least-squares line of every column (closed form, cheaper than signal.detrend)."""
+    x = np.arange(len(block), dtype=np.float64)
+    x -= x.mean()
+    centred = block - block.mean(axis=0)
+    slope = (x @ centred) / (x @ x)
+    return centred - x[:, None] * slope
+
+
+def _filter_partition(task):
+    participant, condition, df, kwargs = task
+    return participant, condition, filter_ppg(df, **kwargs)
+
+
+def filter_all_ppg(data: dict,
+                   workers: int = FILTER_WORKERS,
+                   executor: str = FILTER_EXECUTOR,
+                   sensor: str = "ppg",
+                   **kwargs) -> dict:
+    """
+    filter_ppg for every participant and condition, partitions filtered in parallel.
+
+    SciPy releases the GIL while filtering, so a thread pool avoids copying the frames
+    to worker processes; "process" helps when the pandas part dominates.
+
+    Args:
+        data (dict): data[participant][condition][sensor] -> pd.DataFrame
+        workers (int): Partitions filtered at once, 1 filters serially
+        executor (str): "thread" or "process"
+        sensor (str): Sensor holding the PPG stream
+        **kwargs: Passed to filter_ppg
+
+    Returns:
+        dict( participant{ condition{ filtered pd.DataFrame}})
+    """
+    tasks = [(participant, condition, sensors[sensor], kwargs)
+             for participant, conditions in data.items()
+             for condition, sensors in conditions.items()
+             if sensor in sensors]
+
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        results = [_filter_partition(task) for task in tasks]
+    else:
+        if executor == "process":
+            pool_cls = ProcessPoolExecutor
+        elif executor == "thread":
+            pool_cls = ThreadPoolExecutor
+        else:
+            raise ValueError(f"Unknown executor '{executor}'. Use 'process' or 'thread'.")
+        with pool_cls(max_workers=workers) as pool:
+            results = list(pool.map(_filter_partition, tasks))
+
+    filtered = {}
+    for participant, condition, df in results:
+        filtered.setdefault(participant, {})[condition] = df
+    return filtered
+
+
+def _on_sensor_clock(df: pd.DataFrame, reference: pd.DataFrame, time_col: str = "sensor_clock[ns]",
+                     datetime_col: str = "phone_datetime") -> pd.DataFrame:
+    """
+    Give a stream without a sensor clock (HR) the clock of reference, mapping its phone
+    times through the reference's segment index (query.phone_to_clock). Samples outside
+    every reference segment (or without a phone time) have no clock time and are dropped.
+    Returned unchanged if the reference has no segment with both clocks.
+    """
+    segments = clocked_segments(reference)
+    if not len(segments):
+        return df
+    start_phone, end_phone = segments["start_phone_ns"], segments["end_phone_ns"]
+
+    phone = stream_time_ns(df, None, datetime_col)[0]
+    i = np.searchsorted(start_phone, phone, side="right") - 1
+    inside = (i >= 0) & (phone <= end_phone[np.clip(i, 0, len(segments) - 1)])
+    return df[inside].assign(**{time_col: phone_to_clock(reference, phone[inside])})
+
+
+def resample_condition(data: dict,
+                       category: str,
+                       rate_hz: float = None,
+                       method: str = "linear",
+                       sensors: list = None) -> dict:
+    """
+    Resample every sensor stream of one participant/condition.
+
+    With a common rate, streams without a sensor clock (HR) are first moved onto the
+    sensor clock of the first stream of ALIGN_PRIORITY that has one (see
+    _on_sensor_clock), so every stream ends up on the same grid and reports
+    "sensor_clock[ns]" as its time_col. Without any stream with a sensor clock, or
+    without a common rate, they keep a phone-time grid.
+
+    Args:
+        data (dict): data[category][sensor] -> pd.DataFrame, e.g. all_data[participant]
+        category (str): Exposure condition
+        rate_hz (float): Common target rate. Default None resamples each stream at its own
+                         median rate; pass a rate to put all streams on one shared grid.
+        method (str): See resample_stream
+        sensors (list): Sensors to resample, default all
+
+    Returns:
+        dict( sensor{ resample_stream result}) for the sensors with data
+    """
+    streams = data.get(category, {})
+    reference = None
+    if rate_hz is not None:
+        reference = next((streams[sensor] for sensor in ALIGN_PRIORITY + list(streams)
+                          if isinstance(streams.get(sensor), pd.DataFrame) and not streams[sensor].empty
+                          and "sensor_clock[ns]" in streams[sensor].columns
+                          and "phone_datetime" in streams[sensor].columns), None)
+
+    resampled = {}
+    for sensor in streams:
+        if sensors is not None and sensor not in sensors:
+            continue
+        df = streams[sensor]
+        if reference is not None and not df.empty and "sensor_clock[ns]" not in df.columns:
+            df = _on_sensor_clock(df, reference)
+        result = resample_stream(df, rate_hz=rate_hz, method=method)
+        if result is not None:
+            resampled[sensor] = result
+    return resampled
+
+
+TIMING_COLUMNS = [
+    "participant", "condition", "sensor", "time_col", "samples", "duration_s", "median_rate_hz",
+    "rate_jitter", "drift_ppm", "dropped_samples", "duplicate_timestamps", "non_monotonic",
+]
+
+
+def compute_timing_quality(times, phone_ns=None, drop_factor: float = 1.5) -> dict:
+    """
+    Timing statistics of one stream from a single diff of its int64 clock.
+
+    Args:
+        times (array-like): Timestamps in nanoseconds, in recorded order
+        phone_ns (array-like): Phone timestamps in nanoseconds for the same rows, used
+                               to estimate clock drift. Optional.
+        drop_factor (float): Intervals longer than drop_factor median periods count as dropouts
+
+    Returns:
+        dict with samples, duration_s, median_rate_hz, rate_jitter (median absolute
+        deviation of the interval relative to the median interval), drift_ppm (sensor
+        clock drift against phone time, positive when the sensor clock runs slow),
+        dropped_samples (estimated missing samples inside dropouts), duplicate_timestamps
+        and non_monotonic (backwards steps) counts.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    result = {
+        "samples": int(times.size), "duration_s": np.nan, "median_rate_hz": np.nan, "rate_jitter": np.nan,
+        "drift_ppm": np.nan, "dropped_samples": 0, "duplicate_timestamps": 0, "non_monotonic": 0,
+    }
+    if times.size < 2:
+        return result
+
+    diffs = np.diff(times)
+    result["duplicate_timestamps"] = int(np.count_nonzero(diffs == 0))
+    result["non_monotonic"] = int(np.count_nonzero(diffs < 0))
+    result["duration_s"] = (times.max() - times.min()) / 1e9
+
+    forward = diffs[diffs > 0]
+    if forward.size == 0:
+        return result
+    # np.median partitions rather than fully sorting
+    median_diff = np.median(forward)
+    result["median_rate_hz"] = 1e9 / median_diff
+    result["rate_jitter"] = np.median(np.abs(forward - median_diff)) / median_diff
+
+    long_gaps = forward[forward > drop_factor * median_diff]
+    result["dropped_samples"] = int(np.sum(np.round(long_gaps / median_diff) - 1))
+
+    if phone_ns is not None:
+        phone_ns = np.asarray(phone_ns, dtype=np.int64)
+        valid = phone_ns != np.iinfo(np.int64).min
+        if np.count_nonzero(valid) >= 2:
+            sensor_s = (times[valid] - times[valid][0]) / 1e9
+            offset_s = (phone_ns[valid] - times[valid]) / 1e9
+            if np.ptp(sensor_s) > 0:
+                slope = np.polyfit(sensor_s, offset_s - offset_s[0], 1)[0]
+                result["drift_ppm"] = slope * 1e6
+
+    return result
+
+
+@timed("timing")
+def compute_timing_table(data: dict,
+                         sensors: list = None,
+                         time_col: str = "sensor_clock[ns]",
+                         datetime_col: str = "phone_datetime",
+                         drop_factor: float = 1.5) -> pd.DataFrame:
+    """
+    Timing quality of every participant x condition x sensor stream in one table,
+    working directly on the int64 clock arrays. Streams without a sensor clock (HR)
+    are analysed on phone time and get no drift estimate.
+
+    Args:
+        data (dict): Nested all_data[participant][condition][sensor] frames
+        sensors (list): Sensors to include, default all
+        time_col (str): Sensor clock column
+        datetime_col (str): Phone timestamp column
+        drop_factor (float): See compute_timing_quality
+
+    Returns:
+        pd.DataFrame with TIMING_COLUMNS, one row per non-empty stream
+    """
+    rows = []
+    for participant, conditions in data.items():
+        for condition, streams in conditions.items():
+            for sensor in streams:
+                if sensors is not None and sensor not in sensors:
+                    continue
+                df = streams[sensor]
+                if len(df) == 0:
+                    continue
+
+                times, used_col = stream_time_ns(df, time_col, datetime_col)
+                phone_ns = None
+                if used_col == datetime_col:
+                    times = times[times != np.iinfo(np.int64).min]  # unparseable timestamps
+                elif datetime_col in df.columns:
+                    phone_ns = stream_time_ns(df, time_col=None, datetime_col=datetime_col)[0]
+
+                stats = compute_timing_quality(times, phone_ns, drop_factor)
+                rows.append({"participant": participant, "condition": condition, "sensor": sensor,
+                             "time_col": used_col, **stats})
+
+    return pd.DataFrame(rows, columns=TIMING_COLUMNS)
+
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+from loader import SOURCE_FILES_ATTR, build_segments, set_segments, segment_array
+
+
+def _to_ns(value) -> int:
+    """Convert an int (nanoseconds), string, datetime or Timestamp to int nanoseconds."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return pd.Timestamp(value).as_unit("ns").value
+
+
+def sort_stream(df: pd.DataFrame, time_col: str = "sensor_clock[ns]") -> pd.DataFrame:
+    """
+    Return a stream sorted by its clock, untouched (no copy) if it already is.
+
+    Sorting mixes rows of different source files, so the source file ranges are dropped
+    and the segment index is rebuilt without file information.
+
+    Args:
+        df (pd.DataFrame): Sensor stream
+        time_col (str): Clock column, streams without it (HR) are sorted by phone_datetime
+
+    Returns:
+        pd.DataFrame
+    """
+    if df.empty:
+        return df
+    key = time_col if time_col in df.columns else "phone_datetime"
+    if df[key].is_monotonic_increasing:
+        return df
+
+    attrs = dict(df.attrs)
+    sorted_df = df.sort_values(key, kind="stable", ignore_index=True)
+    attrs.pop(SOURCE_FILES_ATTR, None)
+    sorted_df.attrs = attrs
+    set_segments(sorted_df, build_segments(sorted_df))
+    return sorted_df
+
+
+def sort_streams(all_data: dict, time_col: str = "sensor_clock[ns]") -> dict:
+    """
+    Apply sort_stream to every frame of all_data[participant][condition][sensor].
+
+    Returns:
+        dict with the same layout, sharing every frame that was already sorted
+    """
+    return {
+        participant: {
+            condition: {sensor: sort_stream(df, time_col) for sensor, df in sensors.items()}
+            for condition, sensors in conditions.items()
+        }
+        for participant, conditions in all_data.items()
+    }
+
+
+def clocked_segments(df: pd.DataFrame) -> np.ndarray:
+    """Segments of df that have both a phone time and a sensor clock, sorted by phone time."""
+    segments = segment_array(df)
+    missing = np.iinfo(np.int64).min
+    segments = segments[(segments["start_phone_ns"] != missing) & (segments["start_clock_ns"] != missing)]
+    return segments[np.argsort(segments["start_phone_ns"], kind="stable")]
+
+
+def phone_to_clock(df: pd.DataFrame, phone_ns) -> np.ndarray:
+    """
+    Map phone times onto the sensor clock through the stream's segment index, linearly
+    within each segment. Times falling in a gap map to the start of the next segment
+    (or the end of the last one).
+
+    Args:
+        df (pd.DataFrame): Sensor stream with sensor_clock[ns] and phone_datetime
+        phone_ns (array-like): Phone times in nanoseconds
+
+    Returns:
+        np.ndarray of int64 sensor clock values
+    """
+    segments = clocked_segments(df)
+    phone_ns = np.atleast_1d(np.asarray(phone_ns, dtype=np.int64))
+    if not len(segments):
+        raise ValueError("Stream has no segments with both phone time and sensor clock.")
+
+    start_phone, end_phone = segments["start_phone_ns"], segments["end_phone_ns"]
+    start_clock, end_clock = segments["start_clock_ns"], segments["end_clock_ns"]
+
+    # Segment starting at or before each time (the first segment for earlier times)
+    i = np.clip(np.searchsorted(start_phone, phone_ns, side="right") - 1, 0, len(segments) - 1)
+    phone_span = end_phone[i] - start_phone[i]
+    scale = np.divide(end_clock[i] - start_clock[i], phone_span,
+                      out=np.ones(len(i)), where=phone_span > 0)
+    offset = np.clip(phone_ns - start_phone[i], 0, None)
+    clock = start_clock[i] + np.round(np.minimum(offset, phone_span) * scale).astype(np.int64)
+
+    # Past the end of segment i: inside a gap, snap to the next segment's start
+    in_gap = (phone_ns > end_phone[i]) & (i + 1 < len(segments))
+    clock[in_gap] = start_clock[np.minimum(i + 1, len(segments) - 1)][in_gap]
+    return clock
+
+
+def _search_bounds(df: pd.DataFrame, starts, ends, by: str, time_col: str):
+    """Row bounds [lo, hi) of every [start, end) range with one searchsorted per side."""
+    starts = np.array([_to_ns(value) for value in starts], dtype=np.int64)
+    ends = np.array([_to_ns(value) for value in ends], dtype=np.int64)
+
+    if by == "clock":
+        if time_col not in df.columns:
+            raise ValueError(f"Stream has no '{time_col}' column to search by clock, use by='phone'.")
+        key = np.asarray(df[time_col].to_numpy(), dtype=np.int64)
+    elif by == "phone":
+        phone = df["phone_datetime"]
+        if not pd.api.types.is_datetime64_any_dtype(phone):
+            phone = pd.to_datetime(phone, errors="coerce")
+        if by == "phone" and time_col in df.columns and not phone.is_monotonic_increasing:
+            # Phone timestamps jitter, search the clock through the phone <-> clock mapping
+            key = np.asarray(df[time_col].to_numpy(), dtype=np.int64)
+            starts, ends = phone_to_clock(df, starts), phone_to_clock(df, ends)
+        else:
+            key = phone.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    else:
+        raise ValueError("by must be 'clock' or 'phone'.")
+
+    return np.searchsorted(key, starts, side="left"), np.searchsorted(key, ends, side="left")
+
+
+def query_range(df: pd.DataFrame, start, end, by: str = "phone",
+                time_col: str = "sensor_clock[ns]") -> pd.DataFrame:
+    """
+    Rows of a sorted stream in [start, end), found by binary search in O(log n).
+
+    The result is a positional slice of df (a view, not a boolean-mask copy).
+    Streams must be sorted by their clock, see sort_stream.
+
+    Args:
+        df (pd.DataFrame): Sensor stream
+        start, end: Range bounds, int nanoseconds or anything pd.Timestamp accepts
+        by (str): "phone" to interpret bounds as phone time, "clock" for the sensor clock;
+                  "clock" raises ValueError on streams without time_col (HR)
+        time_col (str): Sensor clock column
+
+    Returns:
+        pd.DataFrame
+    """
+    if df.empty:
+        return df
+    lo, hi = _search_bounds(df, [start], [end], by, time_col)
+    return df.iloc[lo[0]:max(lo[0], hi[0])]
+
+
+def query_ranges(all_data: dict, ranges, by: str = "phone",
+                 time_col: str = "sensor_clock[ns]") -> list:
+    """
+    Batch version of query_range, e.g. every heat-event window of every participant.
+
+    Ranges on the same stream share a single vectorised searchsorted call.
+
+    Args:
+        all_data (dict): Nested all_data[participant][condition][sensor] frames
+        ranges (iterable): (participant, condition, sensor, start, end) tuples, or a
+                           DataFrame with those columns
+        by (str): "phone" or "clock", see query_range
+        time_col (str): Sensor clock column
+
+    Returns:
+        list of pd.DataFrame slices in the order of ranges
+    """
+    if isinstance(ranges, pd.DataFrame):
+        ranges = ranges[["participant", "condition", "sensor", "start", "end"]].itertuples(index=False, name=None)
+    ranges = list(ranges)
+
+    by_stream = {}
+    for i, (participant, condition, sensor, start, end) in enumerate(ranges):
+        by_stream.setdefault((participant, condition, sensor), []).append((i, start, end))
+
+    results = [None] * len(ranges)
+    for (participant, condition, sensor), items in by_stream.items():
+        df = all_data[participant][condition][sensor]
+        if df.empty:
+            for i, _, _ in items:
+                results[i] = df
+            continue
+        lo, hi = _search_bounds(df, [start for _, start, _ in items], [end for _, _, end in items], by, time_col)
+        for (i, _, _), a, b in zip(items, lo, hi):
+            results[i] = df.iloc[a:max(a, b)]
+
+    return results
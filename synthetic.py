@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import CONDITIONS
+
+# Column headers of the Polar Sensor Logger exports, as mapped in loader.COLUMN_MAPPING
+SYNTHETIC_HEADERS = {
+    "ppg": ["Phone timestamp", "sensor timestamp [ns]", "channel 0", "channel 1", "channel 2", "ambient"],
+    "acc": ["Phone timestamp", "sensor timestamp [ns]", "X [mg]", "Y [mg]", "Z [mg]"],
+    "gyro": ["Phone timestamp", "sensor timestamp [ns]", "X [dps]", "Y [dps]", "Z [dps]"],
+    "hr": ["Phone timestamp", "HR [bpm]"],
+}
+SYNTHETIC_SUFFIXES = {"ppg": "PPG", "acc": "ACC", "gyro": "GYRO", "hr": "HR"}
+SYNTHETIC_RATES = {"ppg": 135.0, "acc": 52.0, "gyro": 52.0, "hr": 1.0}
+
+
+def _sample_clock(rng, n: int, rate_hz: float, jitter_ns: float, drift_ppm: float) -> np.ndarray:
+    """Sensor clock of n samples at rate_hz with per-sample jitter and a constant drift."""
+    period = 1e9 / rate_hz * (1 + drift_ppm * 1e-6)
+    steps = period + rng.normal(0.0, jitter_ns, n) if jitter_ns else np.full(n, period)
+    clock = np.cumsum(np.maximum(steps, 1.0))
+    return np.round(clock - clock[0]).astype(np.int64)
+
+
+def _drop_gaps(rng, clock: np.ndarray, gaps: int, gap_seconds: float) -> np.ndarray:
+    """Mask removing `gaps` windows of gap_seconds at random positions of the recording."""
+    keep = np.ones(len(clock), dtype=bool)
+    if gaps <= 0 or len(clock) == 0:
+        return keep
+    gap_ns = int(gap_seconds * 1e9)
+    for start in rng.uniform(0, max(clock[-1] - gap_ns, 1), gaps):
+        keep &= ~((clock >= start) & (clock < start + gap_ns))
+    return keep
+
+
+def _sensor_values(rng, sensor: str, clock: np.ndarray, heart_rate_hz: float) -> dict:
+    """Plausible channel values: pulsatile PPG, gravity + motion for ACC, small GYRO noise."""
+    t = clock / 1e9
+    n = len(clock)
+    if sensor == "ppg":
+        pulse = np.sin(2 * np.pi * heart_rate_hz * t)
+        ambient = rng.integers(-3000, -1000, n)
+        return {
+            "channel 0": (250_000 + 20_000 * pulse + rng.normal(0, 800, n)).astype(np.int64),
+            "channel 1": (240_000 + 18_000 * pulse + rng.normal(0, 800, n)).astype(np.int64),
+            "channel 2": (230_000 + 16_000 * pulse + rng.normal(0, 800, n)).astype(np.int64),
+            "ambient": ambient,
+        }
+    if sensor == "acc":
+        sway = 50 * np.sin(2 * np.pi * 0.3 * t)
+        return {
+            "X [mg]": np.round(sway + rng.normal(0, 15, n)).astype(np.int64),
+            "Y [mg]": np.round(-sway + rng.normal(0, 15, n)).astype(np.int64),
+            "Z [mg]": np.round(1000 + rng.normal(0, 15, n)).astype(np.int64),
+        }
+    if sensor == "gyro":
+        return {axis: np.round(rng.normal(0, 2.0, n), 2) for axis in ("X [dps]", "Y [dps]", "Z [dps]")}
+    if sensor == "hr":
+        return {"HR [bpm]": np.round(heart_rate_hz * 60 + 3 * np.sin(2 * np.pi * t / 300) + rng.normal(0, 1, n)).astype(np.int64)}
+    raise ValueError(f"Unknown sensor '{sensor}'.")
+
+
+def write_sensor_file(file_path: str, sensor: str, phone_ns: np.ndarray, clock: np.ndarray, values: dict):
+    """Write one semicolon delimited export with the Polar header of the sensor."""
+    columns = {"Phone timestamp": np.datetime_as_string(phone_ns.astype("datetime64[ns]"), unit="ms")}
+    if "sensor timestamp [ns]" in SYNTHETIC_HEADERS[sensor]:
+        columns["sensor timestamp [ns]"] = clock
+    columns.update(values)
+    df = pd.DataFrame(columns)[SYNTHETIC_HEADERS[sensor]]
+    df.to_csv(file_path, sep=";", index=False)
+
+
+def generate_dataset(data_dir: str,
+                     participants=2,
+                     hours_per_condition: float = 0.25,
+                     rates: dict = None,
+                     sensors: list = None,
+                     conditions: list = None,
+                     files_per_condition: int = 1,
+                     gaps_per_file: int = 1,
+                     gap_seconds: float = 30.0,
+                     clock_jitter_ns: float = 50_000.0,
+                     clock_drift_ppm: float = 20.0,
+                     phone_jitter_ms: float = 15.0,
+                     start: str = "2024-05-01T08:00:00",
+                     seed: int = 0) -> dict:
+    """
+    Write a deterministic synthetic study in the DATA_DIR/<participant>/<condition>/ layout.
+
+    Every participant/condition gets files_per_condition consecutive recordings per sensor,
+    each with gaps_per_file dropped windows, a jittered and drifting sensor clock and a
+    phone timestamp carrying delivery jitter. The same arguments always produce the same
+    files.
+
+    Args:
+        data_dir (str): Root directory to write to
+        participants (int or list): Number of participants (named P01, P02, ...) or names
+        hours_per_condition (float): Recorded hours per condition, split over the files
+        rates (dict): Sample rate per sensor in Hz, default SYNTHETIC_RATES
+        sensors (list): Sensors to write, default all of SYNTHETIC_HEADERS
+        conditions (list): Conditions to write, default config.CONDITIONS
+        files_per_condition (int): Recordings per sensor and condition
+        gaps_per_file (int): Dropped windows per file
+        gap_seconds (float): Length of each dropped window
+        clock_jitter_ns (float): Std of the sensor clock sample period
+        clock_drift_ppm (float): Sensor clock drift
+        phone_jitter_ms (float): Std of the phone timestamp delivery jitter
+        start (str): Start of the first recording, conditions follow each other by day
+        seed (int): Random seed
+
+    Returns:
+        dict( participant{ condition{ sensor{ rows}}}) rows written per stream
+    """
+    if isinstance(participants, int):
+        participants = [f"P{i + 1:02d}" for i in range(participants)]
+    rates = {**SYNTHETIC_RATES, **(rates or {})}
+    sensors = sensors or list(SYNTHETIC_HEADERS)
+    conditions = conditions or CONDITIONS
+    file_seconds = hours_per_condition * 3600 / files_per_condition
+    start_ns = pd.Timestamp(start).as_unit("ns").value
+
+    written = {}
+    for p_idx, participant in enumerate(participants):
+        written[participant] = {}
+        for c_idx, condition in enumerate(conditions):
+            cond_dir = os.path.join(data_dir, participant, condition)
+            os.makedirs(cond_dir, exist_ok=True)
+            written[participant][condition] = {sensor: 0 for sensor in sensors}
+            for f_idx in range(files_per_condition):
+                # One generator per file, so adding participants doesn't change existing ones
+                rng = np.random.default_rng([seed, p_idx, c_idx, f_idx])
+                heart_rate_hz = rng.uniform(1.0, 1.6)
+                file_start_ns = start_ns + c_idx * 86_400_000_000_000 + int(f_idx * (file_seconds + 600) * 1e9)
+                stamp = pd.Timestamp(file_start_ns).strftime("%Y%m%d_%H%M%S")
+
+                for sensor in sensors:
+                    n = int(file_seconds * rates[sensor])
+                    clock = _sample_clock(rng, n, rates[sensor], clock_jitter_ns, clock_drift_ppm)
+                    keep = _drop_gaps(rng, clock, gaps_per_file, gap_seconds)
+                    clock = clock[keep]
+                    phone_ns = file_start_ns + clock + np.round(rng.normal(0, phone_jitter_ms * 1e6, len(clock))).astype(np.int64)
+                    # Sensor clocks count from an arbitrary epoch
+                    sensor_clock = clock + 600_000_000_000_000_000 + f_idx * int((file_seconds + 600) * 1e9)
+                    values = _sensor_values(rng, sensor, clock, heart_rate_hz)
+
+                    file_name = f"Polar_Sense_{participant}_{stamp}_{SYNTHETIC_SUFFIXES[sensor]}.txt"
+                    write_sensor_file(os.path.join(cond_dir, file_name), sensor, phone_ns, sensor_clock, values)
+                    written[participant][condition][sensor] += len(clock)
+
+    return written
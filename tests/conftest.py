@@ -0,0 +1,33 @@
+import pytest
+
+
+def write_acc(path, start_ns, n):
+    """Write an n row ACC export with one sample per second from start_ns."""
+    lines = ["Phone timestamp;sensor timestamp [ns];X [mg];Y [mg];Z [mg]"]
+    for i in range(n):
+        lines.append(f"2024-05-01T10:00:{i:02d}.000;{start_ns + i * 1_000_000_000};{i};{-i};1000")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_ppg(path, start_ns, n):
+    """Write an n row PPG export with one sample per second from start_ns."""
+    lines = ["Phone timestamp;sensor timestamp [ns];channel 0;channel 1;channel 2;ambient"]
+    for i in range(n):
+        lines.append(f"2024-05-01T10:00:{i:02d}.000;{start_ns + i * 1_000_000_000};{i};1;2;3")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """
+    Raw data root with P02 and P01 (listed out of order), each with two pre_heat_exposure
+    ACC files that also sort out of order: b_ACC.txt (10-12 s) and a_ACC.txt (0-1 s).
+    """
+    for participant in ["P02", "P01"]:
+        cond = tmp_path / "data" / participant / "pre_heat_exposure"
+        cond.mkdir(parents=True)
+        write_acc(cond / "b_ACC.txt", 10_000_000_000, 3)
+        write_acc(cond / "a_ACC.txt", 0, 2)
+    return str(tmp_path / "data")
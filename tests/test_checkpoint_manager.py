@@ -1,7 +1,14 @@
 import os
+import shutil
 import tempfile
 import unittest
-from checkpoint_manager import CheckpointManager
+
+import numpy as np
+import pandas as pd
+
+from checkpoint_manager import CheckpointManager, PartitionedCheckpointManager, MemmapCheckpointManager
+from conftest import write_acc
+from loader import get_source_files, set_source_files
 
 class TestCheckpointManager(unittest.TestCase):
     def setUp(self):
@@ -38,5 +45,145 @@ class TestCheckpointManager(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             self.checkpoint_mgr.load()
 
+
+def _sample_data():
+    ppg = pd.DataFrame({
+        "phone_datetime": ["2024-05-01T10:00:00.000", "2024-05-01T10:00:00.010"],
+        "sensor_clock[ns]": [0, 10_000_000],
+        "ppg_ch0": [1.0, 2.0],
+        "ppg_ch1": [3.0, 4.0],
+    })
+    set_source_files(ppg, [{"file_id": 0, "file": "a_PPG.txt", "start": 0, "stop": 2}])
+    acc = pd.DataFrame({"sensor_clock[ns]": [5], "acc_x[mg]": [7.0]})
+    return {
+        "P01": {"pre_heat_exposure": {"ppg": ppg, "acc": acc, "hr": pd.DataFrame()}},
+        "P02": {"pre_heat_exposure": {"ppg": ppg.copy(), "acc": pd.DataFrame(), "hr": pd.DataFrame()}},
+    }
+
+
+class TestPartitionedCheckpointManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.checkpoint_mgr = PartitionedCheckpointManager(os.path.join(self.temp_dir, "ckpt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_save_and_load(self):
+        data = _sample_data()
+        self.checkpoint_mgr.save(data)
+        loaded = self.checkpoint_mgr.load()
+
+        self.assertEqual(sorted(loaded), ["P01", "P02"])
+        pd.testing.assert_frame_equal(loaded["P01"]["pre_heat_exposure"]["ppg"], data["P01"]["pre_heat_exposure"]["ppg"])
+        self.assertTrue(loaded["P01"]["pre_heat_exposure"]["hr"].empty)
+        self.assertEqual(get_source_files(loaded["P01"]["pre_heat_exposure"]["ppg"])[0]["file"], "a_PPG.txt")
+
+    def test_selective_load_with_columns(self):
+        self.checkpoint_mgr.save(_sample_data())
+        loaded = self.checkpoint_mgr.load(
+            participants=["P01"], sensors=["ppg", "acc"], columns=["sensor_clock[ns]", "ppg_ch0"]
+        )
+
+        self.assertEqual(list(loaded), ["P01"])
+        self.assertEqual(set(loaded["P01"]["pre_heat_exposure"]), {"ppg", "acc"})
+        self.assertEqual(list(loaded["P01"]["pre_heat_exposure"]["ppg"].columns), ["sensor_clock[ns]", "ppg_ch0"])
+        self.assertEqual(list(loaded["P01"]["pre_heat_exposure"]["acc"].columns), ["sensor_clock[ns]"])
+
+    def test_exists_and_missing(self):
+        self.assertFalse(self.checkpoint_mgr.exists())
+        with self.assertRaises(FileNotFoundError):
+            self.checkpoint_mgr.load()
+
+        self.checkpoint_mgr.save(_sample_data())
+        self.assertTrue(self.checkpoint_mgr.exists())
+
+
+class TestMemmapCheckpointManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.checkpoint_mgr = MemmapCheckpointManager(os.path.join(self.temp_dir, "ckpt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_save_and_load_zero_copy(self):
+        self.checkpoint_mgr.save(_sample_data())
+        ppg = self.checkpoint_mgr.load(participants=["P01"])["P01"]["pre_heat_exposure"]["ppg"]
+
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(ppg["phone_datetime"]))
+        self.assertEqual(ppg["ppg_ch0"].tolist(), [1.0, 2.0])
+        base = ppg["sensor_clock[ns]"].to_numpy()
+        while base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        self.assertIsInstance(base, np.memmap)
+
+        arrays = self.checkpoint_mgr.load_arrays(sensors=["ppg"], columns=["ppg_ch0"])
+        channel = arrays["P02"]["pre_heat_exposure"]["ppg"]["ppg_ch0"]
+        self.assertIsInstance(channel, np.memmap)
+        self.assertFalse(channel.flags.writeable)
+        self.assertEqual(self.checkpoint_mgr.load()["P02"]["pre_heat_exposure"]["acc"].shape, (0, 0))
+
+
+class TestIncrementalRefresh(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.temp_dir, "data")
+        self.cond_dir = os.path.join(self.data_dir, "P01", "pre_heat_exposure")
+        os.makedirs(self.cond_dir)
+        write_acc(os.path.join(self.cond_dir, "a_ACC.txt"), 0, 2)
+        write_acc(os.path.join(self.cond_dir, "b_ACC.txt"), 10_000_000_000, 3)
+        self.checkpoint_mgr = PartitionedCheckpointManager(os.path.join(self.temp_dir, "ckpt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _acc(self):
+        return self.checkpoint_mgr.load(sensors=["acc"])["P01"]["pre_heat_exposure"]["acc"]
+
+    def test_refresh_builds_then_noop(self):
+        changes = self.checkpoint_mgr.refresh(data_dir=self.data_dir, workers=1)
+        self.assertEqual(len(changes["added"]), 2)
+        self.assertEqual(len(self._acc()), 5)
+
+        changes = self.checkpoint_mgr.refresh(data_dir=self.data_dir, workers=1)
+        self.assertEqual(changes, {"added": [], "changed": [], "removed": []})
+
+    def test_refresh_merges_new_changed_and_removed_files(self):
+        self.checkpoint_mgr.refresh(data_dir=self.data_dir, workers=1)
+
+        os.remove(os.path.join(self.cond_dir, "a_ACC.txt"))
+        write_acc(os.path.join(self.cond_dir, "b_ACC.txt"), 10_000_000_000, 4)
+        write_acc(os.path.join(self.cond_dir, "c_ACC.txt"), 20_000_000_000, 1)
+        os.makedirs(os.path.join(self.data_dir, "P02", "pre_heat_exposure"))
+        write_acc(os.path.join(self.data_dir, "P02", "pre_heat_exposure", "a_ACC.txt"), 0, 1)
+
+        changes = self.checkpoint_mgr.refresh(data_dir=self.data_dir, workers=1)
+
+        self.assertEqual(changes["removed"], ["P01/pre_heat_exposure/a_ACC.txt"])
+        self.assertEqual(changes["changed"], ["P01/pre_heat_exposure/b_ACC.txt"])
+        self.assertEqual(len(changes["added"]), 2)
+
+        acc = self._acc()
+        self.assertEqual(acc["sensor_clock[ns]"].iloc[0], 10_000_000_000)
+        segments = self.checkpoint_mgr.read_segments(participants=["P01"], sensors=["acc"])
+        self.assertEqual(segments["file"].tolist(), ["b_ACC.txt", "c_ACC.txt"])
+        self.assertEqual(segments["samples"].tolist(), [4, 1])
+        self.assertEqual(len(acc), 5)
+        self.assertEqual([src["file"] for src in get_source_files(acc)], ["b_ACC.txt", "c_ACC.txt"])
+
+        loaded = self.checkpoint_mgr.load()
+        self.assertEqual(sorted(loaded), ["P01", "P02"])
+        self.assertTrue(loaded["P02"]["intra_heat_exposure"]["ppg"].empty)
+
+    def test_refresh_with_hash_ignores_touched_files(self):
+        self.checkpoint_mgr.refresh(data_dir=self.data_dir, use_hash=True, workers=1)
+        path = os.path.join(self.cond_dir, "a_ACC.txt")
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        changes = self.checkpoint_mgr.refresh(data_dir=self.data_dir, use_hash=True, workers=1)
+        self.assertEqual(changes["changed"], [])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_cli_ingest_then_rates_and_coverage(data_dir, tmp_path, capsys):
+    checkpoint = str(tmp_path / "ck")
+    common = ["--data-dir", data_dir, "--format", "parquet", "--checkpoint", checkpoint]
+    assert cli.main(["ingest", *common]) == 0
+    assert os.path.exists(os.path.join(checkpoint, "_index.json"))
+
+    rates_csv = str(tmp_path / "rates.csv")
+    assert cli.main(["rates", *common, "--sensors", "acc", "--output", rates_csv]) == 0
+    with open(rates_csv) as f:
+        assert len(f.read().splitlines()) == 3  # header + the acc stream of P01 and P02
+
+    assert cli.main(["coverage", *common, "--sensors", "acc", "--conditions", "pre_heat_exposure"]) == 0
+    assert "P01" in capsys.readouterr().out
+
+
+def test_cli_non_plot_commands_do_not_import_plotting(data_dir, tmp_path):
+    checkpoint = str(tmp_path / "ck")
+    script = (
+        "import sys, cli\n"
+        f"cli.main(['ingest', '--data-dir', {data_dir!r}, '--format', 'parquet', '--checkpoint', {checkpoint!r}])\n"
+        f"cli.main(['rates', '--format', 'parquet', '--checkpoint', {checkpoint!r}])\n"
+        f"cli.main(['inspect', '--format', 'parquet', '--checkpoint', {checkpoint!r}])\n"
+        "heavy = [m for m in ('matplotlib', 'seaborn', 'scipy', 'visualiser') if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "memmap", "pickle"])
+def test_cli_partial_ingest_keeps_other_partitions(tmp_path, fmt):
+    from synthetic import generate_dataset
+    data_dir = str(tmp_path / "data")
+    generate_dataset(data_dir, participants=3, hours_per_condition=0.01, sensors=["acc", "hr"])
+    checkpoint = str(tmp_path / ("ck.pkl" if fmt == "pickle" else "ck"))
+    common = ["--data-dir", data_dir, "--format", fmt, "--checkpoint", checkpoint]
+
+    assert cli.main(["ingest", *common, "--full"]) == 0
+    checkpoint_mgr = cli._checkpoint_manager(fmt, checkpoint)
+    assert cli.main(["ingest", *common, "--participants", "P02"]) == 0
+    assert sorted(checkpoint_mgr.load()) == ["P01", "P02", "P03"]
+    assert cli.main(["ingest", *common, "--sensors", "hr", "--conditions", "pre_heat_exposure"]) == 0
+
+    data = checkpoint_mgr.load()
+    assert sorted(data) == ["P01", "P02", "P03"]
+    assert all(not data[p]["intra_heat_exposure"]["acc"].empty for p in data)
+    if fmt != "pickle":
+        assert len(checkpoint_mgr.read_index()["manifest"]) == 3 * 3 * 2
+        # Nothing changed on disk, so nothing is re-parsed
+        assert checkpoint_mgr.refresh(data_dir) == {"added": [], "changed": [], "removed": []}
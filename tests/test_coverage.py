@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from coverage import (
+    MinuteCoverage, CoverageAccumulator, compute_coverage, coverage_table, load_or_compute_coverage, union_days,
+)
+
+
+def _acc(times):
+    return pd.DataFrame({"phone_datetime": pd.to_datetime(times), "acc_x[mg]": np.zeros(len(times))})
+
+
+def _data():
+    acc = _acc(["2024-05-01 23:59:10", "2024-05-01 23:59:50", "2024-05-02 00:00:05", "2024-05-02 10:15:00", None])
+    ppg = pd.DataFrame({
+        "phone_datetime": pd.to_datetime(["2024-05-01 10:00:00", "2024-05-01 10:01:00", "2024-05-01 10:02:00"]),
+        "ppg_ch0": [1.0, np.nan, 3.0],
+    })
+    return {"P01": {"pre_heat_exposure": {"acc": acc, "ppg": ppg}, "intra_heat_exposure": {"acc": pd.DataFrame()}}}
+
+
+def test_minute_coverage_bitmap():
+    data = _data()
+    coverage = compute_coverage(data)
+    acc = coverage["P01"]["pre_heat_exposure"]["acc"]
+
+    assert acc.days.tolist() == list(np.array(["2024-05-01", "2024-05-02"], dtype="datetime64[D]"))
+    assert acc.total_minutes() == 3
+    assert acc.minutes_per_day().tolist() == [1, 2]
+    assert acc.bitmap[0, 23 * 60 + 59] and acc.bitmap[1, 0] and acc.bitmap[1, 10 * 60 + 15]
+    assert acc.binned(10)[1].nonzero()[0].tolist() == [0, 61]
+    # ppg counts only minutes where ppg_ch0 is present
+    assert coverage["P01"]["pre_heat_exposure"]["ppg"].total_minutes() == 2
+    assert coverage["P01"]["intra_heat_exposure"]["acc"].total_minutes() == 0
+
+    # raw frames are not modified
+    assert list(data["P01"]["pre_heat_exposure"]["acc"].columns) == ["phone_datetime", "acc_x[mg]"]
+
+
+def test_union_days_and_reindex():
+    a = MinuteCoverage.from_timestamps(pd.to_datetime(["2024-05-03 00:01"]).as_unit("ns").asi8)
+    b = MinuteCoverage.from_timestamps(pd.to_datetime(["2024-05-01 00:02"]).as_unit("ns").asi8)
+    days = union_days([a, b, MinuteCoverage.empty()])
+
+    assert len(days) == 2
+    assert a.reindex(days)[:, 1].tolist() == [False, True]
+    assert a.binned(60, days=days).shape == (2, 24)
+
+
+def test_load_or_compute_coverage_cache(tmp_path):
+    cache_file = os.path.join(tmp_path, "coverage.pkl")
+    data = _data()
+
+    first = load_or_compute_coverage(data, cache_file, sensors=["acc"])
+    assert os.path.exists(cache_file)
+    again = load_or_compute_coverage(data, cache_file, sensors=["acc"])
+    assert again["P01"]["pre_heat_exposure"]["acc"].total_minutes() == first["P01"]["pre_heat_exposure"]["acc"].total_minutes()
+
+    data["P01"]["pre_heat_exposure"]["acc"] = _acc(["2024-05-01 12:00:00"])
+    changed = load_or_compute_coverage(data, cache_file, sensors=["acc"])
+    assert changed["P01"]["pre_heat_exposure"]["acc"].total_minutes() == 1
+
+
+def test_coverage_accumulator_merges_pieces():
+    data = _data()
+    pieces = [{"P01": {condition: streams}} for condition, streams in data["P01"].items()]
+
+    accumulator = CoverageAccumulator(sensors=["acc"])
+    for piece in pieces:
+        accumulator.update(piece)
+
+    table = coverage_table(accumulator.result())
+    assert table.to_dict("records") == coverage_table(compute_coverage(data, sensors=["acc"])).to_dict("records")
+    assert table["minutes"].tolist() == [3, 0]
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from checkpoint_manager import PartitionedCheckpointManager
+from conftest import write_acc, write_ppg
+from coverage import compute_coverage
+from dataset import Dataset
+from loader import load_all_participants
+from preprocessor import compute_timing_table, merge_data
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # Overrides the conftest layout: 20 s of ACC and PPG per participant
+    for participant in ["P01", "P02"]:
+        cond = tmp_path / "data" / participant / "pre_heat_exposure"
+        cond.mkdir(parents=True)
+        write_acc(cond / "a_ACC.txt", 0, 20)
+        write_ppg(cond / "a_PPG.txt", 0, 20)
+    return str(tmp_path / "data")
+
+
+def test_dataset_matches_loaded_dict(data_dir):
+    loaded = load_all_participants(data_dir=data_dir)
+    ds = Dataset(data_dir=data_dir)
+
+    assert list(ds) == list(loaded)
+    assert list(ds["P01"]) == list(loaded["P01"])
+    assert list(ds["P01"]["pre_heat_exposure"]) == list(loaded["P01"]["pre_heat_exposure"])
+    pd.testing.assert_frame_equal(ds["P01"]["pre_heat_exposure"]["acc"], loaded["P01"]["pre_heat_exposure"]["acc"])
+    assert ds["P01"]["post_heat_exposure"]["acc"].empty
+
+    # Unchanged analysis functions accept the dataset
+    pd.testing.assert_frame_equal(compute_timing_table(ds), compute_timing_table(loaded))
+    assert compute_coverage(ds)["P02"]["pre_heat_exposure"]["ppg"].total_minutes() == 1
+    assert len(merge_data(ds["P01"], "pre_heat_exposure")) == 20
+
+
+def test_dataset_lru_budget_and_stats(data_dir):
+    ds = Dataset(data_dir=data_dir, budget_bytes=0)
+    acc = ds["P01"]["pre_heat_exposure"]["acc"]
+    assert ds["P01"]["pre_heat_exposure"]["acc"] is acc
+    ds["P02"]["pre_heat_exposure"]["acc"]  # evicts P01 acc
+    ds["P01"]["pre_heat_exposure"]["acc"]  # loaded again
+
+    info = ds.cache_info()
+    assert (info["hits"], info["misses"], info["evictions"]) == (1, 3, 2)
+    assert info["frames"] == 1
+
+    ds = Dataset(data_dir=data_dir)
+    for _ in range(2):
+        ds["P01"]["pre_heat_exposure"]["ppg"]
+    assert ds.cache_info()["hits"] == 1 and ds.cache_info()["evictions"] == 0
+
+    with pytest.raises(KeyError):
+        ds["P99"]
+
+
+def test_dataset_from_checkpoint(data_dir, tmp_path):
+    checkpoint = PartitionedCheckpointManager(str(tmp_path / "ck"))
+    checkpoint.save(load_all_participants(data_dir=data_dir))
+
+    ds = Dataset(checkpoint, columns=["sensor_clock[ns]"])
+    acc = ds["P02"]["pre_heat_exposure"]["acc"]
+    assert list(acc.columns) == ["sensor_clock[ns]"]
+    assert len(acc) == 20
+
+
+def test_sensor_filter_loads_only_requested_streams(data_dir):
+    ds = Dataset(data_dir=data_dir)
+    compute_coverage(ds, sensors=["ppg"])
+    # One ppg frame per participant and condition, no other sensor is parsed
+    assert ds.cache_info()["misses"] == 2 * 3
+
+    ds = Dataset(data_dir=data_dir)
+    table = compute_timing_table(ds, sensors=["acc"])
+    assert set(table["sensor"]) == {"acc"}
+    assert ds.cache_info()["misses"] == 2 * 3
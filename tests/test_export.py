@@ -0,0 +1,54 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from export import export_figures
+
+
+def _stream(start, value_col):
+    times = pd.date_range(start, periods=120, freq="30s")
+    return pd.DataFrame({"phone_datetime": times, value_col: np.ones(len(times))})
+
+
+def _data():
+    return {
+        participant: {
+            "pre_heat_exposure": {"acc": _stream(f"2024-05-0{i + 1} 08:00", "acc_x[mg]"),
+                                  "ppg": _stream(f"2024-05-0{i + 1} 08:00", "ppg_ch0")},
+            "intra_heat_exposure": {"acc": _stream(f"2024-05-0{i + 1} 12:00", "acc_x[mg]"),
+                                    "ppg": _stream(f"2024-05-0{i + 1} 12:00", "ppg_ch0")},
+        }
+        for i, participant in enumerate(["P01", "P02"])
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_export_figures_writes_files_and_closes_figures(tmp_path, workers):
+    out = tmp_path / "figures"
+    paths = export_figures(_data(), str(out), fmt="svg", workers=workers)
+
+    names = sorted(os.path.basename(path) for path in paths)
+    assert names == sorted([
+        "ppg_minutes_stacked.svg", "coverage_per_participant.svg",
+        "heatmap_P01.svg", "heatmap_P02.svg", "heatmap_raster_P01.svg", "heatmap_raster_P02.svg",
+    ])
+    assert all(os.path.getsize(path) > 0 for path in paths)
+    assert plt.get_fignums() == []
+
+
+def test_export_figures_in_process_keeps_callers_figures(tmp_path):
+    fig = plt.figure()
+    try:
+        paths = export_figures(_data(), str(tmp_path), fmt="svg", plots=["heatmap"], workers=1)
+        assert len(paths) == 2
+        assert plt.get_fignums() == [fig.number]
+    finally:
+        plt.close(fig)
+
+
+def test_export_figures_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_figures(_data(), str(tmp_path), fmt="bmp")
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cli
+
+from features import sliding_windows, window_features, extract_features, FeatureTable, FeatureWriter, KEY_COLUMNS
+from loader import load_all_participants, iter_participant_data
+from preprocessor import consume_stream
+from synthetic import generate_dataset
+
+
+def _stream():
+    # 100 Hz, a 1 s gap after 10 s and a missing value at 15 s
+    t = np.concatenate((np.arange(1000), np.arange(1100, 2100))) / 100
+    df = pd.DataFrame({
+        "phone_datetime": pd.to_datetime(1_700_000_000_000_000_000 + np.round(t * 1e9).astype(np.int64), unit="ns"),
+        "sensor_clock[ns]": np.round(t * 1e9).astype(np.int64),
+        "a": np.sin(t),
+        "b": np.arange(len(t), dtype=float),
+    })
+    df.loc[1400, "b"] = np.nan
+    return df
+
+
+def test_sliding_windows_are_views_split_at_gaps_and_missing_values():
+    blocks = sliding_windows(_stream(), window_s=2.0, step_s=1.0)
+
+    # Runs of 1000, 400 and 599 valid rows
+    assert [block.n_windows for block in blocks] == [9, 3, 4]
+    assert all(np.shares_memory(block.values, block.segment) for block in blocks)
+    assert blocks[0].values.shape == (9, 2, 200)
+    assert blocks[1].start_ns[0] == 11_000_000_000
+    np.testing.assert_array_equal(blocks[0].values[1, 1], np.arange(100, 300))
+
+
+def test_window_features_match_direct_computation():
+    blocks = sliding_windows(_stream(), window_s=2.0, step_s=0.5)
+    table = window_features(blocks)
+
+    windows = np.concatenate([block.values for block in blocks]).astype(np.float64)
+    assert len(table) == len(windows)
+    np.testing.assert_allclose(table["a_mean"], windows[:, 0].mean(axis=-1), atol=1e-5)
+    np.testing.assert_allclose(table["b_std"], windows[:, 1].std(axis=-1), rtol=1e-4)
+    np.testing.assert_allclose(table["a_min"], windows[:, 0].min(axis=-1))
+    np.testing.assert_allclose(table["b_max"], windows[:, 1].max(axis=-1))
+    assert table["window_start"].is_monotonic_increasing
+
+    with pytest.raises(ValueError):
+        window_features(blocks, ["median"])
+
+
+def test_feature_table_appends_incrementally(tmp_path):
+    data_dir = str(tmp_path / "data")
+    generate_dataset(data_dir, participants=1, hours_per_condition=0.05, sensors=["ppg", "acc"],
+                     conditions=["pre_heat_exposure", "intra_heat_exposure"], gaps_per_file=0)
+    table = FeatureTable(str(tmp_path / "features"))
+
+    data = load_all_participants(data_dir=data_dir)
+    computed = extract_features(data, window_s=20, step_s=10, table=table)
+    assert list(computed.columns[:3]) == KEY_COLUMNS
+    assert {"ppg_ch0_mean", "acc_x[mg]_std"} <= set(computed.columns)
+    assert set(computed["condition"]) == {"pre_heat_exposure", "intra_heat_exposure"}
+
+    stored = table.load()
+    assert len(stored) == len(computed)
+    pd.testing.assert_frame_equal(stored, computed.sort_values(KEY_COLUMNS, kind="stable").reset_index(drop=True),
+                                  check_dtype=False)
+
+    # Re-running stores nothing new, partitions and time ranges load on their own
+    assert table.append("P01", "pre_heat_exposure", computed[computed["condition"] == "pre_heat_exposure"]) == 0
+    written, = consume_stream(iter_participant_data(by_condition=True, data_dir=data_dir),
+                              FeatureWriter(table, window_s=20, step_s=10))
+    assert written == len(computed)
+    assert len(table.load()) == len(computed)
+
+    pre = table.load(conditions=["pre_heat_exposure"], columns=["ppg_ch0_mean"])
+    assert list(pre.columns) == KEY_COLUMNS + ["ppg_ch0_mean"]
+    start = pre["window_start"].iloc[3]
+    assert table.load(conditions=["pre_heat_exposure"], start=start)["window_start"].min() == start
+
+
+def test_cli_features(tmp_path, capsys):
+    data_dir = str(tmp_path / "data")
+    generate_dataset(data_dir, participants=1, hours_per_condition=0.02, sensors=["ppg", "acc"],
+                     conditions=["post_heat_exposure"])
+    feature_dir = str(tmp_path / "features")
+    args = ["features", "--data-dir", data_dir, "--raw", "--window", "10", "--step", "10", "--feature-dir", feature_dir]
+    assert cli.main(args) == 0
+    assert cli.main(args + ["--out-of-core"]) == 0
+    assert len(FeatureTable(feature_dir).load()) > 0
+    assert "stored in" in capsys.readouterr().out
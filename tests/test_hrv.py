@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cli
+from hrv import (detect_beats, _window_sums, _hrv_frame, StreamingHRV, compute_hrv, compute_hrv_table,
+                 stream_hrv_table, HRV_COLUMNS, HR_COMPARISON_COLUMNS)
+from loader import load_all_participants
+from preprocessor import filter_ppg
+from synthetic import generate_dataset
+
+
+def _pulse_stream(fs=128.0, seconds=(40, 40), gap_s=10.0, heart_rate_hz=1.25):
+    clocks, start = [], 0.0
+    for length in seconds:
+        clocks.append(start + np.arange(int(length * fs)) / fs)
+        start = clocks[-1][-1] + gap_s
+    t = np.concatenate(clocks)
+    clock = np.round(t * 1e9).astype(np.int64)
+    return pd.DataFrame({
+        "phone_datetime": pd.to_datetime(clock + 1_700_000_000_000_000_000, unit="ns"),
+        "sensor_clock[ns]": clock,
+        "ppg_ch0": 200_000 + 5000 * np.sin(2 * np.pi * heart_rate_hz * t),
+    })
+
+
+def test_detect_beats_intervals_and_gaps():
+    beats = detect_beats(filter_ppg(_pulse_stream()))
+
+    assert list(beats.columns) == ["time_ns", "phone_ns", "ibi_ms"]
+    assert 95 <= len(beats) <= 100
+    # The first beat of each segment has no interval, none spans the 10 s gap
+    assert beats["ibi_ms"].isna().sum() == 2
+    # Away from the filter's edge transients at the segment ends
+    second_segment = np.flatnonzero(beats["ibi_ms"].isna())[1]
+    interior = np.r_[5:second_segment - 5, second_segment + 5:len(beats) - 5]
+    np.testing.assert_allclose(beats["ibi_ms"].to_numpy()[interior], 800.0, atol=1.0)
+    np.testing.assert_array_equal(beats["phone_ns"] - beats["time_ns"], 1_700_000_000_000_000_000)
+
+
+def test_window_metrics_from_known_intervals():
+    ibi = np.array([np.nan] + [800.0, 900.0] * 10)
+    beats = pd.DataFrame({"time_ns": np.arange(21), "phone_ns": np.arange(21), "ibi_ms": ibi})
+    windows, sums = _window_sums(beats, window_ns=10**9)
+    table = _hrv_frame(dict(zip(windows.tolist(), sums)), 10**9)
+
+    row = table.iloc[0]
+    assert row["beats"] == 20
+    assert row["mean_ibi_ms"] == pytest.approx(850.0)
+    assert row["mean_hr_bpm"] == pytest.approx((75.0 + 60_000 / 900) / 2)
+    assert row["sdnn_ms"] == pytest.approx(np.std([800.0, 900.0] * 10, ddof=1))
+    assert row["rmssd_ms"] == pytest.approx(100.0)
+    assert row["pnn50"] == pytest.approx(100.0)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    data_dir = str(tmp_path / "data")
+    generate_dataset(data_dir, participants=1, hours_per_condition=0.2, sensors=["ppg", "hr"],
+                     conditions=["pre_heat_exposure"])
+    return data_dir
+
+
+def test_streaming_matches_batch_and_device_hr(dataset):
+    streams = load_all_participants(data_dir=dataset)["P01"]["pre_heat_exposure"]
+    batch = compute_hrv(streams["ppg"], streams["hr"], window_s=120)
+
+    assert list(batch.columns) == HRV_COLUMNS + HR_COMPARISON_COLUMNS
+    assert len(batch) == 6
+    # The synthetic device HR wanders +-3 bpm around the constant pulse rate
+    assert batch["hr_error_bpm"].abs().max() < 3.0
+
+    accumulator = StreamingHRV(window_s=120)
+    ppg = streams["ppg"]
+    for start in range(0, len(ppg), 17_000):
+        accumulator.update(ppg.iloc[start:start + 17_000])
+    streamed = accumulator.result()
+    assert streamed["beats"].tolist() == batch["beats"].tolist()
+    np.testing.assert_allclose(streamed["rmssd_ms"], batch["rmssd_ms"], rtol=1e-3)
+    np.testing.assert_allclose(streamed["mean_hr_bpm"], batch["mean_hr_bpm"], rtol=1e-6)
+
+
+def test_hrv_tables_in_memory_streamed_and_cli(dataset, tmp_path):
+    in_memory = compute_hrv_table(load_all_participants(data_dir=dataset), window_s=120)
+    streamed = stream_hrv_table(data_dir=dataset, window_s=120, chunk_rows=20_000)
+
+    assert in_memory[["participant", "condition"]].drop_duplicates().values.tolist() == [["P01", "pre_heat_exposure"]]
+    assert streamed["beats"].tolist() == in_memory["beats"].tolist()
+
+    output = str(tmp_path / "hrv.csv")
+    assert cli.main(["hrv", "--data-dir", dataset, "--raw", "--window", "120", "--output", output]) == 0
+    assert len(pd.read_csv(output)) == len(in_memory)
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from instrumentation import RunReport, stage, timed
+from loader import load_all_participants
+from synthetic import generate_dataset
+
+
+def test_stage_records_nesting_rows_and_throughput():
+    report = RunReport()
+    with stage("outer", report=report) as outer:
+        with stage("inner", rows=10, n_bytes=80, report=report):
+            pass
+        outer.add_data({"a": pd.DataFrame({"x": np.zeros(4)}), "b": [pd.DataFrame({"x": np.zeros(2)}), None]})
+
+    inner, outer_record = report.records
+    assert (inner["stage"], inner["parent"], inner["rows"], inner["bytes"]) == ("inner", "outer", 10, 80)
+    assert outer_record["parent"] is None and outer_record["rows"] == 6
+    assert outer_record["seconds"] >= inner["seconds"] >= 0
+    assert report.totals()["inner"]["calls"] == 1
+
+
+def test_stage_reports_process_peak_rss_and_its_growth(monkeypatch):
+    peaks = iter([100, 100, 100, 250])
+    monkeypatch.setattr(instrumentation, "peak_rss_bytes", lambda: next(peaks))
+    report = RunReport()
+    with stage("small", report=report):
+        pass
+    with stage("large", report=report):
+        pass
+
+    small, large = report.records
+    assert (small["process_peak_rss_bytes"], small["peak_rss_growth_bytes"]) == (100, 0)
+    assert (large["process_peak_rss_bytes"], large["peak_rss_growth_bytes"]) == (250, 150)
+    assert report.totals()["large"]["peak_rss_growth_bytes"] == 150
+
+
+def test_timed_decorator_and_report_file(tmp_path):
+    instrumentation.REPORT.reset()
+
+    @timed("make_frame", count_result=True)
+    def make_frame(n):
+        return pd.DataFrame({"x": np.arange(n)})
+
+    make_frame(5)
+    make_frame(7)
+    path = str(tmp_path / "report.json")
+    instrumentation.REPORT.write(path)
+
+    with open(path) as f:
+        report = json.load(f)
+    assert [r["rows"] for r in report["stages"]] == [5, 7]
+    assert report["totals"]["make_frame"]["rows"] == 12
+
+
+def test_profiling_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "PROFILE_DIR", str(tmp_path))
+    report = RunReport()
+    with stage("profiled", profile="cprofile", report=report):
+        sum(range(1000))
+    with stage("traced", profile="tracemalloc", report=report):
+        block = np.ones(1_000_000)
+    del block
+
+    assert os.path.exists(report.records[0]["profile_file"])
+    assert report.records[1]["traced_peak_bytes"] >= 8_000_000
+
+
+def test_loader_stages_are_recorded_and_logged(tmp_path, caplog):
+    generate_dataset(str(tmp_path), participants=1, hours_per_condition=0.005, sensors=["acc"])
+    instrumentation.REPORT.reset()
+
+    with caplog.at_level(logging.DEBUG, logger="loader"):
+        data = load_all_participants(data_dir=str(tmp_path))
+
+    stages = {r["stage"]: r for r in instrumentation.REPORT.records}
+    assert {"parse", "concat", "ingest"} <= set(stages)
+    assert stages["parse"]["parent"] == "ingest"
+    assert stages["parse"]["bytes"] > 0 and stages["parse"]["files"] == 3
+    assert stages["ingest"]["rows"] == sum(len(d["acc"]) for d in data["P01"].values())
+    assert any("File matched pattern acc" in message for message in caplog.messages)
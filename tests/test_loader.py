@@ -1,9 +1,212 @@
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
 import pytest
-from loader import load_data_for_participant
+from loader import (
+    load_data_for_participant, load_all_participants, split_by_source_file, apply_schema, memory_footprint,
+    read_sensor_file, stream_sensor_data, build_segments, segment_table, iter_participant_data, get_source_files,
+    get_segments, SEGMENTS_ATTR,
+)
+
+from synthetic import generate_dataset
 
-def test_load_data_for_participant():
+
+def test_load_data_for_participant(tmp_path):
     participant = "sample_participant"
-    data = load_data_for_participant(participant)
+    generate_dataset(str(tmp_path), [participant], hours_per_condition=0.01)
+    data = load_data_for_participant(participant, data_dir=str(tmp_path))
     
     assert isinstance(data, dict)
     assert all(key in data for key in ["pre_heat_exposure", "intra_heat_exposure", "post_heat_exposure"])
+
+
+@pytest.mark.parametrize("workers,executor", [(1, "process"), (2, "thread"), (2, "process")])
+def test_load_all_participants_parallel_is_deterministic(data_dir, workers, executor):
+    data = load_all_participants(workers=workers, executor=executor, data_dir=data_dir)
+
+    assert list(data.keys()) == ["P01", "P02"]
+    acc = data["P01"]["pre_heat_exposure"]["acc"]
+    # a_ACC.txt sorts before b_ACC.txt
+    assert acc["sensor_clock[ns]"].tolist()[:3] == [0, 1_000_000_000, 10_000_000_000]
+    assert len(acc) == 5
+
+
+def test_load_all_participants_isolates_bad_file(data_dir):
+    (Path(data_dir) / "P01" / "pre_heat_exposure" / "c_ACC.txt").write_bytes(b"")
+
+    data = load_all_participants(workers=2, executor="thread", data_dir=data_dir)
+
+    assert len(data["P01"]["pre_heat_exposure"]["acc"]) == 5
+    assert len(data["P02"]["pre_heat_exposure"]["acc"]) == 5
+
+
+def test_load_all_participants_isolates_unreadable_file(data_dir, tmp_path):
+    # Dangling symlink: listed like any other file but can't be stat'ed or opened
+    os.symlink(tmp_path / "missing.txt", Path(data_dir) / "P01" / "pre_heat_exposure" / "zz_ACC.txt")
+
+    data = load_all_participants(data_dir=data_dir)
+
+    assert len(data["P01"]["pre_heat_exposure"]["acc"]) == 5
+    assert len(data["P02"]["pre_heat_exposure"]["acc"]) == 5
+
+
+def test_load_skips_unmatched_files_and_records_sources(data_dir):
+    # Not a sensor export and not parseable as CSV, must never be read
+    (Path(data_dir) / "P01" / "pre_heat_exposure" / "notes.txt").write_bytes(b"\x00\xff;;\n\"")
+
+    data = load_data_for_participant("P01", workers=1, data_dir=data_dir)
+    acc = data["pre_heat_exposure"]["acc"]
+
+    assert acc.index.tolist() == list(range(5))
+    assert get_source_files(acc) == [
+        {"file_id": 0, "file": "a_ACC.txt", "start": 0, "stop": 2},
+        {"file_id": 1, "file": "b_ACC.txt", "start": 2, "stop": 5},
+    ]
+    assert [len(part) for part in split_by_source_file(acc)] == [2, 3]
+    assert data["pre_heat_exposure"]["ppg"].empty
+
+
+def test_source_files_and_segments_are_shared_not_copied(data_dir):
+    acc = load_all_participants(workers=1, data_dir=data_dir)["P01"]["pre_heat_exposure"]["acc"]
+
+    # pandas deep-copies attrs on every slice, the packed tables make that a no-op
+    assert acc.iloc[1:3].attrs[SEGMENTS_ATTR] is acc.attrs[SEGMENTS_ATTR]
+    assert acc["acc_x[mg]"].attrs[SEGMENTS_ATTR] is acc.attrs[SEGMENTS_ATTR]
+    assert get_source_files(pd.concat([acc, acc.copy()])) == get_source_files(acc)
+    restored = pickle.loads(pickle.dumps(acc))
+    assert get_segments(restored) == get_segments(acc)
+    assert [seg["file"] for seg in get_segments(acc)] == ["a_ACC.txt", "b_ACC.txt"]
+
+
+def test_load_applies_typed_schema_and_reports_footprint(data_dir):
+    data = load_all_participants(workers=1, data_dir=data_dir)
+    acc = data["P01"]["pre_heat_exposure"]["acc"]
+
+    assert acc["sensor_clock[ns]"].dtype == "int64"
+    assert acc["acc_x[mg]"].dtype == "float32"
+    assert pd.api.types.is_datetime64_any_dtype(acc["phone_datetime"])
+    assert acc["phone_datetime"].iloc[1] == pd.Timestamp("2024-05-01 10:00:01")
+
+    report = memory_footprint(data)
+    row = report[(report["participant"] == "P01") & (report["sensor"] == "acc")].iloc[0]
+    assert row["rows"] == 5
+    # 8 (datetime) + 8 (clock) + 3 * 4 (float32 axes) per row, plus the RangeIndex
+    assert row["bytes"] == 5 * 28 + acc.index.memory_usage()
+
+
+def test_apply_schema_falls_back_to_float_on_missing_values():
+    df = pd.DataFrame({"ppg_ch0": [1, None], "sensor_clock[ns]": [0, 1]})
+    df = apply_schema(df, "ppg")
+    assert df["ppg_ch0"].dtype == "float32"
+    assert df["sensor_clock[ns]"].dtype == "int64"
+
+
+def test_stream_sensor_data_fixed_chunks_span_files(data_dir):
+    chunks = list(stream_sensor_data("P01", "pre_heat_exposure", "acc", chunk_rows=2, data_dir=data_dir))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert chunks[1].index.tolist() == [2, 3]
+    full = load_data_for_participant("P01", workers=1, data_dir=data_dir)["pre_heat_exposure"]["acc"]
+    assert pd.concat(chunks)["sensor_clock[ns]"].tolist() == full["sensor_clock[ns]"].tolist()
+    assert chunks[0]["acc_x[mg]"].dtype == "float32"
+
+
+def test_stream_sensor_data_time_windows(data_dir):
+    chunks = list(stream_sensor_data(
+        "P01", "pre_heat_exposure", "acc", chunk_rows=2, window_ns=10_000_000_000, data_dir=data_dir
+    ))
+
+    # a_ACC.txt covers 0-1s, b_ACC.txt covers 10-12s
+    assert [chunk["sensor_clock[ns]"].tolist() for chunk in chunks] == [
+        [0, 1_000_000_000],
+        [10_000_000_000, 11_000_000_000, 12_000_000_000],
+    ]
+
+
+def test_stream_sensor_data_time_windows_without_sensor_clock(tmp_path):
+    cond = tmp_path / "P01" / "pre_heat_exposure"
+    cond.mkdir(parents=True)
+    (cond / "a_HR.txt").write_text("Phone timestamp;HR [bpm]\n" + "".join(
+        f"2024-05-01T10:00:{i:02d}.000;{60 + i}\n" for i in range(25)
+    ))
+
+    chunks = list(stream_sensor_data(
+        "P01", "pre_heat_exposure", "hr", chunk_rows=4, window_ns=10_000_000_000, data_dir=str(tmp_path)
+    ))
+
+    # Windows of phone time: 10:00:00-09, 10:00:10-19, 10:00:20-24
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert chunks[1]["phone_datetime"].iloc[0] == pd.Timestamp("2024-05-01 10:00:10")
+
+
+@pytest.mark.parametrize("engine", ["pyarrow", "numeric"])
+def test_parse_engines_match_pandas(data_dir, engine):
+    expected = load_data_for_participant("P01", workers=1, data_dir=data_dir, engine="pandas")
+    result = load_data_for_participant("P01", workers=1, data_dir=data_dir, engine=engine)
+
+    pd.testing.assert_frame_equal(result["pre_heat_exposure"]["acc"], expected["pre_heat_exposure"]["acc"])
+
+
+def test_numeric_engine_falls_back_to_pandas(tmp_path):
+    path = tmp_path / "x_PPG.txt"
+    path.write_text("Phone timestamp;sensor timestamp [ns];channel 0;channel 1;channel 2;ambient\n"
+                    "2024-05-01T10:00:00.000;0;1;2;3;4\n"
+                    "2024-05-01T10:00:00.010;10000000;;2;3;4\n")
+
+    df = read_sensor_file(str(path), engine="numeric")
+
+    assert len(df) == 2
+    assert df["ppg_ch0"].dtype == "float32"
+    assert df["ppg_ch1"].dtype == "int32"
+
+
+def test_segment_index_built_at_load(data_dir):
+    data = load_all_participants(workers=1, data_dir=data_dir)
+    segments = segment_table(data)
+    p01 = segments[segments["participant"] == "P01"]
+
+    assert p01["file"].tolist() == ["a_ACC.txt", "b_ACC.txt"]
+    assert p01["samples"].tolist() == [2, 3]
+    assert p01["start_clock_ns"].tolist() == [0, 10_000_000_000]
+    assert p01["end_phone_ns"].iloc[1] == pd.Timestamp("2024-05-01 10:00:02").value
+
+
+def test_build_segments_splits_on_gaps():
+    df = pd.DataFrame({"sensor_clock[ns]": np.array([0, 1, 2, 10, 11, 5]) * 1_000_000_000})
+
+    segments = build_segments(df, gap_ns=2_000_000_000)
+
+    assert [(seg["start_row"], seg["stop_row"]) for seg in segments] == [(0, 3), (3, 5), (5, 6)]
+    assert segments[1]["gap_before_ns"] == 8_000_000_000
+    assert segments[0]["start_phone_ns"] is None
+
+
+def test_iter_participant_data_one_piece_at_a_time(data_dir):
+    import gc
+    import weakref
+
+    loaded = load_all_participants(data_dir=data_dir)
+    pieces = iter_participant_data(sensors=["acc"], data_dir=data_dir)
+
+    first = next(pieces)
+    assert list(first) == ["P01"]
+    pd.testing.assert_frame_equal(first["P01"]["pre_heat_exposure"]["acc"], loaded["P01"]["pre_heat_exposure"]["acc"])
+    assert list(first["P01"]["pre_heat_exposure"]) == ["acc"]
+
+    # Once the consumer drops a piece nothing else keeps it alive
+    ref = weakref.ref(first["P01"]["pre_heat_exposure"]["acc"])
+    del first
+    second = next(pieces)
+    gc.collect()
+    assert ref() is None
+    assert list(second) == ["P02"]
+
+    by_condition = list(iter_participant_data(conditions=["pre_heat_exposure", "post_heat_exposure"],
+                                              by_condition=True, data_dir=data_dir))
+    assert [(list(p), list(p[list(p)[0]])) for p in by_condition] == [
+        (["P01"], ["pre_heat_exposure"]), (["P01"], ["post_heat_exposure"]),
+        (["P02"], ["pre_heat_exposure"]), (["P02"], ["post_heat_exposure"]),
+    ]
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from pipeline import Pipeline, Stage, build_pipeline
+
+
+def _counting(calls, name, func):
+    def run(*args, **kwargs):
+        calls.append(name)
+        return func(*args, **kwargs)
+    return run
+
+
+def _stages(calls, scale=2):
+    return [
+        Stage("source", _counting(calls, "source", lambda: [1, 2, 3])),
+        Stage("double", _counting(calls, "double", lambda xs, scale: [x * scale for x in xs]),
+              inputs=["source"], params={"scale": scale}),
+        Stage("total", _counting(calls, "total", sum), inputs=["source"]),
+        Stage("report", _counting(calls, "report", lambda xs, total: (xs, total)), inputs=["double", "total"]),
+    ]
+
+
+def test_pipeline_runs_then_skips_cached_stages(tmp_path):
+    calls = []
+    first = Pipeline(_stages(calls), str(tmp_path), workers=2).run(["report"])
+    assert first == {"report": ([2, 4, 6], 6)}
+    assert sorted(calls) == ["double", "report", "source", "total"]
+
+    calls.clear()
+    pipeline = Pipeline(_stages(calls), str(tmp_path), workers=2)
+    assert pipeline.run(["report"]) == first
+    assert calls == []
+    # Nothing upstream of a cached target is even read
+    assert pipeline.last_run == {"source": "skipped", "double": "skipped", "total": "skipped", "report": "load"}
+
+
+def test_pipeline_param_change_invalidates_downstream_only(tmp_path):
+    Pipeline(_stages([]), str(tmp_path)).run()
+
+    calls = []
+    result = Pipeline(_stages(calls, scale=10), str(tmp_path)).run(["report"])
+    assert result == {"report": ([10, 20, 30], 6)}
+    assert sorted(calls) == ["double", "report"]
+
+    calls.clear()
+    Pipeline(_stages(calls), str(tmp_path)).run(["total"], force=["source"])
+    assert sorted(calls) == ["source", "total"]
+
+
+def test_pipeline_rejects_unknown_inputs(tmp_path):
+    with pytest.raises(ValueError):
+        Pipeline([Stage("a", list, inputs=["missing"])], str(tmp_path))
+
+
+def test_build_pipeline_reruns_load_when_raw_files_change(tmp_path):
+    data_dir = tmp_path / "data"
+    cond = data_dir / "P01" / "pre_heat_exposure"
+    cond.mkdir(parents=True)
+    (cond / "a_ACC.txt").write_text(
+        "Phone timestamp;sensor timestamp [ns];X [mg];Y [mg];Z [mg]\n"
+        "2024-05-01T10:00:00.000;0;1;2;3\n2024-05-01T10:00:01.000;1000000000;1;2;3\n")
+
+    cache_dir = str(tmp_path / "cache")
+    pipeline = build_pipeline(data_dir=str(data_dir), cache_dir=cache_dir)
+    timing = pipeline.run(["timing"])["timing"]
+    assert timing["samples"].tolist() == [2]
+
+    pipeline = build_pipeline(data_dir=str(data_dir), cache_dir=cache_dir)
+    pipeline.run(["timing"])
+    assert pipeline.last_run["timing"] == "load"
+
+    with open(cond / "a_ACC.txt", "a") as f:
+        f.write("2024-05-01T10:00:02.000;2000000000;1;2;3\n")
+    os.utime(cond / "a_ACC.txt", ns=(1, 1))
+    pipeline = build_pipeline(data_dir=str(data_dir), cache_dir=cache_dir)
+    timing = pipeline.run(["timing"])["timing"]
+    assert pipeline.last_run["load"] == "run"
+    assert timing["samples"].tolist() == [3]
@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from loader import set_source_files
+from preprocessor import (
+    align_sensors, merge_data, resample_stream, resample_condition, compute_timing_table,
+    compute_file_level_sample_rates, compute_sample_rate_from_timestamps_median, consume_stream,
+    StreamingSampleRate, StreamingMinuteCoverage, SampleRateTable, TimingTable, compute_sample_rate_for_sensor,
+    filter_ppg, filter_all_ppg,
+)
+
+
+def test_compute_file_level_sample_rates_uses_source_ranges():
+    clock = np.concatenate([np.arange(4) * 10_000_000, 1_000_000_000 + np.arange(3) * 20_000_000])
+    ppg = pd.DataFrame({"sensor_clock[ns]": clock, "ppg_ch0": np.zeros(len(clock))})
+    set_source_files(ppg, [
+        {"file_id": 0, "file": "a_PPG.txt", "start": 0, "stop": 4},
+        {"file_id": 1, "file": "b_PPG.txt", "start": 4, "stop": 7},
+    ])
+    data = {"P01": {"pre_heat_exposure": {"ppg": ppg}, "intra_heat_exposure": {"ppg": pd.DataFrame()}}}
+
+    rates = compute_file_level_sample_rates(data)
+
+    assert rates["P01"]["pre_heat_exposure"] == pytest.approx([100.0, 50.0])
+    assert np.isnan(rates["P01"]["intra_heat_exposure"][0])
+
+
+def test_streaming_accumulators_match_batch_results():
+    rng = np.random.default_rng(0)
+    clock = np.cumsum(rng.integers(7_000_000, 8_000_000, size=1000))
+    times = pd.Timestamp("2024-05-01 10:00:30") + pd.to_timedelta(clock, unit="ns")
+    df = pd.DataFrame({"sensor_clock[ns]": clock, "phone_datetime": times, "ppg_ch0": np.ones(len(clock))})
+    df.loc[900:, "ppg_ch0"] = np.nan
+    chunks = [df.iloc[i:i + 128] for i in range(0, len(df), 128)]
+
+    rate, minutes = consume_stream(
+        chunks,
+        StreamingSampleRate(diff_resolution_ns=1),
+        StreamingMinuteCoverage(value_col="ppg_ch0"),
+    )
+
+    assert rate == pytest.approx(compute_sample_rate_from_timestamps_median(clock))
+    assert minutes == df.loc[:899, "phone_datetime"].dt.floor("min").nunique()
+
+
+def _streams():
+    start = pd.Timestamp("2024-05-01 10:00:00")
+    ppg_clock = np.arange(10) * 10_000_000
+    acc_clock = np.arange(5) * 20_000_000 + 1_000_000
+    ppg = pd.DataFrame({
+        "phone_datetime": start + pd.to_timedelta(ppg_clock, unit="ns"),
+        "sensor_clock[ns]": ppg_clock,
+        "ppg_ch0": np.arange(10),
+    })
+    acc = pd.DataFrame({
+        "phone_datetime": start + pd.to_timedelta(acc_clock, unit="ns"),
+        "sensor_clock[ns]": acc_clock,
+        "acc_x[mg]": np.arange(5) * 100.0,
+    })
+    hr = pd.DataFrame({"phone_datetime": [start], "heart_rate[bpm]": [72.0]})
+    return {"pre_heat_exposure": {"ppg": ppg, "acc": acc, "hr": hr, "gyro": pd.DataFrame()}}
+
+
+def test_align_sensors_onto_reference_with_tolerance():
+    aligned = align_sensors(_streams(), "pre_heat_exposure", tolerance_ns={"acc": 2_000_000})
+
+    assert len(aligned) == 10
+    assert aligned["sensor_clock[ns]"].tolist() == list(np.arange(10) * 10_000_000)
+    # acc samples sit 1 ms after every other ppg sample, the rest are 9 ms away
+    np.testing.assert_array_equal(aligned["acc_x[mg]"].to_numpy()[:4], [0.0, np.nan, 100.0, np.nan])
+    default = align_sensors(_streams(), "pre_heat_exposure")
+    np.testing.assert_array_equal(default["acc_x[mg]"].to_numpy()[:4], [0.0, 0.0, 100.0, 100.0])
+    # hr has no sensor clock, it is matched on phone time within 1.5 s
+    assert (aligned["heart_rate[bpm]"] == 72.0).all()
+
+
+def test_align_sensors_output_order_does_not_depend_on_stream_order():
+    streams = _streams()["pre_heat_exposure"]
+    # Jittered phone timestamps put ppg rows 3 and 4 out of phone order
+    streams["ppg"].loc[3, "phone_datetime"] += pd.Timedelta(15, unit="ms")
+    hr_last = {"pre_heat_exposure": {"ppg": streams["ppg"], "acc": streams["acc"], "hr": streams["hr"]}}
+    hr_first = {"pre_heat_exposure": {"ppg": streams["ppg"], "hr": streams["hr"], "acc": streams["acc"]}}
+
+    aligned = align_sensors(hr_last, "pre_heat_exposure")
+    assert aligned["sensor_clock[ns]"].tolist() == list(np.arange(10) * 10_000_000)
+    pd.testing.assert_frame_equal(aligned, align_sensors(hr_first, "pre_heat_exposure")[aligned.columns])
+
+
+def test_align_sensors_handles_missing_sensors():
+    data = _streams()
+    data["pre_heat_exposure"]["ppg"] = pd.DataFrame()
+
+    aligned = merge_data(data, "pre_heat_exposure")
+    assert len(aligned) == 5
+    assert "acc_x[mg]" in aligned.columns
+
+    assert merge_data({"pre_heat_exposure": {"acc": pd.DataFrame()}}, "pre_heat_exposure").empty
+    assert merge_data({}, "pre_heat_exposure").empty
+
+
+def test_resample_stream_linear_and_nearest():
+    clock = np.array([0, 10, 20, 30, 100, 110]) * 1_000_000
+    df = pd.DataFrame({"sensor_clock[ns]": clock, "a": [0.0, 1, 2, 3, 10, 11], "b": [0, 10, 20, 30, 100, 110]})
+
+    result = resample_stream(df, rate_hz=200)
+
+    assert result["channels"] == ["a", "b"]
+    assert result["values"].dtype == np.float32
+    assert result["time_ns"][:3].tolist() == [0, 5_000_000, 10_000_000]
+    np.testing.assert_allclose(result["values"][:3], [[0, 0], [0.5, 5], [1, 10]])
+    # 30 ms -> 100 ms is a gap of 7 source periods, nothing is interpolated there
+    in_gap = (result["time_ns"] > 30_000_000) & (result["time_ns"] < 100_000_000)
+    assert np.isnan(result["values"][in_gap]).all()
+    np.testing.assert_allclose(result["values"][-1], [11, 110])
+
+    nearest = resample_stream(df, rate_hz=250, method="nearest")
+    np.testing.assert_allclose(nearest["values"][:3, 0], [0, 0, 1])
+
+
+def test_resample_stream_decimate_removes_high_frequency():
+    fs = 128.0
+    clock = np.round(np.arange(4096) * 1e9 / fs).astype(np.int64)
+    t = clock / 1e9
+    slow, fast = np.sin(2 * np.pi * 0.5 * t), np.sin(2 * np.pi * 40 * t)
+    df = pd.DataFrame({"sensor_clock[ns]": clock, "x": slow + fast})
+
+    result = resample_stream(df, rate_hz=16, method="decimate")
+    expected = np.sin(2 * np.pi * 0.5 * result["time_ns"] / 1e9)
+    interior = slice(20, -20)
+    np.testing.assert_allclose(result["values"][interior, 0], expected[interior], atol=0.05)
+
+
+
+def _ppg_stream(fs=128.0, seconds=(60, 60, 0.1), gap_s=5.0):
+    """PPG with a 1.2 Hz pulse, drift, 30 Hz noise and in-band ambient light, in segments."""
+    clocks, start = [], 0.0
+    for length in seconds:
+        clocks.append(start + np.arange(int(length * fs)) / fs)
+        start = clocks[-1][-1] + gap_s
+    t = np.concatenate(clocks)
+    pulse = np.sin(2 * np.pi * 1.2 * t)
+    # A different offset per segment, filtering across the gaps would smear the steps
+    offset = np.repeat([0.0, 50_000.0, -20_000.0][:len(clocks)], [len(c) for c in clocks])
+    ambient = 500 * np.sin(2 * np.pi * 2.5 * t)
+    df = pd.DataFrame({"sensor_clock[ns]": np.round(t * 1e9).astype(np.int64)})
+    for i, gain in enumerate([1000.0, 800.0, 600.0]):
+        df[f"ppg_ch{i}"] = 250_000 + offset + 40 * t + gain * pulse + 200 * np.sin(2 * np.pi * 30 * t) + ambient
+    df["ppg_amb"] = ambient
+    return df, pulse
+
+
+def test_filter_ppg_bandpass_per_segment():
+    df, pulse = _ppg_stream()
+    filtered = filter_ppg(df)
+
+    assert list(filtered.columns) == ["sensor_clock[ns]", "ppg_ch0", "ppg_ch1", "ppg_ch2"]
+    assert filtered["ppg_ch0"].dtype == np.float32
+    fs = 128
+    for start in (0, 60 * fs):
+        interior = slice(start + 5 * fs, start + 55 * fs)
+        for i, gain in enumerate([1000.0, 800.0, 600.0]):
+            np.testing.assert_allclose(filtered[f"ppg_ch{i}"].to_numpy()[interior], gain * pulse[interior],
+                                       atol=0.03 * gain)
+    # The last segment is too short to filter
+    assert filtered["ppg_ch0"].iloc[-5:].isna().all()
+
+    # Without ambient subtraction the 2.5 Hz ambient light stays in the passband
+    raw = filter_ppg(df, ambient_col=None)
+    interior = slice(5 * fs, 55 * fs)
+    assert np.abs(raw["ppg_ch0"].to_numpy()[interior] - 1000 * pulse[interior]).max() > 300
+
+
+def test_filter_ppg_keeps_row_order_and_all_partitions():
+    df, _ = _ppg_stream(seconds=(30,))
+    shuffled = df.sample(frac=1.0, random_state=0)
+
+    filtered = filter_ppg(shuffled)
+    assert filtered.index.equals(shuffled.index)
+    np.testing.assert_allclose(filtered.sort_index()["ppg_ch1"], filter_ppg(df)["ppg_ch1"], rtol=1e-5)
+
+    data = {p: {c: {"ppg": df} for c in ("pre_heat_exposure", "post_heat_exposure")} for p in ("P01", "P02")}
+    serial = filter_all_ppg(data, workers=1)
+    threaded = filter_all_ppg(data, workers=2, executor="thread")
+    assert set(threaded) == {"P01", "P02"}
+    pd.testing.assert_frame_equal(threaded["P02"]["post_heat_exposure"], serial["P02"]["post_heat_exposure"])
+
+def test_resample_condition_shares_grid():
+    data = _streams()
+    resampled = resample_condition(data, "pre_heat_exposure", rate_hz=100, sensors=["ppg", "acc"])
+
+    assert set(resampled) == {"ppg", "acc"}
+    assert resampled["ppg"]["time_ns"][1] == resampled["acc"]["time_ns"][0]
+
+
+
+def test_resample_condition_puts_hr_on_the_sensor_clock_grid():
+    start = pd.Timestamp("2024-05-01 10:00:00")
+    clock = 5_000_000_000 + np.arange(1000) * 10_000_000  # 10 s at 100 Hz, clock epoch 5 s
+    ppg = pd.DataFrame({
+        "phone_datetime": start + pd.to_timedelta(clock - 5_000_000_000, unit="ns"),
+        "sensor_clock[ns]": clock,
+        "ppg_ch0": np.arange(1000),
+    })
+    # Two samples inside the PPG recording, one a minute after it ended
+    hr = pd.DataFrame({"phone_datetime": start + pd.to_timedelta([2, 4, 70], unit="s"),
+                       "heart_rate[bpm]": [60.0, 80.0, 100.0]})
+    resampled = resample_condition({"pre_heat_exposure": {"ppg": ppg, "hr": hr}}, "pre_heat_exposure", rate_hz=10)
+
+    assert resampled["hr"]["time_col"] == "sensor_clock[ns]"
+    assert resampled["hr"]["time_ns"].tolist() == list(range(7_000_000_000, 9_000_000_001, 100_000_000))
+    assert np.isin(resampled["hr"]["time_ns"], resampled["ppg"]["time_ns"]).all()
+    np.testing.assert_allclose(resampled["hr"]["values"][[0, 10, 20], 0], [60, 70, 80])
+
+    # Each stream on its own rate keeps the HR phone-time grid
+    assert resample_condition({"pre_heat_exposure": {"ppg": ppg, "hr": hr}}, "pre_heat_exposure")["hr"]["time_col"] == "phone_datetime"
+
+def test_compute_timing_table():
+    period = 10_000_000
+    clock = np.arange(100, dtype=np.int64) * period
+    clock = np.delete(clock, [50, 51, 52])          # 3 dropped samples
+    clock = np.insert(clock, 10, clock[10])         # 1 duplicate
+    # phone clock gains 100 ppm on the sensor clock
+    phone = pd.Timestamp("2024-05-01 10:00:00") + pd.to_timedelta(np.round(clock * (1 + 100e-6)), unit="ns")
+    ppg = pd.DataFrame({"phone_datetime": phone, "sensor_clock[ns]": clock, "ppg_ch0": 0})
+    hr = pd.DataFrame({"phone_datetime": pd.date_range("2024-05-01 10:00:00", periods=5, freq="1s"),
+                       "heart_rate[bpm]": 70.0})
+    data = {"P01": {"pre_heat_exposure": {"ppg": ppg, "hr": hr, "acc": pd.DataFrame()}}}
+
+    table = compute_timing_table(data)
+
+    assert list(table["sensor"]) == ["ppg", "hr"]
+    row = table.iloc[0]
+    assert row["samples"] == 98
+    assert row["median_rate_hz"] == pytest.approx(100.0)
+    assert row["dropped_samples"] == 3
+    assert row["duplicate_timestamps"] == 1
+    assert row["non_monotonic"] == 0
+    assert row["drift_ppm"] == pytest.approx(100.0, rel=1e-3)
+    assert table.iloc[1]["time_col"] == "phone_datetime"
+    assert table.iloc[1]["median_rate_hz"] == pytest.approx(1.0)
+    assert np.isnan(table.iloc[1]["drift_ppm"])
+
+
+def test_out_of_core_tables_match_in_core():
+    def ppg(step_ns, n):
+        return pd.DataFrame({"sensor_clock[ns]": np.arange(n) * step_ns, "ppg_ch0": np.zeros(n),
+                             "phone_datetime": pd.date_range("2024-05-01", periods=n, freq="10ms")})
+    data = {
+        "P01": {"pre_heat_exposure": {"ppg": ppg(10_000_000, 50)}, "intra_heat_exposure": {"ppg": pd.DataFrame()},
+                "post_heat_exposure": {"ppg": ppg(20_000_000, 50)}},
+        "P02": {"pre_heat_exposure": {"ppg": ppg(7_700_000, 50)}, "intra_heat_exposure": {"ppg": ppg(10_000_000, 5)},
+                "post_heat_exposure": {"ppg": pd.DataFrame()}},
+    }
+    # One participant/condition per piece
+    pieces = ({p: {c: streams}} for p, conditions in data.items() for c, streams in conditions.items())
+
+    rates, timing = consume_stream(pieces, SampleRateTable(), TimingTable())
+
+    pd.testing.assert_frame_equal(rates, compute_sample_rate_for_sensor(data).astype(float))
+    pd.testing.assert_frame_equal(timing, compute_timing_table(data))
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from loader import build_segments, get_source_files, get_segments, set_source_files, set_segments
+from query import sort_stream, phone_to_clock, query_range, query_ranges
+
+
+def _ppg(jitter=False):
+    clock = np.arange(100, dtype=np.int64) * 1_000_000_000
+    clock[50:] += 100_000_000_000  # 100 s recording gap
+    phone_ns = clock + pd.Timestamp("2024-05-01 14:00:00").value
+    if jitter:
+        phone_ns[10] = phone_ns[11] + 1  # out of order phone timestamp
+    df = pd.DataFrame({
+        "phone_datetime": pd.to_datetime(phone_ns),
+        "sensor_clock[ns]": clock,
+        "ppg_ch0": np.arange(100),
+    })
+    set_segments(df, build_segments(df))
+    return df
+
+
+def test_query_range_by_clock_and_phone():
+    df = _ppg()
+
+    by_clock = query_range(df, 5_000_000_000, 8_000_000_000, by="clock")
+    assert by_clock["ppg_ch0"].tolist() == [5, 6, 7]
+
+    by_phone = query_range(df, "2024-05-01 14:00:05", "2024-05-01 14:00:08")
+    assert by_phone["ppg_ch0"].tolist() == [5, 6, 7]
+
+    assert query_range(df, "2024-05-01 13:00", "2024-05-01 13:30").empty
+
+
+def test_query_range_by_clock_needs_a_sensor_clock():
+    hr = _ppg().drop(columns="sensor_clock[ns]")
+
+    assert query_range(hr, "2024-05-01 14:00:05", "2024-05-01 14:00:08")["ppg_ch0"].tolist() == [5, 6, 7]
+    with pytest.raises(ValueError, match="sensor_clock"):
+        query_range(hr, 5_000_000_000, 8_000_000_000, by="clock")
+
+
+def test_query_range_maps_jittered_phone_time_through_segments():
+    df = _ppg(jitter=True)
+
+    result = query_range(df, "2024-05-01 14:00:05", "2024-05-01 14:00:08")
+    assert result["ppg_ch0"].tolist() == [5, 6, 7]
+
+    # a start inside the recording gap snaps to the next segment
+    clock = phone_to_clock(df, [pd.Timestamp("2024-05-01 14:01:00").value])
+    assert clock.tolist() == [150_000_000_000]
+
+
+def test_query_ranges_batch_preserves_order():
+    df = _ppg()
+    data = {"P07": {"intra_heat_exposure": {"ppg": df, "acc": pd.DataFrame()}}}
+    ranges = [
+        ("P07", "intra_heat_exposure", "ppg", "2024-05-01 14:02:30", "2024-05-01 14:02:32"),
+        ("P07", "intra_heat_exposure", "ppg", "2024-05-01 14:00:00", "2024-05-01 14:00:02"),
+        ("P07", "intra_heat_exposure", "acc", 0, 1),
+    ]
+
+    results = query_ranges(data, ranges)
+
+    assert results[0]["ppg_ch0"].tolist() == [50, 51]
+    assert results[1]["ppg_ch0"].tolist() == [0, 1]
+    assert results[2].empty
+
+
+def test_sort_stream_is_noop_when_sorted():
+    df = _ppg()
+    assert sort_stream(df) is df
+
+    shuffled = df.iloc[::-1].reset_index(drop=True)
+    set_source_files(shuffled, [{"file_id": 0, "file": "x", "start": 0, "stop": 100}])
+    result = sort_stream(shuffled)
+    assert result["sensor_clock[ns]"].is_monotonic_increasing
+    assert get_source_files(result) == []
+    assert len(get_segments(result)) == 2
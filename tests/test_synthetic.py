@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+
+from benchmark import run_benchmarks
+from loader import load_all_participants, get_source_files, get_segments
+from preprocessor import compute_sample_rate_for_sensor
+from synthetic import generate_dataset
+
+
+def _read_all(root):
+    contents = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            with open(os.path.join(directory, name)) as f:
+                contents[os.path.relpath(os.path.join(directory, name), root)] = f.read()
+    return contents
+
+
+def test_generate_dataset_is_deterministic_and_loadable(tmp_path):
+    written = generate_dataset(str(tmp_path / "a"), participants=2, hours_per_condition=0.02,
+                               files_per_condition=2, gaps_per_file=1, gap_seconds=5, seed=3)
+    generate_dataset(str(tmp_path / "b"), participants=2, hours_per_condition=0.02,
+                     files_per_condition=2, gaps_per_file=1, gap_seconds=5, seed=3)
+    assert _read_all(tmp_path / "a") == _read_all(tmp_path / "b")
+
+    data = load_all_participants(data_dir=str(tmp_path / "a"))
+    assert list(data) == ["P01", "P02"]
+    ppg = data["P01"]["pre_heat_exposure"]["ppg"]
+    assert len(ppg) == written["P01"]["pre_heat_exposure"]["ppg"]
+    assert len(get_source_files(ppg)) == 2
+    assert ppg["ppg_ch0"].dtype == np.int32
+    # 5 s gaps are longer than SEGMENT_GAP_NS (2 s), so each one starts a new segment
+    assert len(get_segments(ppg)) >= 3
+    assert data["P02"]["post_heat_exposure"]["hr"]["heart_rate[bpm]"].between(40, 140).all()
+
+    rates = compute_sample_rate_for_sensor(data)
+    assert np.allclose(rates.to_numpy(dtype=float), 135.0, rtol=1e-3)
+
+
+def test_run_benchmarks_writes_report(tmp_path):
+    output = str(tmp_path / "bench.json")
+    report = run_benchmarks(output, scales=[1, 2], work_dir=str(tmp_path / "work"), hours_per_condition=0.005,
+                            stages=["load_all_participants", "compute_sample_rate_for_sensor",
+                                    "plot_individual_participant_heatmap_raster"])
+
+    with open(output) as f:
+        assert json.load(f) == report
+    assert [(r["scale"], r["participants"], r["stage"]) for r in report["results"]] == [
+        (1, 1, "load_all_participants"), (1, 1, "compute_sample_rate_for_sensor"),
+        (1, 1, "plot_individual_participant_heatmap_raster"),
+        (2, 2, "load_all_participants"), (2, 2, "compute_sample_rate_for_sensor"),
+        (2, 2, "plot_individual_participant_heatmap_raster"),
+    ]
+    assert all(r["seconds"] >= 0 and r["rows"] > 0 for r in report["results"])
+    assert report["settings"]["scales"] == [1, 2]
+    assert [(d["scale"], d["participants"]) for d in report["datasets"]] == [(1, 1), (2, 2)]
+    assert report["datasets"][1]["rows"] > report["datasets"][0]["rows"]
@@ -1,3 +1,5 @@
+import logging
+
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import seaborn as sns
@@ -5,16 +7,36 @@ import pandas as pd
 import numpy as np
 
 from preprocessor import compute_sample_rate_for_sensor 
+from coverage import compute_coverage, union_days
+
+logger = logging.getLogger(__name__)
+
+# Colormaps of the participant heatmaps, presence is drawn in the darkest colour
+HEATMAP_CATEGORY_COLORS = {
+    "pre_heat_exposure": "Blues",
+    "intra_heat_exposure": "Oranges",
+    "post_heat_exposure": "Greens"
+}
 
 
+def _as_datetime(series: pd.Series) -> pd.Series:
+    """Parse a timestamp column, returning it untouched (no copy) if already datetime64."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, errors="coerce")
 
-def visualise_ppg_ch0_minutes_stacked(all_data: dict):
+
+
+def visualise_ppg_ch0_minutes_stacked(all_data: dict, coverage: dict = None):
     """
     For each participant and each exposure category (pre/intra/post), accumulate
     all the *unique minutes* in which ppg_ch0 data is present. Then produce a stacked
     bar chart, so you can easily compare how many minutes are available per participant
     and how much of that belongs to each category.
 
+    Minutes are counted from the coverage bitmaps (coverage.compute_coverage), computed
+    here for ppg if not passed in.
+
     We specifically color the bars:
         pre_heat_exposure: 'darkblue'
         intra_heat_exposure: 'darkred'
@@ -26,6 +48,9 @@ def visualise_ppg_ch0_minutes_stacked(all_data: dict):
     # Extract participant IDs (sorted for consistent order)
     participants = sorted(all_data.keys())
 
+    if coverage is None:
+        coverage = compute_coverage(all_data, sensors=["ppg"])
+
     # Define colors for each category
     category_colors = {
         "pre_heat_exposure": "darkblue",
@@ -38,37 +63,9 @@ def visualise_ppg_ch0_minutes_stacked(all_data: dict):
 
     for participant in participants:
         for cat in categories:
-            # Safely get the 'ppg' DataFrame
-            ppg_df = all_data[participant][cat].get("ppg", pd.DataFrame())
-
-            # If there's no ppg data, or it's empty, store 0 minutes
-            if ppg_df.empty:
-                cat_minutes_map[cat].append(0)
-                continue
-
-            # Focus specifically on ppg_ch0. Drop rows where ppg_ch0 is NaN
-            if "ppg_ch0" not in ppg_df.columns:
-                cat_minutes_map[cat].append(0)
-                continue
-
-            ppg_df = ppg_df.dropna(subset=["ppg_ch0"])
-            if ppg_df.empty:
-                cat_minutes_map[cat].append(0)
-                continue
-
-            # Convert phone_datetime to a proper datetime, if not already
-            ppg_df["phone_datetime"] = pd.to_datetime(ppg_df["phone_datetime"], errors="coerce")
-            ppg_df = ppg_df.dropna(subset=["phone_datetime"])  # remove invalid timestamps
-            if ppg_df.empty:
-                cat_minutes_map[cat].append(0)
-                continue
-
-            # Floor timestamps to the nearest minute
-            ppg_df["minute"] = ppg_df["phone_datetime"].dt.floor("T")
-
-            # Count how many unique minute values remain
-            unique_minutes = ppg_df["minute"].nunique()
-            cat_minutes_map[cat].append(unique_minutes)
+            # Minutes where ppg_ch0 is present, 0 if there's no ppg data
+            ppg_cov = coverage.get(participant, {}).get(cat, {}).get("ppg")
+            cat_minutes_map[cat].append(ppg_cov.total_minutes() if ppg_cov is not None else 0)
 
     # Build a DataFrame where each row is a participant, each column is a category
     df_minutes = pd.DataFrame(cat_minutes_map, index=participants)
@@ -154,14 +151,14 @@ def visualise_ppg_ch0_minutes_stacked_old(all_data: dict):
                 continue
 
             # Convert phone_datetime to a proper datetime, if not already
-            ppg_df["phone_datetime"] = pd.to_datetime(ppg_df["phone_datetime"], errors="coerce")
+            ppg_df["phone_datetime"] = _as_datetime(ppg_df["phone_datetime"])
             ppg_df = ppg_df.dropna(subset=["phone_datetime"])  # remove invalid timestamps
             if ppg_df.empty:
                 cat_minutes_map[cat].append(0)
                 continue
 
             # Floor timestamps to the nearest minute
-            ppg_df["minute"] = ppg_df["phone_datetime"].dt.floor("T")
+            ppg_df["minute"] = ppg_df["phone_datetime"].dt.floor("min")
             
             # Count how many unique minute values remain
             unique_minutes = ppg_df["minute"].nunique()
@@ -251,28 +248,25 @@ def visualise_data_availability(data: dict):
     plt.show()
 
 
-def plot_data_coverage_per_participant(all_data: dict):
+def plot_data_coverage_per_participant(all_data: dict, coverage: dict = None):
     """
     Plots the number of days each participant has data for,
     and within each day, the number of minutes of recorded data.
+    Minutes come from the accelerometer coverage bitmaps, computed here if not passed in.
     """
+    if coverage is None:
+        coverage = compute_coverage(all_data, sensors=["acc"])
+
     participant_days = []
 
-    for participant, categories in all_data.items():
-        for category, data_dict in categories.items():
-            acc_data = data_dict["acc"]
-            
-            if acc_data.empty:
+    for participant, categories in coverage.items():
+        for category, sensor_cov in categories.items():
+            acc_cov = sensor_cov.get("acc")
+            if acc_cov is None:
                 continue  # Skip if no data
 
-            # Convert timestamps to datetime
-            acc_data["phone_datetime"] = pd.to_datetime(acc_data["phone_datetime"])
-            acc_data["date"] = acc_data["phone_datetime"].dt.date  # Extract date only
-            acc_data["time"] = acc_data["phone_datetime"].dt.floor("T")  # Round to minute
-
             # Count minutes per day
-            daily_counts = acc_data.groupby("date")["time"].nunique()
-            for day, minutes in daily_counts.items():
+            for day, minutes in acc_cov.minutes_per_day().items():
                 participant_days.append({"participant": participant, "day": day, "minutes": minutes})
 
     # Convert to DataFrame
@@ -289,7 +283,7 @@ def plot_data_coverage_per_participant(all_data: dict):
     plt.show()
 
 
-def plot_individual_participant_heatmap(all_data: dict):
+def plot_individual_participant_heatmap(all_data: dict, coverage: dict = None):
     """
     Generates a heatmap per participant showing time-of-day coverage across days.
     - Pre (Blue), Intra (Orange), Post (Green).
@@ -297,84 +291,37 @@ def plot_individual_participant_heatmap(all_data: dict):
     - Only plots existing categories for each participant.
     - Layers each condition with a mask, alpha=1.0, vmin=0, vmax=1.
     - Title at the top of the Axes, legend horizontally below the x-axis labels.
+    Presence comes from the accelerometer coverage bitmaps, computed here if not passed in.
     """
     
     # Colors for each condition
-    category_colors = {
-        "pre_heat_exposure": "Blues",
-        "intra_heat_exposure": "Oranges",
-        "post_heat_exposure": "Greens"
-    }
-    
-    for participant, categories in all_data.items():
-        # Collect presence data for each category
-        presence_data_list = []
-        category_labels = []
-        
-        for category, data_dict in categories.items():
-            acc_data = data_dict["acc"]
-            if acc_data.empty:
-                continue  # No accelerometer data for this category
-
-            # Convert timestamps
-            acc_data["phone_datetime"] = pd.to_datetime(acc_data["phone_datetime"], errors="coerce")
-            acc_data.dropna(subset=["phone_datetime"], inplace=True)
-            acc_data["date"] = acc_data["phone_datetime"].dt.date
-            
-            # Bin into 10-minute chunks
-            acc_data["time_bin"] = acc_data["phone_datetime"].dt.floor("10min").dt.strftime("%H:%M")
+    category_colors = HEATMAP_CATEGORY_COLORS
 
-            # Mark presence (binary)
-            presence = acc_data.groupby(["date", "time_bin"]).size().reset_index(name="count")
-            presence["count"] = 1  # 1 = presence
-            presence["category"] = category
+    if coverage is None:
+        coverage = compute_coverage(all_data, sensors=["acc"])
 
-            presence_data_list.append(presence)
-            category_labels.append(category)
+    bin_minutes = 10
+    full_time_range = pd.date_range("00:00", "23:59", freq=f"{bin_minutes}min").strftime("%H:%M")
+    
+    for participant, categories in coverage.items():
+        all_dates, presence = _heatmap_presence(categories, bin_minutes)
+        category_labels = list(presence)
 
         # Skip if participant has no data in any category
-        if not presence_data_list:
-            print(f"No data available for {participant}")
-            continue
-
-        # Determine all unique dates
-        all_dates = set()
-        for df_presence in presence_data_list:
-            all_dates.update(df_presence["date"].unique())
-        all_dates = sorted(all_dates)
-
-        if not all_dates:
-            print(f"No valid dates for {participant}")
+        if not presence:
+            logger.info("No data available for %s", participant)
             continue
 
-        full_time_range = pd.date_range("00:00", "23:59", freq="10min").strftime("%H:%M")
-        full_grid = pd.DataFrame(
-            [(d, tbin) for d in all_dates for tbin in full_time_range],
-            columns=["date", "time_bin"]
-        )
-
-        for cat in category_labels:
-            full_grid[cat] = 0
-
-        # Merge presence data into full_grid
-        for df_presence in presence_data_list:
-            cat = df_presence["category"].iloc[0]
-            merged = pd.merge(
-                full_grid[["date", "time_bin", cat]],
-                df_presence[["date", "time_bin", "count"]],
-                on=["date", "time_bin"],
-                how="left"
-            ).fillna({"count": 0})
-            
-            merged[cat] = merged[cat] + merged["count"]
-            merged.drop(columns=["count"], inplace=True)
-            full_grid[cat] = merged[cat]
+        presence = {
+            cat: pd.DataFrame(binned.astype(int), index=all_dates, columns=full_time_range)
+            for cat, binned in presence.items()
+        }
 
         fig, ax = plt.subplots(figsize=(14, 6))
 
         # Plot each category with a mask
         for cat in category_labels:
-            cat_data = full_grid.pivot(index="date", columns="time_bin", values=cat)
+            cat_data = presence[cat]
             if cat_data is None or cat_data.empty:
                 continue
 
@@ -403,23 +350,115 @@ def plot_individual_participant_heatmap(all_data: dict):
         ax.set_xlabel("Time of Day (10-minute bins)")
         ax.set_ylabel("Date")
 
-        # Build a horizontal legend for each category
-        legend_patches = []
-        for cat in category_labels:
-            darkest_color = sns.color_palette(category_colors[cat], as_cmap=True)(1.0)
-            legend_patches.append(
-                mpatches.Patch(color=darkest_color, label=cat)
-            )
-
-        ax.legend(
-            handles=legend_patches,
-            title="Condition",
-            loc="upper center",
-            bbox_to_anchor=(0.5, -0.2),  # Move below the Axes (negative y-offset)
-            ncol=len(legend_patches),
-            frameon=False
-        )
+        _heatmap_legend(ax, category_labels, category_colors)
 
         plt.subplots_adjust(bottom=0.3)  # Increase if legend is still clipped
 
         plt.show()
+
+
+def _heatmap_presence(categories: dict, bin_minutes: int, sensor: str = "acc"):
+    """
+    Binned presence of each category of one participant on a shared day axis.
+
+    Args:
+        categories (dict): coverage[participant], condition -> sensor -> MinuteCoverage
+        bin_minutes (int): Width of a time-of-day bin
+
+    Returns:
+        (dates, {category: bool array (n_days, 1440 // bin_minutes)}) for categories with data
+    """
+    category_covs = {
+        category: sensor_cov[sensor] for category, sensor_cov in categories.items()
+        if sensor_cov.get(sensor) is not None and len(sensor_cov[sensor].days)
+    }
+    all_days = union_days(category_covs.values())
+    presence = {cat: cov.binned(bin_minutes, days=all_days) for cat, cov in category_covs.items()}
+    return pd.to_datetime(all_days).date, presence
+
+
+def _heatmap_legend(ax, category_labels: list, category_colors: dict):
+    """Horizontal legend of the darkest colour of each category, below the x-axis labels."""
+    legend_patches = []
+    for cat in category_labels:
+        darkest_color = sns.color_palette(category_colors[cat], as_cmap=True)(1.0)
+        legend_patches.append(
+            mpatches.Patch(color=darkest_color, label=cat)
+        )
+
+    ax.legend(
+        handles=legend_patches,
+        title="Condition",
+        loc="upper center",
+        bbox_to_anchor=(0.5, -0.2),  # Move below the Axes (negative y-offset)
+        ncol=len(legend_patches),
+        frameon=False
+    )
+
+
+def plot_individual_participant_heatmap_raster(all_data: dict,
+                                               coverage: dict = None,
+                                               participants: list = None,
+                                               show: bool = True) -> dict:
+    """
+    Raster version of plot_individual_participant_heatmap: the same colours, ticks and
+    legend, but all conditions are composed into one RGBA image drawn with a single
+    imshow instead of one bordered patch per cell and condition (no white cell borders).
+    Later conditions are drawn over earlier ones, as in the layered seaborn version.
+
+    Args:
+        all_data (dict): Nested all_data[participant][condition][sensor] frames
+        coverage (dict): Precomputed coverage.compute_coverage result, computed for acc if None
+        participants (list): Participants to render, default all
+        show (bool): Call plt.show() for each figure. With show=False the figures are
+                     returned open and the caller is responsible for closing them.
+
+    Returns:
+        dict( participant{ matplotlib Figure})
+    """
+    if coverage is None:
+        coverage = compute_coverage(all_data, sensors=["acc"])
+
+    bin_minutes = 10
+    n_bins = 24 * 60 // bin_minutes
+    white = np.array([1.0, 1.0, 1.0, 1.0])
+
+    figures = {}
+    for participant, categories in coverage.items():
+        if participants is not None and participant not in participants:
+            continue
+
+        all_dates, presence = _heatmap_presence(categories, bin_minutes)
+        if not presence:
+            logger.info("No data available for %s", participant)
+            continue
+
+        # Compose every condition into one image, last drawn wins as with layered masks
+        image = np.tile(white, (len(all_dates), n_bins, 1))
+        for cat, binned in presence.items():
+            image[binned] = sns.color_palette(HEATMAP_CATEGORY_COLORS[cat], as_cmap=True)(1.0)
+
+        fig, ax = plt.subplots(figsize=(14, 6))
+        ax.imshow(image, aspect="auto", interpolation="nearest", extent=(0, n_bins, len(all_dates), 0))
+
+        ax.set_title(f"Data Availability Heatmap for {participant}", fontsize=14)
+
+        tick_positions = np.arange(0, n_bins, 60 // bin_minutes)  # 1 hour
+        tick_labels = pd.date_range("00:00", "23:59", freq="60min").strftime("%H:%M")
+        ax.set_xticks(tick_positions)
+        ax.set_xticklabels(tick_labels, rotation=90)
+        ax.set_yticks(np.arange(len(all_dates)) + 0.5)
+        ax.set_yticklabels([str(date) for date in all_dates])
+
+        ax.set_xlabel("Time of Day (10-minute bins)")
+        ax.set_ylabel("Date")
+
+        _heatmap_legend(ax, list(presence), HEATMAP_CATEGORY_COLORS)
+        fig.subplots_adjust(bottom=0.3)  # Increase if legend is still clipped
+
+        figures[participant] = fig
+        if show:
+            plt.show()
+
+    return figures
+